@@ -1,11 +1,43 @@
 #!/usr/bin/env python3
 """Streamlit app quản lý điểm ĐHNN - không dùng pandas."""
 import streamlit as st
+import pyarrow as pa
 from pathlib import Path
-from openpyxl import load_workbook
-import csv
-from collections import Counter
+import gc
+import hmac
 import json
+import os
+from columnar_file import SUFFIX as COLUMNAR_SUFFIX, columnar_path_for, load_columnar
+from csv_export import export_csv_bytes
+from data_store import MaskRows, load_table, mask_and, mask_positions
+from score_stats import THRESHOLDS
+from search_index import FilterPlan, SearchIndex
+from snapshot_store import SnapshotStore
+
+# Số giây giữa hai lần kiểm tra file dữ liệu để nạp bản mới ở nền
+RELOAD_POLL_SECONDS = 5
+# Biến môi trường chứa mã quản trị; không đặt thì không ai chạy được bước xử lý lại
+ADMIN_TOKEN_ENV = "DHNN_ADMIN_TOKEN"
+# Các cỡ trang cho kết quả tìm kiếm
+PAGE_SIZES = (10, 20, 50, 100)
+DEFAULT_PAGE_SIZE = 20
+
+# Trạng thái theo điểm TBTL: khoảng điểm giữ lại (xem NumberIndex.mask)
+SCORE_STATUS_FILTERS = {
+    'Đạt (≥ 2.0)': dict(lo=2.0),
+    'Không đạt (< 2.0)': dict(hi=2.0, hi_inclusive=False),
+    'Xuất sắc (≥ 3.6)': dict(lo=3.6),
+    'Giỏi (3.2-3.59)': dict(lo=3.2, hi=3.6, hi_inclusive=False),
+    'Khá (2.5-3.19)': dict(lo=2.5, hi=3.2, hi_inclusive=False),
+    'Trung bình (2.0-2.49)': dict(lo=2.0, hi=2.5, hi_inclusive=False),
+}
+
+# Lọc theo số TC học/thi lại
+TC_LAI_FILTERS = {
+    'Không có TC lại (= 0)': dict(lo=0, hi=0),
+    'Có TC lại (> 0)': dict(lo=0, lo_inclusive=False),
+    'TC lại nhiều (≥ 10)': dict(lo=10),
+}
 
 # Cấu hình trang
 st.set_page_config(
@@ -19,99 +51,130 @@ class DataProcessor:
         self.base_path = Path(base_path)
         self.processing_path = self.base_path / "processing"
         self.processing_path.mkdir(exist_ok=True)
+        self.excel_path = self.processing_path / "output_direct.xlsx"
+        self.columnar_path = columnar_path_for(self.excel_path)
+    
+    def data_path(self):
+        """File sẽ đọc: output_direct.cols nếu có và không cũ hơn file Excel, ngược lại file Excel."""
+        try:
+            columnar_mtime = self.columnar_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return self.excel_path
+        try:
+            if self.excel_path.stat().st_mtime_ns > columnar_mtime:
+                # File Excel được sửa/ghi lại sau khi tạo .cols
+                return self.excel_path
+        except FileNotFoundError:
+            pass
+        return self.columnar_path
+    
+    def data_signature(self):
+        """Khóa cache của dữ liệu: (đường dẫn, mtime, kích thước) của file sẽ đọc."""
+        path = self.data_path()
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        return str(path.resolve()), stat.st_mtime_ns, stat.st_size
     
     def load_data_as_dict(self):
-        """Đọc dữ liệu từ Excel thành dict."""
-        excel_path = self.processing_path / "output_direct.xlsx"
-        
-        if not excel_path.exists():
-            return None, "Không tìm thấy file output_direct.xlsx"
-        
+        """Dữ liệu và chỉ mục tìm kiếm của snapshot hiện tại.
+
+        Khi file dữ liệu đổi, bản mới được dựng ở nền; lần chạy này vẫn dùng bản cũ.
+        """
+        snapshot = get_snapshot_store(str(self.base_path)).get()
+        return snapshot.data, snapshot.index, snapshot.error
+    
+    @staticmethod
+    def build_snapshot(signature):
+        """Đọc file theo khóa `signature` và dựng chỉ mục tìm kiếm: (data, index, error)."""
+        if signature is None:
+            return None, None, "Không tìm thấy file output_direct.xlsx"
+        data, error = DataProcessor.read_data(Path(signature[0]))
+        index = SearchIndex(data) if data else None
+        # Chỉ mục giữ hàng triệu object suốt đời snapshot: đưa chúng ra khỏi các thế hệ
+        # của GC để mỗi lần thu gom không duyệt lại (vài chục ms ở 1 triệu dòng)
+        gc.freeze()
+        return data, index, error
+    
+    @staticmethod
+    def read_data(path):
+        """Đọc file dữ liệu (.cols hoặc Excel) thành ColumnarTable."""
         try:
-            st.info("🔧 Đang đọc dữ liệu bằng openpyxl...")
-            
-            # Tạo CSV tạm
-            csv_path = self.processing_path / "temp_no_pandas.csv"
-            
-            wb = load_workbook(str(excel_path), read_only=True, data_only=True)
-            ws = wb.active
-            
-            # Ghi CSV
-            with open(str(csv_path), 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                for row in ws.iter_rows(values_only=True):
-                    clean_row = [str(cell) if cell is not None else "" for cell in row]
-                    writer.writerow(clean_row)
-            
-            wb.close()
-            
-            # Đọc CSV thành dict
-            data = []
-            with open(str(csv_path), 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    # Lọc dòng có mã SV hợp lệ
-                    if len(row.get('Mã SV', '')) > 5:
-                        data.append(dict(row))
-            
-            # Xóa file tạm
-            csv_path.unlink()
-            
-            st.success(f"✅ Đã đọc {len(data):,} bản ghi!")
-            return data, None
-            
+            if path.suffix == COLUMNAR_SUFFIX:
+                return load_columnar(path), None
+            return load_table(path), None
         except Exception as e:
             return None, f"Lỗi: {str(e)}"
     
-    def analyze_data(self, data):
-        """Phân tích dữ liệu."""
+    def analyze_data(self, data, index):
+        """Thống kê tổng quan, đọc từ cube tính sẵn khi dựng chỉ mục (không duyệt lại dữ liệu)."""
         if not data:
             return {}
         
+        cube = index.cube
+        total = cube.total()
         stats = {
-            'total_records': len(data),
-            'by_semester': Counter(),
-            'by_khoa': Counter(),
-            'by_subject': Counter(),
-            'scores': []
+            'total_records': total.rows,
+            'by_semester': cube.counts('Học kỳ'),
+            'by_khoa': cube.counts('Khóa'),
+            'by_subject': cube.counts('Môn học'),
+            'avg_score': total.mean,
+            'min_score': total.min if total.count else 0,
+            'max_score': total.max if total.count else 0,
+            'pass_rate': total.pass_rate,
+            'score_histogram': total.histogram_bins(),
+            'at_least': dict(zip(THRESHOLDS, total.thresholds)),
         }
         
-        for record in data:
-            # Thống kê theo học kỳ
-            if 'Học kỳ' in record:
-                stats['by_semester'][record['Học kỳ']] += 1
-            
-            # Thống kê theo khóa
-            if 'Khóa' in record:
-                stats['by_khoa'][record['Khóa']] += 1
-            
-            # Thống kê theo môn
-            if 'Môn học' in record:
-                stats['by_subject'][record['Môn học']] += 1
-            
-            # Thu thập điểm
-            if 'Điểm TBTL' in record:
-                try:
-                    score = float(record['Điểm TBTL'])
-                    if 0 <= score <= 4:
-                        stats['scores'].append(score)
-                except:
-                    pass
-        
-        # Tính toán điểm
-        if stats['scores']:
-            stats['avg_score'] = sum(stats['scores']) / len(stats['scores'])
-            stats['min_score'] = min(stats['scores'])
-            stats['max_score'] = max(stats['scores'])
-            stats['pass_rate'] = len([s for s in stats['scores'] if s >= 2.0]) / len(stats['scores']) * 100
-        else:
-            stats['avg_score'] = 0
-            stats['min_score'] = 0
-            stats['max_score'] = 0
-            stats['pass_rate'] = 0
-        
         return stats
 
+@st.cache_resource(show_spinner=False)
+def get_snapshot_store(base_path):
+    """Một SnapshotStore cho cả process, dùng chung giữa các session và rerun.
+    
+    Thread nền theo dõi file dữ liệu: khi direct_processor.py ghi lại file, bản
+    mới được đọc và dựng chỉ mục ở nền rồi thay thế bản cũ một lần.
+    """
+    processor = DataProcessor(base_path)
+    return SnapshotStore(processor.data_signature, DataProcessor.build_snapshot,
+                         poll_interval=RELOAD_POLL_SECONDS)
+
+def is_admin():
+    """Session đã nhập đúng mã quản trị (biến môi trường ADMIN_TOKEN_ENV) chưa."""
+    token = os.environ.get(ADMIN_TOKEN_ENV)
+    if not token:
+        return False
+    entered = st.text_input("🔑 Mã quản trị:", type="password", key="admin_token")
+    return bool(entered) and hmac.compare_digest(entered.encode(), token.encode())
+
+def reprocess_sidebar(processor, store):
+    """Nút chạy lại direct_processor từ app (chỉ cho quản trị).
+
+    Mỗi process chỉ chạy một lần xử lý tại một thời điểm: session khác bấm trong
+    lúc đó nhận thông báo thay vì chạy chồng. direct_processor chỉ được import ở
+    đây để app không nạp xlrd khi khởi động.
+    """
+    if not st.button("⚙️ Xử lý lại từ file gốc",
+                     help="Chạy direct_processor: đọc các file .xls mới/đã đổi trong raw/ rồi ghi lại output"):
+        return
+    from direct_processor import PipelineBusyError, run_pipeline
+    
+    try:
+        with st.spinner("Đang xử lý file gốc..."):
+            summary = run_pipeline(processor.base_path, log=None, wait=False)
+            store.reload()
+    except PipelineBusyError:
+        st.info("⏳ Đang có một lần xử lý khác chạy, thử lại sau khi xong.")
+        return
+    except Exception as e:
+        st.error(f"❌ Xử lý lỗi: {e}")
+        return
+    st.success(f"Đã ghi {summary['rows']:,} dòng từ {summary['success']} file "
+               f"(đọc lại {summary['reparsed']}, lỗi {summary['failed']})")
+    for fingerprint, (missing, keys) in summary['unmapped_layouts'].items():
+        st.warning(f"Layout {fingerprint} thiếu cột {', '.join(missing)} ({len(keys)} file)")
+
 def create_overview_metrics(stats):
     """Tạo metrics tổng quan."""
     col1, col2, col3, col4 = st.columns(4)
@@ -128,6 +191,151 @@ def create_overview_metrics(stats):
     with col4:
         st.metric("📊 Số môn học", len(stats['by_subject']))
 
+def create_selection_metrics(selection, from_cube):
+    """Số bản ghi, điểm TB, tỷ lệ đạt và phân bố điểm của các dòng đang lọc."""
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        st.metric("👥 Số bản ghi", f"{selection.rows:,}")
+    
+    with col2:
+        st.metric("📈 Điểm TB", f"{selection.mean:.2f}" if selection.count else "N/A")
+    
+    with col3:
+        st.metric("✅ Tỷ lệ đạt (%)", f"{selection.pass_rate:.1f}%" if selection.count else "N/A")
+    
+    with col4:
+        st.metric("📊 Điểm thấp/cao nhất",
+                  f"{selection.min:.2f} / {selection.max:.2f}" if selection.count else "N/A")
+    
+    if selection.count:
+        st.bar_chart(
+            {
+                'Khoảng điểm': [f"{lo:.1f}-{hi:.1f}" for lo, hi, _ in selection.histogram_bins()],
+                'Số sinh viên': selection.histogram,
+            },
+            x='Khoảng điểm', y='Số sinh viên', height=200,
+        )
+    st.caption("Tính từ thống kê nhóm tính sẵn" if from_cube
+               else f"Tính trên {selection.rows:,} dòng khớp bộ lọc")
+
+def get_search_cursor(key, search):
+    """Kết quả tìm kiếm của session, giữ trong session_state theo khóa truy vấn.
+
+    `search()` trả về (dãy dòng theo thứ tự hiển thị, hàm tính thống kê, thống kê
+    lấy từ cube?) và chỉ được gọi khi khóa đổi; đổi trang hay cỡ trang dùng lại
+    dãy đã có (với tìm theo tên, dãy chỉ xếp hạng thêm khi lật tới trang chưa
+    xếp). Thống kê chỉ tính khi được hiển thị, rồi giữ lại trong cursor.
+    Truy vấn mới thì quay về trang 1.
+    """
+    cursor = st.session_state.get('search_cursor')
+    if cursor is None or cursor['key'] != key:
+        results, selection, from_cube = search()
+        cursor = {'key': key, 'results': results, 'compute_selection': selection, 'selection': None,
+                  'from_cube': from_cube}
+        st.session_state['search_cursor'] = cursor
+        st.session_state['search_page'] = 1
+    return cursor
+
+@st.fragment
+def render_search_results(data, index, cursor, search_name):
+    """Một trang kết quả tìm kiếm.
+
+    Chạy như fragment: đổi trang hay cỡ trang chỉ chạy lại hàm này, và chỉ các
+    dòng của trang đang xem được đọc ra và gửi xuống trình duyệt, nên thời gian
+    vẽ không phụ thuộc số kết quả.
+    """
+    search_results = cursor['results']
+    if not search_results:
+        st.warning("🔍 Không tìm thấy kết quả nào phù hợp với điều kiện tìm kiếm.")
+        st.info("💡 Thử điều chỉnh từ khóa tìm kiếm hoặc bộ lọc.")
+        return
+    
+    col_result1, col_result2, col_result3 = st.columns([3, 1, 1])
+    with col_result1:
+        st.success(f"🎯 Tìm thấy **{len(search_results):,}** kết quả phù hợp")
+    with col_result2:
+        page_size = st.selectbox("Số kết quả/trang:", PAGE_SIZES,
+                                 index=PAGE_SIZES.index(DEFAULT_PAGE_SIZE), key="search_page_size")
+    
+    page_count = -(-len(search_results) // page_size)
+    # Đổi sang cỡ trang lớn hơn có thể làm trang hiện tại vượt quá số trang
+    if st.session_state.get('search_page', 1) > page_count:
+        st.session_state['search_page'] = page_count
+    with col_result3:
+        page = st.number_input("Trang:", min_value=1, max_value=page_count, step=1, key="search_page")
+    
+    # Thống kê từ cube thì có ngay; trên mọi dòng khớp thì chỉ tính khi bật
+    if cursor['from_cube'] or st.toggle("📊 Thống kê các kết quả", key="search_stats",
+                                        help="Điểm TB, tỷ lệ đạt và phân bố điểm của mọi kết quả"):
+        if cursor['selection'] is None:
+            cursor['selection'] = cursor['compute_selection']()
+        create_selection_metrics(cursor['selection'], cursor['from_cube'])
+    
+    start = (page - 1) * page_size
+    page_rows = search_results[start:start + page_size]
+    
+    # Hiển thị chi tiết từng kết quả của trang
+    for i, record in enumerate(data.rows(page_rows), start + 1):
+        match_indicator = ""
+        if search_name.strip():
+            match_type = index.names.label(record.index, search_name)
+            if match_type:
+                match_indicator = f" {match_type}"
+        
+        with st.expander(f"#{i}: {record.get('Họ và tên', 'N/A')} - {record.get('Mã SV', 'N/A')}{match_indicator}", expanded=False):
+            col_detail1, col_detail2 = st.columns(2)
+            
+            with col_detail1:
+                st.write("**👤 Thông tin sinh viên:**")
+                st.write(f"• **Họ tên:** {record.get('Họ và tên', 'N/A')}")
+                st.write(f"• **Mã SV:** {record.get('Mã SV', 'N/A')}")
+                st.write(f"• **Khóa:** {record.get('Khóa', 'N/A')}")
+                st.write(f"• **Học kỳ:** {record.get('Học kỳ', 'N/A')}")
+                st.write(f"• **Năm học:** {record.get('Năm học', 'N/A')}")
+            
+            with col_detail2:
+                st.write("**📊 Kết quả học tập:**")
+                st.write(f"• **Môn học:** {record.get('Môn học', 'N/A')}")
+                st.write(f"• **Điểm TBTL:** {record.get('Điểm TBTL', 'N/A')}")
+                st.write(f"• **Tổng TC:** {record.get('Tổng số tín chỉ', 'N/A')}")
+                st.write(f"• **TC lại:** {record.get('Số TC học/thi lại', 'N/A')}")
+                st.write(f"• **Xếp loại:** {record.get('Xếp loại học tập', 'N/A')}")
+    
+    if page_count > 1:
+        st.info(f"📝 Trang **{page}** / **{page_count}**: kết quả {start + 1:,}-{start + len(page_rows):,} "
+                f"/ **{len(search_results):,}**. Đổi trang ở ô 'Trang' phía trên.")
+
+def statistics_json(stats, index):
+    """Thống kê tổng quan (analyze_data) và theo từng nhóm của cube, dạng JSON (bytes utf-8)."""
+    # Chuyển Counter thành dict để serialize
+    export_stats = {
+        'total_records': stats['total_records'],
+        'avg_score': stats['avg_score'],
+        'pass_rate': stats['pass_rate'],
+        'by_khoa': dict(stats['by_khoa']),
+        'by_semester': dict(stats['by_semester']),
+        'by_subject': dict(stats['by_subject']),
+        'score_histogram': [
+            {'from': lo, 'to': hi, 'count': n}
+            for lo, hi, n in stats['score_histogram']
+        ],
+        'at_least': {f'{t:g}': n for t, n in stats['at_least'].items()},
+        'by_group': [
+            {
+                'Học kỳ': hk, 'Khóa': khoa, 'Môn học': mon,
+                'records': cell.rows,
+                'avg_score': cell.mean,
+                'min_score': cell.min if cell.count else None,
+                'max_score': cell.max if cell.count else None,
+                'pass_rate': cell.pass_rate,
+            }
+            for (hk, khoa, mon), cell in index.cube.cells.items()
+        ]
+    }
+    return json.dumps(export_stats, ensure_ascii=False, indent=2).encode('utf-8')
+
+
 def main():
     st.markdown('<h1 style="text-align: center; color: #1f77b4;">📊 HỆ THỐNG XEM ĐIỂM - ĐHNN Huế</h1>', 
                 unsafe_allow_html=True)
@@ -136,9 +344,22 @@ def main():
     
     processor = DataProcessor()
     
+    store = get_snapshot_store(str(processor.base_path))
+    
+    with st.sidebar:
+        if st.button("🔄 Tải lại dữ liệu", help="Đọc lại file output_direct.xlsx"):
+            with st.spinner("Đang tải lại dữ liệu..."):
+                store.reload()
+        if is_admin():
+            reprocess_sidebar(processor, store)
+        if store.building:
+            st.caption("⏳ Đang nạp dữ liệu mới ở nền...")
+        if store.last_error and store.current is not None and store.current.data is not None:
+            st.warning(f"Không đọc được dữ liệu mới, đang dùng bản cũ: {store.last_error}")
+    
     # Load dữ liệu
     with st.spinner("Đang tải dữ liệu..."):
-        data, error = processor.load_data_as_dict()
+        data, index, error = processor.load_data_as_dict()
     
     if error:
         st.error(f"❌ {error}")
@@ -149,7 +370,9 @@ def main():
         st.warning("⚠️ Không có dữ liệu")
         return
     
-    stats = processor.analyze_data(data)
+    st.success(f"✅ Đã đọc {len(data):,} bản ghi!")
+    
+    stats = processor.analyze_data(data, index)
     
     tab1, tab2, tab3, tab4 = st.tabs(["📊 Tổng quan", "🔍 Tìm kiếm", "📋 Dữ liệu", "📤 Xuất file"])
     
@@ -206,175 +429,64 @@ def main():
             quick_hk = st.selectbox("Học kỳ:", ['Tất cả'] + sorted(list(stats['by_semester'].keys())), key="quick_hk")
         
         with col_quick3:
-            quick_status = st.selectbox("Trạng thái:", [
-                'Tất cả', 'Đạt (≥ 2.0)', 'Không đạt (< 2.0)', 'Xuất sắc (≥ 3.6)'
-            ], key="quick_status")
+            quick_status = st.selectbox("Trạng thái:", ['Tất cả'] + list(SCORE_STATUS_FILTERS)[:3], key="quick_status")
         
         with col_quick4:
             quick_mon = st.selectbox("Ngành:", ['Tất cả'] + sorted(list(stats['by_subject'].keys())[:20]), key="quick_mon")
         
-        # Tìm kiếm
-        search_results = data
-        
-        # Áp dụng tìm kiếm tên (chuẩn xác với ranking)
-        if main_search_name.strip():
-            def normalize_text(text):
-                """Chuẩn hóa text: bỏ dấu, chuyển thường, loại bỏ khoảng trắng thừa"""
-                import unicodedata
-                # Bỏ dấu thanh điệu
-                text = unicodedata.normalize('NFD', text)
-                text = ''.join(char for char in text if unicodedata.category(char) != 'Mn')
-                # Chuyển thường và loại bỏ khoảng trắng thừa
-                return ' '.join(text.lower().split())
+        def run_search():
+            # Áp dụng quick filters: gom các mask rồi AND một lần
+            quick_masks = []
+            if quick_khoa != 'Tất cả':
+                quick_masks.append(index.categories.mask('Khóa', quick_khoa))
             
-            def calculate_match_score(name_to_search, search_term):
-                """Tính điểm khớp: càng khớp chính xác càng cao điểm"""
-                name_normalized = normalize_text(name_to_search)
-                search_normalized = normalize_text(search_term)
-                
-                if search_normalized not in name_normalized:
-                    return 0
-                
-                # Điểm cơ bản
-                score = 1
-                
-                # Bonus nếu khớp hoàn toàn
-                if search_normalized == name_normalized:
-                    score += 100
-                
-                # Bonus nếu khớp từ đầu
-                elif name_normalized.startswith(search_normalized):
-                    score += 50
-                
-                # Bonus nếu khớp từ cuối
-                elif name_normalized.endswith(search_normalized):
-                    score += 30
-                
-                # Bonus theo độ dài khớp
-                score += len(search_normalized) * 2
-                
-                # Penalty theo độ dài chênh lệch
-                length_diff = len(name_normalized) - len(search_normalized)
-                score -= length_diff
-                
-                return score
+            if quick_hk != 'Tất cả':
+                quick_masks.append(index.categories.mask('Học kỳ', quick_hk))
             
-            # Tìm và sắp xếp theo điểm khớp
-            matches_with_scores = []
-            for record in search_results:
-                score = calculate_match_score(record.get('Họ và tên', ''), main_search_name)
-                if score > 0:
-                    matches_with_scores.append((record, score))
+            if quick_mon != 'Tất cả':
+                quick_masks.append(index.categories.mask('Môn học', quick_mon))
             
-            # Sắp xếp theo điểm từ cao đến thấp
-            matches_with_scores.sort(key=lambda x: x[1], reverse=True)
-            search_results = [match[0] for match in matches_with_scores]
-        
-        # Áp dụng tìm kiếm mã SV
-        if main_search_ma_sv.strip():
-            search_results = [r for r in search_results 
-                            if main_search_ma_sv.lower() in r.get('Mã SV', '').lower()]
-        
-        # Áp dụng quick filters
-        if quick_khoa != 'Tất cả':
-            search_results = [r for r in search_results if r.get('Khóa') == quick_khoa]
-        
-        if quick_hk != 'Tất cả':
-            search_results = [r for r in search_results if r.get('Học kỳ') == quick_hk]
-        
-        if quick_mon != 'Tất cả':
-            search_results = [r for r in search_results if r.get('Môn học') == quick_mon]
-        
-        if quick_status != 'Tất cả':
-            filtered_by_status = []
-            for r in search_results:
-                try:
-                    score = float(r.get('Điểm TBTL', 0))
-                    if quick_status == 'Đạt (≥ 2.0)' and score >= 2.0:
-                        filtered_by_status.append(r)
-                    elif quick_status == 'Không đạt (< 2.0)' and score < 2.0:
-                        filtered_by_status.append(r)
-                    elif quick_status == 'Xuất sắc (≥ 3.6)' and score >= 3.6:
-                        filtered_by_status.append(r)
-                except:
-                    pass
-            search_results = filtered_by_status
-        
-        # Hiển thị kết quả
-        st.markdown("---")
-        
-        if search_results:
-            col_result1, col_result2 = st.columns([3, 1])
-            with col_result1:
-                st.success(f"🎯 Tìm thấy **{len(search_results):,}** kết quả phù hợp")
-            with col_result2:
-                show_all = st.checkbox("📋 Hiển thị tất cả", value=False, help="Hiển thị toàn bộ kết quả (có thể chậm nếu nhiều)")
+            if quick_status != 'Tất cả':
+                quick_masks.append(index.number_mask('Điểm TBTL', cache=True, **SCORE_STATUS_FILTERS[quick_status]))
             
-            # Xác định số lượng kết quả hiển thị
-            display_limit = len(search_results) if show_all else min(20, len(search_results))
+            # None nghĩa là giữ tất cả
+            search_mask = mask_and(*quick_masks)
+            quick_groups = {
+                name: value
+                for name, value in [('Khóa', quick_khoa), ('Học kỳ', quick_hk), ('Môn học', quick_mon)]
+                if value != 'Tất cả'
+            }
+            # Chỉ lọc theo Khóa/Học kỳ/Môn học: thống kê lấy thẳng từ cube
+            from_cube = (quick_status == 'Tất cả'
+                         and not main_search_name.strip() and not main_search_ma_sv.strip())
             
-            # Tính điểm khớp để hiển thị
-            def get_match_score_for_display(name, search_term):
-                if not search_term.strip():
-                    return None
-                
-                def normalize_text(text):
-                    import unicodedata
-                    text = unicodedata.normalize('NFD', text)
-                    text = ''.join(char for char in text if unicodedata.category(char) != 'Mn')
-                    return ' '.join(text.lower().split())
-                
-                name_normalized = normalize_text(name)
-                search_normalized = normalize_text(search_term)
-                
-                if search_normalized == name_normalized:
-                    return "🎯 Khớp hoàn toàn"
-                elif name_normalized.startswith(search_normalized):
-                    return "🔸 Khớp từ đầu"
-                elif name_normalized.endswith(search_normalized):
-                    return "🔹 Khớp từ cuối"
-                elif search_normalized in name_normalized:
-                    return "📍 Khớp một phần"
-                else:
-                    return None
-            
-            # Hiển thị chi tiết từng kết quả
-            for i, record in enumerate(search_results[:display_limit]):
-                match_indicator = ""
-                if main_search_name.strip():
-                    match_type = get_match_score_for_display(record.get('Họ và tên', ''), main_search_name)
-                    if match_type:
-                        match_indicator = f" {match_type}"
-                
-                with st.expander(f"#{i+1}: {record.get('Họ và tên', 'N/A')} - {record.get('Mã SV', 'N/A')}{match_indicator}", expanded=False):
-                    col_detail1, col_detail2 = st.columns(2)
-                    
-                    with col_detail1:
-                        st.write("**👤 Thông tin sinh viên:**")
-                        st.write(f"• **Họ tên:** {record.get('Họ và tên', 'N/A')}")
-                        st.write(f"• **Mã SV:** {record.get('Mã SV', 'N/A')}")
-                        st.write(f"• **Khóa:** {record.get('Khóa', 'N/A')}")
-                        st.write(f"• **Học kỳ:** {record.get('Học kỳ', 'N/A')}")
-                        st.write(f"• **Năm học:** {record.get('Năm học', 'N/A')}")
-                    
-                    with col_detail2:
-                        st.write("**📊 Kết quả học tập:**")
-                        st.write(f"• **Môn học:** {record.get('Môn học', 'N/A')}")
-                        st.write(f"• **Điểm TBTL:** {record.get('Điểm TBTL', 'N/A')}")
-                        st.write(f"• **Tổng TC:** {record.get('Tổng số tín chỉ', 'N/A')}")
-                        st.write(f"• **TC lại:** {record.get('Số TC học/thi lại', 'N/A')}")
-                        st.write(f"• **Xếp loại:** {record.get('Xếp loại học tập', 'N/A')}")
-            
-            # Thông báo trạng thái hiển thị
-            if show_all:
-                if len(search_results) > 20:
-                    st.info(f"📋 Đang hiển thị tất cả **{len(search_results):,}** kết quả.")
+            # Áp dụng tìm kiếm tên (chuẩn xác với ranking)
+            if main_search_name.strip():
+                if main_search_ma_sv.strip():
+                    search_mask = mask_and(search_mask, index.ids.mask(main_search_ma_sv))
+                # Chỉ đếm và xếp hạng các dòng của trang đang xem
+                results = index.names.ranked(main_search_name, search_mask)
+            elif main_search_ma_sv.strip():
+                # Giữ thứ tự dữ liệu như khi lọc mã SV bằng cách duyệt từng dòng
+                results = index.ids.lookup(main_search_ma_sv, search_mask)
             else:
-                if len(search_results) > 20:
-                    st.info(f"📝 Hiển thị **{display_limit}** / **{len(search_results):,}** kết quả. Tick ☑️ 'Hiển thị tất cả' để xem thêm.")
-        else:
-            st.warning("🔍 Không tìm thấy kết quả nào phù hợp với điều kiện tìm kiếm.")
-            st.info("💡 Thử điều chỉnh từ khóa tìm kiếm hoặc bộ lọc.")
+                # Không giữ list chỉ số trong session: mỗi trang lấy bằng lát cắt
+                results = range(len(data)) if search_mask is None else MaskRows(search_mask)
+            
+            def selection():
+                # Tìm theo tên: thống kê trên các dòng khớp theo thứ tự dòng, không cần xếp hạng
+                positions = results.rows if main_search_name.strip() else results
+                return index.selection_stats(quick_groups, None if from_cube else positions)
+            return results, selection, from_cube
+        
+        # Khóa gồm chỉ mục đang dùng (so sánh theo đối tượng): nạp bản dữ liệu mới thì tìm lại
+        cursor = get_search_cursor(
+            (index, main_search_name, main_search_ma_sv, quick_khoa, quick_hk, quick_status, quick_mon),
+            run_search)
+        
+        # Hiển thị kết quả
+        st.markdown("---")
+        render_search_results(data, index, cursor, main_search_name)
     
     with tab3:
         st.subheader("📋 Dữ liệu chi tiết")
@@ -426,17 +538,11 @@ def main():
                 # Lọc theo tín chỉ
                 st.markdown("**📚 Lọc theo tổng tín chỉ:**")
                 # Tính min/max tín chỉ
-                all_tc = []
-                for record in data:
-                    try:
-                        tc = float(record.get('Tổng số tín chỉ', 0))
-                        if tc > 0:
-                            all_tc.append(tc)
-                    except:
-                        pass
+                tc_index = index.numbers.get('Tổng số tín chỉ')
+                min_positive_tc = tc_index.first_above(0) if tc_index else None
                 
-                if all_tc:
-                    min_tc, max_tc = int(min(all_tc)), int(max(all_tc))
+                if min_positive_tc is not None:
+                    min_tc, max_tc = int(min_positive_tc), int(tc_index.max)
                     tc_range = st.slider(
                         "Khoảng tín chỉ:",
                         min_value=min_tc,
@@ -450,165 +556,82 @@ def main():
             with col_adv2:
                 # Lọc theo xếp loại
                 st.markdown("**🏆 Lọc theo xếp loại học tập:**")
-                xep_loai_options = set()
-                for record in data:
-                    xl = record.get('Xếp loại học tập', '')
-                    if xl and xl.strip():
-                        xep_loai_options.add(xl.strip())
-                
-                xep_loai_options = ['Tất cả'] + sorted(list(xep_loai_options))
+                xep_loai_options = ['Tất cả'] + data.distinct('Xếp loại học tập')
                 selected_xep_loai = st.selectbox("Xếp loại:", xep_loai_options)
                 
                 # Lọc theo trạng thái
                 st.markdown("**📊 Lọc theo trạng thái:**")
-                status_options = [
-                    'Tất cả',
-                    'Đạt (≥ 2.0)',
-                    'Không đạt (< 2.0)',
-                    'Xuất sắc (≥ 3.6)',
-                    'Giỏi (3.2-3.59)',
-                    'Khá (2.5-3.19)',
-                    'Trung bình (2.0-2.49)'
-                ]
+                status_options = ['Tất cả'] + list(SCORE_STATUS_FILTERS)
                 selected_status = st.selectbox("Trạng thái:", status_options)
             
             with col_adv3:
                 # Lọc theo năm học
                 st.markdown("**📅 Lọc theo năm học:**")
-                nam_hoc_options = set()
-                for record in data:
-                    nh = record.get('Năm học', '')
-                    if nh and nh.strip():
-                        nam_hoc_options.add(nh.strip())
+                nam_hoc_options = data.distinct('Năm học')
                 
                 if nam_hoc_options:
-                    nam_hoc_options = ['Tất cả'] + sorted(list(nam_hoc_options))
+                    nam_hoc_options = ['Tất cả'] + nam_hoc_options
                     selected_nam_hoc = st.selectbox("Năm học:", nam_hoc_options)
                 else:
                     selected_nam_hoc = 'Tất cả'
                 
                 # Lọc theo số TC học/thi lại
                 st.markdown("**🔄 Lọc theo TC học/thi lại:**")
-                tc_lai_options = [
-                    'Tất cả',
-                    'Không có TC lại (= 0)',
-                    'Có TC lại (> 0)',
-                    'TC lại nhiều (≥ 10)'
-                ]
+                tc_lai_options = ['Tất cả'] + list(TC_LAI_FILTERS)
                 selected_tc_lai = st.selectbox("TC học/thi lại:", tc_lai_options)
         
-        # Hàm hỗ trợ lọc
-        def matches_search(record, search_name, search_ma_sv):
-            """Kiểm tra xem record có match với tìm kiếm không (tìm kiếm đơn giản)."""
-            if search_name.strip():
-                def normalize_text(text):
-                    """Chuẩn hóa text: bỏ dấu, chuyển thường, loại bỏ khoảng trắng thừa"""
-                    import unicodedata
-                    text = unicodedata.normalize('NFD', text)
-                    text = ''.join(char for char in text if unicodedata.category(char) != 'Mn')
-                    return ' '.join(text.lower().split())
-                
-                def simple_search(name_to_search, search_term):
-                    """Tìm kiếm đơn giản: chuẩn hóa cả hai và tìm chính xác"""
-                    name_normalized = normalize_text(name_to_search)
-                    search_normalized = normalize_text(search_term)
-                    return search_normalized in name_normalized
-                
-                if not simple_search(record.get('Họ và tên', ''), search_name):
-                    return False
-            
-            if search_ma_sv.strip():
-                ma_sv = record.get('Mã SV', '').lower()
-                if search_ma_sv.lower() not in ma_sv:
-                    return False
-            
-            return True
-        
-        def matches_advanced_filters(record, score_range, tc_range, selected_xep_loai, 
-                                   selected_status, selected_nam_hoc, selected_tc_lai):
-            """Kiểm tra xem record có match với filter nâng cao không."""
-            # Lọc theo điểm
-            try:
-                score = float(record.get('Điểm TBTL', 0))
-                if not (score_range[0] <= score <= score_range[1]):
-                    return False
-            except:
-                # Nếu không parse được điểm, bỏ qua filter điểm
-                pass
-            
-            # Lọc theo tín chỉ
-            try:
-                tc = float(record.get('Tổng số tín chỉ', 0))
-                if not (tc_range[0] <= tc <= tc_range[1]):
-                    return False
-            except:
-                pass
-            
-            # Lọc theo xếp loại
-            if selected_xep_loai != 'Tất cả':
-                if record.get('Xếp loại học tập', '').strip() != selected_xep_loai:
-                    return False
-            
-            # Lọc theo trạng thái điểm
-            if selected_status != 'Tất cả':
-                try:
-                    score = float(record.get('Điểm TBTL', 0))
-                    if selected_status == 'Đạt (≥ 2.0)' and score < 2.0:
-                        return False
-                    elif selected_status == 'Không đạt (< 2.0)' and score >= 2.0:
-                        return False
-                    elif selected_status == 'Xuất sắc (≥ 3.6)' and score < 3.6:
-                        return False
-                    elif selected_status == 'Giỏi (3.2-3.59)' and not (3.2 <= score < 3.6):
-                        return False
-                    elif selected_status == 'Khá (2.5-3.19)' and not (2.5 <= score < 3.2):
-                        return False
-                    elif selected_status == 'Trung bình (2.0-2.49)' and not (2.0 <= score < 2.5):
-                        return False
-                except:
-                    pass
-            
-            # Lọc theo năm học
-            if selected_nam_hoc != 'Tất cả':
-                if record.get('Năm học', '').strip() != selected_nam_hoc:
-                    return False
-            
-            # Lọc theo TC học/thi lại
-            if selected_tc_lai != 'Tất cả':
-                try:
-                    tc_lai = float(record.get('Số TC học/thi lại', 0))
-                    if selected_tc_lai == 'Không có TC lại (= 0)' and tc_lai != 0:
-                        return False
-                    elif selected_tc_lai == 'Có TC lại (> 0)' and tc_lai <= 0:
-                        return False
-                    elif selected_tc_lai == 'TC lại nhiều (≥ 10)' and tc_lai < 10:
-                        return False
-                except:
-                    pass
-            
-            return True
-        
-        # Áp dụng tất cả các filter
-        filtered_data = data
+        # Dựng kế hoạch lọc: chỉ các bộ lọc đang bật
+        plan = FilterPlan(len(data))
         
         # Lọc cơ bản
         if selected_khoa != 'Tất cả':
-            filtered_data = [r for r in filtered_data if r.get('Khóa') == selected_khoa]
+            plan.add('Khóa', index.categories.mask('Khóa', selected_khoa))
         
         if selected_hk != 'Tất cả':
-            filtered_data = [r for r in filtered_data if r.get('Học kỳ') == selected_hk]
+            plan.add('Học kỳ', index.categories.mask('Học kỳ', selected_hk))
         
         if selected_mon != 'Tất cả':
-            filtered_data = [r for r in filtered_data if r.get('Môn học') == selected_mon]
+            plan.add('Môn học', index.categories.mask('Môn học', selected_mon))
+        
+        # Lọc nâng cao (ô số trống không bị các filter số loại bỏ)
+        plan.add('Khoảng điểm', index.number_mask('Điểm TBTL', lo=score_range[0], hi=score_range[1], keep_missing=True))
+        plan.add('Khoảng tín chỉ', index.number_mask('Tổng số tín chỉ', lo=tc_range[0], hi=tc_range[1], keep_missing=True))
+        
+        if selected_xep_loai != 'Tất cả':
+            plan.add('Xếp loại', index.categories.mask('Xếp loại học tập', selected_xep_loai, strip=True))
+        
+        if selected_status != 'Tất cả':
+            plan.add('Trạng thái', index.number_mask('Điểm TBTL', keep_missing=True, cache=True,
+                                                     **SCORE_STATUS_FILTERS[selected_status]))
+        
+        if selected_nam_hoc != 'Tất cả':
+            plan.add('Năm học', index.categories.mask('Năm học', selected_nam_hoc, strip=True))
+        
+        if selected_tc_lai != 'Tất cả':
+            plan.add('TC học/thi lại', index.number_mask('Số TC học/thi lại', keep_missing=True, cache=True,
+                                                         **TC_LAI_FILTERS[selected_tc_lai]))
         
-        # Lọc tìm kiếm
-        if search_name.strip() or search_ma_sv.strip():
-            filtered_data = [r for r in filtered_data if matches_search(r, search_name, search_ma_sv)]
+        # Lọc tìm kiếm: chạy sau cùng, chỉ trên các dòng còn lại
+        if search_name.strip():
+            plan.add_deferred('Tên sinh viên', lambda mask: index.names.contains_mask(search_name, mask))
         
-        # Lọc nâng cao (chỉ áp dụng nếu expander được mở)
-        filtered_data = [r for r in filtered_data if matches_advanced_filters(
-            r, score_range, tc_range, selected_xep_loai, selected_status, selected_nam_hoc, selected_tc_lai
-        )]
+        if search_ma_sv.strip():
+            plan.add_deferred('Mã SV', lambda mask: index.ids.mask(search_ma_sv, mask))
+        
+        filtered_mask = plan.execute()
+        filtered_data = list(range(len(data)) if filtered_mask is None else mask_positions(filtered_mask))
+        
+        filter_groups = {
+            name: value
+            for name, value in [('Khóa', selected_khoa), ('Học kỳ', selected_hk), ('Môn học', selected_mon)]
+            if value != 'Tất cả'
+        }
+        # Bộ lọc đang bật chỉ gồm Khóa/Học kỳ/Môn học (nhãn bước trùng tên cột): dùng cube
+        filter_from_cube = all(step['Bước'] in filter_groups for step in plan.explain())
+        
+        if plan.explain():
+            with st.expander("🛠️ Kế hoạch lọc", expanded=False):
+                st.table(plan.explain())
         
         # Tùy chọn hiển thị
         col_info, col_option = st.columns([3, 1])
@@ -617,32 +640,29 @@ def main():
         with col_option:
             show_all_data = st.checkbox("📋 Hiển thị tất cả dữ liệu", value=False, help="Hiển thị toàn bộ dữ liệu (có thể chậm nếu nhiều)")
         
+        create_selection_metrics(
+            index.selection_stats(filter_groups, None if filter_from_cube else filtered_data),
+            filter_from_cube)
+        
         # Xác định số lượng dữ liệu hiển thị
         data_limit = len(filtered_data) if show_all_data else min(100, len(filtered_data))
-        display_data = filtered_data[:data_limit]
-        
-        if display_data:
-            # Chuyển thành format cho st.table
-            headers = list(display_data[0].keys())
-            table_data = []
-            for record in display_data:
-                table_data.append([record.get(h, '') for h in headers])
-            
+        display_positions = filtered_data[:data_limit]
+        
+        if display_positions:
             # Hiển thị bảng
             if show_all_data:
-                st.write(f"**Dữ liệu đầy đủ ({len(display_data):,} dòng):**")
+                st.write(f"**Dữ liệu đầy đủ ({len(display_positions):,} dòng):**")
             else:
-                st.write(f"**Dữ liệu mẫu ({len(display_data)} dòng đầu):**")
-                
-            import pandas as pd
+                st.write(f"**Dữ liệu mẫu ({len(display_positions)} dòng đầu):**")
+            
             try:
-                # Thử tạo DataFrame đơn giản
-                df_display = pd.DataFrame(table_data, columns=headers)
-                st.dataframe(df_display, use_container_width=True)
-            except:
+                # Bảng Arrow dựng thẳng từ các cột (đủ mọi dòng thì không cần chọn dòng)
+                st.dataframe(data.to_arrow(None if data_limit == len(data) else display_positions),
+                             use_container_width=True)
+            except (ImportError, pa.ArrowException):
                 # Fallback: hiển thị JSON
                 st.write("**Dữ liệu (JSON format):**")
-                st.json(display_data[:5])
+                st.json([record.to_dict() for record in data.rows(display_positions[:5])])
             
             # Thông báo trạng thái
             if not show_all_data and len(filtered_data) > 100:
@@ -654,36 +674,31 @@ def main():
         col1, col2 = st.columns(2)
         
         with col1:
-            if st.button("💾 Xuất CSV", type="primary"):
-                csv_path = processor.processing_path / "exported_data.csv"
-                
-                if data:
-                    with open(str(csv_path), 'w', newline='', encoding='utf-8') as f:
-                        if data:
-                            writer = csv.DictWriter(f, fieldnames=data[0].keys())
-                            writer.writeheader()
-                            writer.writerows(data)
-                    
-                    st.success(f"✅ Đã xuất {len(data):,} bản ghi ra: {csv_path}")
+            # Xuất đúng các bản ghi đang lọc ở tab Dữ liệu. File chỉ được tạo khi
+            # bấm tải (Streamlit gọi hàm ở thread riêng), ghi từng khối vào file tạm
+            # của riêng lần tải đó rồi trả nội dung (bytes) về trình duyệt.
+            export_positions = None if filtered_mask is None else filtered_data
+            compress_csv = st.checkbox("🗜️ Nén gzip (.csv.gz)", value=True)
+            st.download_button(
+                f"💾 Tải CSV ({len(filtered_data):,} bản ghi)",
+                data=lambda: export_csv_bytes(data, export_positions, compress=compress_csv),
+                file_name="exported_data.csv.gz" if compress_csv else "exported_data.csv",
+                mime="application/gzip" if compress_csv else "text/csv",
+                type="primary",
+                on_click="ignore",
+            )
+            st.caption("Các bản ghi khớp bộ lọc ở tab 📋 Dữ liệu")
         
         with col2:
-            if st.button("📊 Xuất thống kê JSON"):
-                json_path = processor.processing_path / "statistics.json"
-                
-                # Chuyển Counter thành dict để serialize
-                export_stats = {
-                    'total_records': stats['total_records'],
-                    'avg_score': stats['avg_score'],
-                    'pass_rate': stats['pass_rate'],
-                    'by_khoa': dict(stats['by_khoa']),
-                    'by_semester': dict(stats['by_semester']),
-                    'by_subject': dict(stats['by_subject'])
-                }
-                
-                with open(str(json_path), 'w', encoding='utf-8') as f:
-                    json.dump(export_stats, f, ensure_ascii=False, indent=2)
-                
-                st.success(f"✅ Đã xuất thống kê ra: {json_path}")
+            # Như CSV: nội dung chỉ được tạo khi bấm tải và gửi thẳng về trình duyệt,
+            # không ghi file nào trên server
+            st.download_button(
+                "📊 Tải thống kê JSON",
+                data=lambda: statistics_json(stats, index),
+                file_name="statistics.json",
+                mime="application/json",
+                on_click="ignore",
+            )
 
 if __name__ == "__main__":
     main()
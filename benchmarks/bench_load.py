@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""So sánh các cách đọc dữ liệu đã xử lý: output_direct.xlsx qua CSV tạm (cũ),
+đọc thẳng xlsx thành bảng theo cột (load_table) và map file .cols (load_columnar).
+
+Bộ nhớ đỉnh và bộ nhớ còn giữ sau khi đọc (chia theo số dòng) đo bằng
+tracemalloc nên không tính vùng mmap của file .cols (nằm trong page cache, dùng
+chung giữa các process).
+
+Chạy từ thư mục gốc:  python benchmarks/bench_load.py [đường_dẫn.xlsx]
+"""
+import csv
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from openpyxl import load_workbook
+
+from columnar_file import columnar_path_for, load_columnar
+from data_store import load_table
+
+DEFAULT_PATH = Path('data_diem_dhnn') / 'processing' / 'output_direct.xlsx'
+
+
+def load_via_temp_csv(excel_path):
+    """Cách đọc cũ: ghi CSV tạm rồi đọc lại bằng csv.DictReader."""
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = Path(tmp) / 'temp_no_pandas.csv'
+
+        wb = load_workbook(str(excel_path), read_only=True, data_only=True)
+        ws = wb.active
+        with open(str(csv_path), 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            for row in ws.iter_rows(values_only=True):
+                writer.writerow([str(cell) if cell is not None else "" for cell in row])
+        wb.close()
+
+        data = []
+        with open(str(csv_path), 'r', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                if len(row.get('Mã SV', '')) > 5:
+                    data.append(dict(row))
+        return data
+
+
+def measure(func, path, repeat):
+    """Thời gian tốt nhất sau `repeat` lần, bộ nhớ đỉnh và bộ nhớ còn giữ (tracemalloc) của một lần."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(path)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    data = func(path)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, retained, len(data)
+
+
+def main():
+    path = Path(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PATH
+    repeat = 3
+
+    print(f'File: {path}')
+    print(f'{"Cách đọc":<20}{"Số dòng":>10}{"Thời gian (s)":>16}{"Bộ nhớ đỉnh (MB)":>20}{"Giữ lại (B/dòng)":>20}')
+    cases = [('CSV tạm (cũ)', load_via_temp_csv, path), ('Đọc thẳng xlsx', load_table, path)]
+    if columnar_path_for(path).exists():
+        cases.append(('File .cols (mmap)', load_columnar, columnar_path_for(path)))
+    for name, func, source in cases:
+        seconds, peak, retained, rows = measure(func, source, repeat)
+        print(f'{name:<20}{rows:>10,}{seconds:>16.3f}{peak / 1024 / 1024:>20.1f}{retained / rows:>20.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""So sánh cách lấy dữ liệu từ sheet .xls: từng ô bằng cell_value (cũ), cả dòng
+bằng row_values đổi kiểu mọi cột, và row_values chỉ đổi kiểu các cột mà layout
+đọc tới (mới, direct_processor.iter_data_rows với FileLayout.read_cols).
+
+Mỗi file raw được mở một lần; chỉ đo phần lấy dữ liệu (không tính xlrd đọc
+file), lấy thời gian tốt nhất sau vài lần và kiểm tra các cách cho cùng kết quả
+sau bước ghép họ tên và bỏ cột.
+
+Chạy từ thư mục gốc:  python benchmarks/bench_parse.py [thư_mục_raw]
+"""
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import xlrd
+from direct_processor import (discover_files, file_layout, find_header_row, iter_data_rows,
+                              merge_name_columns, prune_columns)
+
+DEFAULT_RAW = Path('data_diem_dhnn') / 'raw'
+REPEAT = 5
+
+
+def read_data_rows_per_cell(sh, start, stop):
+    """Cách cũ: cell_value từng ô, try/except và đổi float -> int cho từng ô."""
+    data_rows = []
+    for r in range(start, stop):
+        row_data = []
+        for c in range(sh.ncols):
+            try:
+                val = sh.cell_value(r, c)
+                if isinstance(val, float):
+                    if val == int(val):
+                        val = int(val)
+                row_data.append(val if val is not None else '')
+            except:
+                row_data.append('')
+
+        if any(str(v).strip() for v in row_data if v != ''):
+            data_rows.append(row_data)
+    return data_rows
+
+
+def read_data_rows_all_columns(sh, start, stop):
+    return list(iter_data_rows(sh, start, stop))
+
+
+def read_data_rows(sh, start, stop, layout):
+    return list(iter_data_rows(sh, start, stop, layout.read_cols))
+
+
+def parsed(rows, layout):
+    """Các dòng sau bước ghép họ tên và bỏ cột (như process_dhnn_file)."""
+    return list(prune_columns(merge_name_columns(rows, layout), layout))
+
+
+def best_time(func, *args):
+    best = float('inf')
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    raw_path = Path(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_RAW
+    old_times, all_times, new_times = [], [], []
+    open_time = 0
+    cells = 0
+    devnull = open(os.devnull, 'w')
+
+    for file_path in discover_files(raw_path):
+        start = time.perf_counter()
+        wb = xlrd.open_workbook(str(file_path), on_demand=True, formatting_info=False,
+                                logfile=devnull)
+        sh = wb.sheet_by_index(0)
+        open_time += time.perf_counter() - start
+        header_row = find_header_row(sh) if sh.nrows >= 10 else None
+        if header_row is not None:
+            start, stop = header_row + 1, sh.nrows - 2
+            layout = file_layout(tuple(sh.row_values(header_row)))
+            old = parsed(read_data_rows_per_cell(sh, start, stop), layout)
+            for new in (parsed(read_data_rows_all_columns(sh, start, stop), layout),
+                        parsed(read_data_rows(sh, start, stop, layout), layout)):
+                assert old == new and all(list(map(type, a)) == list(map(type, b))
+                                          for a, b in zip(old, new)), file_path
+
+            old_times.append(best_time(read_data_rows_per_cell, sh, start, stop))
+            all_times.append(best_time(read_data_rows_all_columns, sh, start, stop))
+            new_times.append(best_time(read_data_rows, sh, start, stop, layout))
+            cells += max(0, stop - start) * sh.ncols
+        wb.release_resources()
+
+    print(f'Thư mục: {raw_path}  ({len(old_times)} file, {cells:,} ô)')
+    print(f'{"Cách đọc":<32}{"Tổng (ms)":>12}{"Trung vị/file (ms)":>22}{"Lớn nhất/file (ms)":>22}')
+    for name, times in [('cell_value (cũ)', old_times), ('row_values, mọi cột', all_times),
+                        ('row_values, cột layout (mới)', new_times)]:
+        print(f'{name:<32}{sum(times) * 1000:>12.1f}{statistics.median(times) * 1000:>22.2f}'
+              f'{max(times) * 1000:>22.2f}')
+    print(f'Nhanh hơn: {sum(old_times) / sum(new_times):.1f}x')
+    print(f'(Để so sánh: xlrd mở và đọc sheet hết {open_time * 1000:.1f} ms cho các file này)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Micro-benchmark tìm kiếm theo tên: quét tuyến tính và chỉ mục trigram.
+
+Sinh N họ tên bằng cách ghép ngẫu nhiên họ / tên đệm / tên lấy từ dữ liệu thật
+(kèm điểm ngẫu nhiên), rồi đo độ trễ (p50/p99) của đúng các lời gọi tab Tìm
+kiếm của app làm cho một truy vấn: NameIndex.ranked(), len() cho số kết quả và
+lát cắt trang đầu, so với mục tiêu TARGET_P99_MS. Thống kê trên mọi dòng khớp
+(SearchIndex.selection_stats) chỉ tính khi người dùng bật nên đo riêng, cùng
+xếp hạng đầy đủ để so sánh. Mỗi phần đo cả khi có bộ lọc nhanh (mask ~1/3 số dòng).
+
+Chạy từ thư mục gốc:  python benchmarks/bench_search.py [số_dòng]
+"""
+import gc
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from data_store import TableBuilder, load_table, mask_from_positions
+from search_index import SearchIndex, fold_text, match_score
+
+DEFAULT_PATH = Path('data_diem_dhnn') / 'processing' / 'output_direct.xlsx'
+QUERY_COUNT = 500
+TOP_K = 20
+TARGET_P99_MS = 10.0
+
+
+def synthesize_names(real_names, n, rng):
+    """Ghép họ, tên đệm, tên từ các họ tên thật để có n họ tên đa dạng."""
+    parts = [name.split() for name in real_names if len(name.split()) >= 2]
+    surnames = [p[0] for p in parts]
+    middles = [p[1:-1] for p in parts]
+    givens = [p[-1] for p in parts]
+    return [' '.join([rng.choice(surnames), *rng.choice(middles), rng.choice(givens)]) for _ in range(n)]
+
+
+def make_queries(names, count, rng):
+    """Truy vấn kiểu người dùng: họ tên đầy đủ, tên đệm + tên, họ + tên đệm, không dấu."""
+    queries = []
+    for name in rng.sample(names, count):
+        tokens = name.split()
+        kind = rng.randrange(4)
+        if kind == 0:
+            queries.append(name)
+        elif kind == 1:
+            queries.append(' '.join(tokens[-2:]))
+        elif kind == 2:
+            queries.append(' '.join(tokens[:2]))
+        else:
+            queries.append(fold_text(name))
+    return queries
+
+
+def linear_rank(folded, query):
+    """Cách cũ: chấm điểm mọi dòng."""
+    query_folded = fold_text(query)
+    scored = [(i, match_score(name, query_folded)) for i, name in enumerate(folded)]
+    return [i for i, s in sorted(scored, key=lambda x: x[1], reverse=True) if s > 0]
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    return statistics.median(samples) * 1000, p99 * 1000
+
+
+def timed(call):
+    start = time.perf_counter()
+    result = call()
+    return result, time.perf_counter() - start
+
+
+def app_search(index, query, mask):
+    """Các lời gọi của tab Tìm kiếm khi hiện trang đầu: xếp hạng lười, đếm, lấy trang."""
+    results = index.names.ranked(query, mask)
+    return results, len(results), results[:TOP_K]
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    rng = random.Random(42)
+
+    table = load_table(DEFAULT_PATH)
+    names = synthesize_names(table.columns['Họ và tên'], n, rng)
+    builder = TableBuilder(['Họ và tên', 'Điểm TBTL'])
+    for name in names:
+        builder.append((name, round(rng.uniform(0, 4), 2)))
+
+    start = time.perf_counter()
+    index = SearchIndex(builder.build())
+    gc.freeze()  # như DataProcessor.build_snapshot của app
+    print(f'Số dòng: {n:,}  -  dựng chỉ mục: {time.perf_counter() - start:.1f} s')
+
+    queries = make_queries(names, QUERY_COUNT, rng)
+    masks = {'không lọc': None,
+             'có lọc': bytes(mask_from_positions(sorted(rng.sample(range(n), n // 3)), n))}
+    for label, mask in masks.items():
+        timings = {'trang đầu': [], 'thống kê': [], 'đầy đủ': []}
+        for query in queries:
+            (results, count, top), elapsed = timed(lambda: app_search(index, query, mask))
+            timings['trang đầu'].append(elapsed)
+            _, elapsed = timed(lambda: index.selection_stats({}, results.rows))
+            timings['thống kê'].append(elapsed)
+            full, elapsed = timed(lambda: index.names.rank(query, mask))
+            timings['đầy đủ'].append(elapsed)
+            assert count == len(full) and top == full[:TOP_K], query
+
+        p50, p99 = percentiles(timings['trang đầu'])
+        verdict = 'đạt' if p99 <= TARGET_P99_MS else 'KHÔNG đạt'
+        print(f'[{label}] ranked + len + trang {TOP_K} dòng, {len(queries)} truy vấn'
+              f'   p50 {p50:8.2f} ms   p99 {p99:8.2f} ms   mục tiêu p99 {TARGET_P99_MS:.0f} ms: {verdict}')
+        for step in ('thống kê', 'đầy đủ'):
+            p50, p99 = percentiles(timings[step])
+            print(f'[{label}] {step:<10} (khi cần)            p50 {p50:8.2f} ms   p99 {p99:8.2f} ms')
+
+    timings = []
+    for query in queries[:20]:
+        expected, elapsed = timed(lambda: linear_rank(index.names.folded, query))
+        timings.append(elapsed)
+        assert expected == index.names.rank(query), query
+    p50, p99 = percentiles(timings)
+    print(f'Quét cũ (20 truy vấn, cùng kết quả)          p50 {p50:8.2f} ms   p99 {p99:8.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""So sánh các cách ghi đầu ra của direct_processor.
+
+- output_direct.xlsx: Workbook thường (cũ) và write_only (mới).
+- output_direct.cols: dựng cả bảng bằng TableBuilder rồi save_columnar (cũ) và
+  ColumnarWriter đẩy dần từng cột ra file tạm (mới).
+
+Nhân bản các dòng thật trong output_direct.xlsx lên N dòng, mỗi cách ghi chạy
+trong một tiến trình riêng để đo RSS đỉnh (ru_maxrss) độc lập. Cột "append" là
+thời gian nhận các dòng, "save" là thời gian ghi file.
+
+Chạy từ thư mục gốc:  python benchmarks/bench_write.py [số_dòng ...]
+"""
+import itertools
+import multiprocessing
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from openpyxl import Workbook, load_workbook
+
+from columnar_file import ColumnarWriter, save_columnar
+from data_store import TableBuilder, row_converter
+
+DEFAULT_PATH = Path('data_diem_dhnn') / 'processing' / 'output_direct.xlsx'
+
+
+def read_source_rows(excel_path):
+    wb = load_workbook(str(excel_path), read_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        headers = list(next(rows))
+        return headers, [list(r) for r in rows]
+    finally:
+        wb.close()
+
+
+def write_workbook(excel_path, n, write_only, queue):
+    """Ghi n dòng (nhân bản từ file nguồn) ra file tạm, gửi về số đo qua queue."""
+    headers, source = read_source_rows(excel_path)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    if write_only:
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet('All Data')
+    else:
+        wb = Workbook()
+        ws = wb.active
+        ws.title = 'All Data'
+    ws.append(headers)
+    for row in itertools.islice(itertools.cycle(source), n):
+        ws.append(row)
+    appended = time.perf_counter()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        wb.save(Path(tmp) / 'out.xlsx')
+    saved = time.perf_counter()
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss: KB trên Linux, byte trên macOS
+    unit = 1 if sys.platform == 'darwin' else 1024
+    queue.put((appended - start, saved - appended, baseline * unit, peak * unit))
+
+
+def write_columnar(excel_path, n, streaming, queue):
+    """Như write_workbook nhưng ghi file .cols từ các dòng đã chuyển kiểu."""
+    headers, source = read_source_rows(excel_path)
+    convert = row_converter(headers)
+    source = [values for values in map(convert, source) if values is not None]
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'out.cols'
+        start = time.perf_counter()
+        writer = ColumnarWriter(path, headers) if streaming else TableBuilder(headers)
+        for values in itertools.islice(itertools.cycle(source), n):
+            writer.append(values)
+        appended = time.perf_counter()
+        if streaming:
+            writer.close()
+        else:
+            save_columnar(writer.build(), path)
+        saved = time.perf_counter()
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    unit = 1 if sys.platform == 'darwin' else 1024
+    queue.put((appended - start, saved - appended, baseline * unit, peak * unit))
+
+
+def measure(target, excel_path, n, mode):
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    proc = ctx.Process(target=target, args=(excel_path, n, mode, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [10_000, 100_000, 300_000]
+    mb = 1024 * 1024
+
+    print(f'File nguồn: {DEFAULT_PATH}')
+    print(f'{"Cách ghi":<28}{"Số dòng":>10}{"append (s)":>12}{"save (s)":>10}'
+          f'{"RSS đỉnh (MB)":>16}{"tăng thêm (MB)":>16}')
+    cases = [
+        ('xlsx Workbook (cũ)', write_workbook, False),
+        ('xlsx write_only (mới)', write_workbook, True),
+        ('cols TableBuilder (cũ)', write_columnar, False),
+        ('cols ColumnarWriter (mới)', write_columnar, True),
+    ]
+    for n in sizes:
+        for name, target, mode in cases:
+            append_s, save_s, baseline, peak = measure(target, DEFAULT_PATH, n, mode)
+            print(f'{name:<28}{n:>10,}{append_s:>12.2f}{save_s:>10.2f}'
+                  f'{peak / mb:>16.1f}{(peak - baseline) / mb:>16.1f}')
+
+
+if __name__ == '__main__':
+    main()
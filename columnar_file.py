@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""File nhị phân lưu theo cột cho dữ liệu đã xử lý (output_direct.cols).
+
+direct_processor.py ghi file này cạnh output_direct.xlsx; app đọc nó thay cho
+xlsx (zip chứa XML, đọc rất chậm) khi file còn mới.
+
+File được mmap chỉ đọc: cột số và cột mã là memoryview trỏ thẳng vào vùng
+map, cột chuỗi giải mã từng ô khi truy cập. Mọi process Streamlit đọc cùng file
+dùng chung một bản bảng dữ liệu trong page cache của hệ điều hành thay vì mỗi
+process giữ một bản riêng. direct_processor.py thay file bằng os.replace nên
+process đang map bản cũ vẫn đọc được bản cũ cho tới khi tải lại.
+
+Chỉ bảng dữ liệu được dùng chung: chỉ mục tìm kiếm (search_index.SearchIndex)
+vẫn dựng trong từng process từ bảng đã map, nên mỗi worker vẫn tốn thời gian
+dựng và bộ nhớ riêng cho chỉ mục (đo với 1 triệu dòng: bảng ~0 MB riêng, chỉ
+mục ~640 MB riêng và ~20 s dựng).
+
+Cấu trúc file (little-endian, mọi khối căn lề 8 byte):
+
+    MAGIC (8 byte) | độ dài metadata (uint32) | metadata JSON (utf-8) | các khối dữ liệu
+
+Metadata: {"nrows", "headers", "columns": [{"name", "kind", ...}], "stats"} với:
+    - number:   khối float64, ô trống là NaN
+    - category: khối uint16 mã giá trị + danh sách "values"
+    - text:     khối uint32 offsets (nrows + 1) + khối utf-8 nối liền
+"stats" là thống kê điểm theo nhóm (score_stats.ScoreCube.to_dict()) hoặc null.
+"""
+import json
+import math
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+from array import array
+
+from data_store import NUMBER_COLUMNS, TEXT_COLUMNS, ColumnarTable, StringColumn
+
+MAGIC = b'DHNNCOL1'
+SUFFIX = '.cols'
+_ALIGN = 8
+
+
+def write_atomically(path, write, binary=False):
+    """Gọi write(f) với một file tạm cạnh `path` rồi thay `path` bằng file đó (os.replace).
+
+    Tên file tạm là duy nhất (`<tên>.<ngẫu nhiên>.tmp`) nên các lần ghi đồng thời
+    không dùng chung file tạm; lỗi giữa chừng thì xóa file tạm và giữ nguyên `path`.
+    """
+    tmp_name = write_temporary(path, write, binary)
+    try:
+        os.replace(tmp_name, path)
+    except BaseException:
+        discard_temporary(tmp_name)
+        raise
+
+
+def write_temporary(path, write, binary=False):
+    """Bước đầu của write_atomically: ghi file tạm cạnh `path`, trả về tên file tạm.
+
+    Người gọi tự os.replace file tạm vào `path` (hoặc discard_temporary) khi muốn,
+    ví dụ để thay nhiều file theo một thứ tự nhất định.
+    """
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=path.name + '.', suffix='.tmp')
+    try:
+        if binary:
+            f = os.fdopen(fd, 'wb')
+        else:
+            f = os.fdopen(fd, 'w', encoding='utf-8')
+        with f:
+            write(f)
+    except BaseException:
+        discard_temporary(tmp_name)
+        raise
+    return tmp_name
+
+
+def discard_temporary(tmp_name):
+    """Xóa file tạm của write_temporary (bỏ qua nếu đã không còn)."""
+    try:
+        os.unlink(tmp_name)
+    except OSError:
+        pass
+
+
+def columnar_path_for(excel_path):
+    """output_direct.xlsx -> output_direct.cols"""
+    return excel_path.with_suffix(SUFFIX)
+
+
+def _little_endian_bytes(column):
+    if sys.byteorder == 'big':
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _text_blocks(values):
+    encoded = [v.encode('utf-8') for v in values]
+    offsets = array('I', [0])
+    total = 0
+    for b in encoded:
+        total += len(b)
+        offsets.append(total)
+    return _little_endian_bytes(offsets), b''.join(encoded)
+
+
+def save_columnar(table, path, stats=None):
+    """Ghi ColumnarTable (và thống kê tính sẵn nếu có) ra file nhị phân.
+
+    Ghi file tạm rồi thay thế nguyên tử.
+    """
+    blocks = []
+    columns = []
+    for name in table.headers:
+        kind = table.kind(name)
+        column = table.columns[name]
+        meta = {'name': name, 'kind': kind}
+        if kind == 'text':
+            if isinstance(column, StringColumn) and column.offsets[0] == 0:
+                offsets, blob = _little_endian_bytes(array('I', column.offsets)), bytes(column.blob)
+            else:
+                offsets, blob = _text_blocks(column)
+            meta['blocks'] = [len(blocks), len(blocks) + 1]
+            blocks += [offsets, blob]
+        else:
+            if kind == 'category':
+                meta['values'] = table.categories[name]
+            meta['blocks'] = [len(blocks)]
+            blocks.append(_little_endian_bytes(column))
+        columns.append(meta)
+
+    _write_file(path, table.nrows, table.headers, columns, blocks, stats)
+
+
+def _write_file(path, nrows, headers, columns, blocks, stats):
+    """Ghi header rồi các khối; mỗi khối là bytes hoặc (file đã ghi, độ dài)."""
+    sizes = [len(b) if isinstance(b, (bytes, bytearray)) else b[1] for b in blocks]
+    # Metadata cần biết vị trí các khối, mà vị trí lại phụ thuộc độ dài metadata:
+    # ghi vị trí tương đối so với đầu vùng dữ liệu.
+    positions = []
+    pos = 0
+    for size in sizes:
+        positions.append([pos, size])
+        pos += -(-size // _ALIGN) * _ALIGN
+    header = json.dumps({'nrows': nrows, 'headers': headers,
+                         'columns': columns, 'blocks': positions, 'stats': stats},
+                        ensure_ascii=False).encode('utf-8')
+    data_start = -(-(len(MAGIC) + 4 + len(header)) // _ALIGN) * _ALIGN
+
+    def write(f):
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(header)))
+        f.write(header)
+        f.write(bytes(data_start - f.tell()))
+        for b, size in zip(blocks, sizes):
+            if isinstance(b, (bytes, bytearray)):
+                f.write(b)
+            else:
+                b[0].seek(0)
+                shutil.copyfileobj(b[0], f)
+            f.write(bytes(-size % _ALIGN))
+    write_atomically(path, write, binary=True)
+
+
+class ColumnarWriter:
+    """Ghi file .cols từng dòng một mà không giữ cả bảng trong bộ nhớ.
+
+    Nhận cùng các dòng như data_store.TableBuilder (giá trị đã chuyển kiểu) và
+    cho ra đúng file mà save_columnar(TableBuilder.build()) ghi. Mỗi khối của
+    mỗi cột được đẩy dần ra một file tạm riêng sau mỗi FLUSH_ROWS dòng; close()
+    ghép các file tạm thành file .cols. Bộ nhớ chỉ còn một khối FLUSH_ROWS dòng
+    và danh sách giá trị của các cột phân loại.
+    """
+
+    FLUSH_ROWS = 8192
+
+    def __init__(self, path, headers):
+        self.path = path
+        self.headers = list(headers)
+        self.nrows = 0
+        self._pending = 0
+        self._columns = []
+        for name in self.headers:
+            if name in NUMBER_COLUMNS:
+                column = {'kind': 'number', 'buffer': array('d'), 'files': [_BlockFile()]}
+            elif name in TEXT_COLUMNS:
+                column = {'kind': 'text', 'buffer': [], 'files': [_BlockFile(), _BlockFile()], 'total': 0}
+                column['files'][0].write(_little_endian_bytes(array('I', [0])))
+            else:
+                column = {'kind': 'category', 'buffer': array('H'), 'files': [_BlockFile()], 'codes': {}}
+            self._columns.append(column)
+
+    def append(self, values):
+        nan = math.nan
+        for column, value in zip(self._columns, values):
+            kind = column['kind']
+            if kind == 'number':
+                column['buffer'].append(nan if value is None else value)
+            elif kind == 'text':
+                column['buffer'].append(value)
+            else:
+                codes = column['codes']
+                code = codes.get(value)
+                if code is None:
+                    code = codes[value] = len(codes)
+                column['buffer'].append(code)
+        self.nrows += 1
+        self._pending += 1
+        if self._pending >= self.FLUSH_ROWS:
+            self._flush()
+
+    def _flush(self):
+        for column in self._columns:
+            files = column['files']
+            if column['kind'] == 'text':
+                offsets = array('I')
+                total = column['total']
+                encoded = [v.encode('utf-8') for v in column['buffer']]
+                for b in encoded:
+                    total += len(b)
+                    offsets.append(total)
+                column['total'] = total
+                files[0].write(_little_endian_bytes(offsets))
+                files[1].write(b''.join(encoded))
+                column['buffer'] = []
+            else:
+                files[0].write(_little_endian_bytes(column['buffer']))
+                column['buffer'] = array(column['buffer'].typecode)
+        self._pending = 0
+
+    def close(self, stats=None):
+        """Ghi file .cols (ghi tạm rồi thay thế nguyên tử) và xóa các file tạm."""
+        try:
+            self._flush()
+            columns = []
+            blocks = []
+            for name, column in zip(self.headers, self._columns):
+                meta = {'name': name, 'kind': column['kind']}
+                if column['kind'] == 'category':
+                    meta['values'] = list(column['codes'])
+                meta['blocks'] = list(range(len(blocks), len(blocks) + len(column['files'])))
+                blocks += [(f.file, f.size) for f in column['files']]
+                columns.append(meta)
+            _write_file(self.path, self.nrows, self.headers, columns, blocks, stats)
+        finally:
+            self.discard()
+
+    def discard(self):
+        """Xóa các file tạm mà không ghi file .cols."""
+        for column in self._columns:
+            for f in column['files']:
+                f.file.close()
+
+
+class _BlockFile:
+    """File tạm chứa một khối đang ghi dở, kèm số byte đã ghi."""
+
+    def __init__(self):
+        self.file = tempfile.TemporaryFile()
+        self.size = 0
+
+    def write(self, data):
+        self.file.write(data)
+        self.size += len(data)
+
+
+def load_columnar(path):
+    """Map file nhị phân thành ColumnarTable (không sao chép dữ liệu cột)."""
+    with open(path, 'rb') as f:
+        # Map vẫn còn hiệu lực sau khi đóng file; giải phóng khi không còn memoryview nào trỏ vào
+        buf = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    if buf[:len(MAGIC)] != MAGIC:
+        raise ValueError(f'{path} không phải file {SUFFIX}')
+
+    (header_len,) = struct.unpack_from('<I', buf, len(MAGIC))
+    header_start = len(MAGIC) + 4
+    meta = json.loads(str(buf[header_start:header_start + header_len], 'utf-8'))
+    data_start = -(-(header_start + header_len) // _ALIGN) * _ALIGN
+
+    def block(i, typecode=None):
+        offset, length = meta['blocks'][i]
+        raw = buf[data_start + offset:data_start + offset + length]
+        if typecode is None:
+            return raw
+        if sys.byteorder == 'little':
+            return raw.cast(typecode)
+        # Máy big-endian: phải sao chép để đảo byte
+        column = array(typecode)
+        column.frombytes(raw)
+        column.byteswap()
+        return column
+
+    columns = {}
+    categories = {}
+    for col in meta['columns']:
+        name, kind = col['name'], col['kind']
+        if kind == 'number':
+            columns[name] = block(col['blocks'][0], 'd')
+        elif kind == 'category':
+            columns[name] = block(col['blocks'][0], 'H')
+            categories[name] = col['values']
+        else:
+            columns[name] = StringColumn(block(col['blocks'][0], 'I'), block(col['blocks'][1]))
+    return ColumnarTable(meta['headers'], columns, categories, meta['nrows'], meta.get('stats'))
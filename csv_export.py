@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""Xuất các dòng đang lọc ra CSV theo từng khối, không dựng cả file trong bộ nhớ.
+
+Mỗi lần xuất ghi vào một file tạm riêng (SpooledTemporaryFile: nằm trong RAM khi
+nhỏ, tự chuyển ra đĩa khi vượt SPOOL_MAX_BYTES) nên các session xuất cùng lúc
+không dùng chung file nào trên server, và bộ nhớ chỉ giữ một khối CHUNK_ROWS
+dòng tại một thời điểm dù xuất bao nhiêu dòng.
+"""
+import csv
+import gzip
+import io
+from itertools import islice
+from tempfile import SpooledTemporaryFile
+
+CHUNK_ROWS = 5000
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+ENCODING = 'utf-8'
+
+
+def _drain(buffer):
+    """Lấy nội dung đã ghi vào `buffer` (bytes) và làm rỗng buffer để dùng lại."""
+    chunk = buffer.getvalue().encode(ENCODING)
+    buffer.seek(0)
+    buffer.truncate()
+    return chunk
+
+
+def iter_csv_chunks(table, positions=None, chunk_rows=CHUNK_ROWS):
+    """CSV của ColumnarTable theo từng khối bytes: dòng tiêu đề rồi mỗi khối `chunk_rows` dòng.
+
+    positions: chỉ số các dòng cần xuất theo thứ tự (None = mọi dòng).
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(table.headers)
+    yield _drain(buffer)
+
+    positions = iter(range(len(table)) if positions is None else positions)
+    for chunk in iter(lambda: list(islice(positions, chunk_rows)), []):
+        writer.writerows(table.iter_tuples(chunk))
+        yield _drain(buffer)
+
+
+def export_csv(table, positions=None, compress=True, chunk_rows=CHUNK_ROWS):
+    """Ghi CSV (nén gzip nếu compress) vào một file tạm mới, trả về file đã tua về đầu.
+
+    Người gọi đọc rồi đóng file; file tạm tự xóa khi đóng.
+    """
+    out = SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    # mtime=0: cùng dữ liệu thì cùng nội dung file nén
+    stream = gzip.GzipFile(fileobj=out, mode='wb', mtime=0) if compress else out
+    for chunk in iter_csv_chunks(table, positions, chunk_rows):
+        stream.write(chunk)
+    if compress:
+        # Ghi phần cuối của gzip; không đóng `out`
+        stream.close()
+    out.seek(0)
+    return out
+
+
+def export_csv_bytes(table, positions=None, compress=True, chunk_rows=CHUNK_ROWS):
+    """Như export_csv nhưng trả về nội dung dạng bytes và đóng (xóa) file tạm.
+
+    st.download_button chỉ nhận bytes, str, BytesIO, BufferedReader hoặc
+    RawIOBase, không nhận SpooledTemporaryFile. Khi nén gzip, chỉ bản đã nén
+    được giữ trong bộ nhớ.
+    """
+    with export_csv(table, positions, compress, chunk_rows) as f:
+        return f.read()
@@ -0,0 +1,470 @@
+#!/usr/bin/env python3
+"""Đọc dữ liệu điểm đã xử lý (output_direct.xlsx) thành bảng lưu theo cột.
+
+Bộ lọc trên bảng trả về mask: bytearray mỗi dòng một byte (1 = giữ, 0 = bỏ),
+kết hợp các mask bằng phép AND trên số nguyên lớn nên không cần vòng lặp Python.
+"""
+import math
+import sys
+from array import array
+from bisect import bisect_right
+from collections import Counter
+from collections.abc import Mapping, Sequence
+from functools import lru_cache
+from itertools import accumulate, islice
+
+from openpyxl import load_workbook
+
+# Kiểu dữ liệu của các cột số trong output_direct.xlsx
+FLOAT_COLUMNS = ('Điểm TBTL',)
+INT_COLUMNS = ('STT', 'Tổng số tín chỉ', 'Tổng số TCTL', 'Số TC học/thi lại')
+NUMBER_COLUMNS = FLOAT_COLUMNS + INT_COLUMNS
+# Cột chuỗi giữ nguyên; các cột còn lại (Khóa, Học kỳ, Môn học, ...) mã hóa thành số nguyên
+TEXT_COLUMNS = ('Mã SV', 'Họ và tên')
+
+
+def to_float(value):
+    """Chuyển ô Excel thành float, None nếu trống hoặc không phải số."""
+    if value is None or isinstance(value, float):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_int(value):
+    """Chuyển ô Excel thành int, None nếu trống hoặc không phải số."""
+    value = to_float(value)
+    return None if value is None else int(value)
+
+
+def to_text(value):
+    """Chuyển ô Excel thành chuỗi, '' nếu trống."""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value == int(value):
+        value = int(value)
+    return str(value)
+
+
+def converter_for(header):
+    """Hàm chuyển kiểu cho một cột theo tên cột."""
+    if header in FLOAT_COLUMNS:
+        return to_float
+    if header in INT_COLUMNS:
+        return to_int
+    return to_text
+
+
+def iter_rows_typed(excel_path):
+    """Đọc header và từng dòng (tuple đã chuyển kiểu) có mã SV hợp lệ."""
+    wb = load_workbook(str(excel_path), read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+
+        headers = [to_text(h) for h in header]
+        yield headers
+
+        convert = row_converter(headers)
+        for row in rows:
+            values = convert(row)
+            if values is not None:
+                yield values
+    finally:
+        wb.close()
+
+
+def row_converter(headers):
+    """Hàm chuyển một dòng thô thành tuple đã chuyển kiểu theo `headers`.
+
+    Trả về None cho dòng không có mã SV hợp lệ (dài hơn 5 ký tự).
+    """
+    converters = [converter_for(h) for h in headers]
+    width = len(headers)
+    ma_sv_idx = headers.index('Mã SV') if 'Mã SV' in headers else None
+
+    def convert_row(row):
+        if len(row) < width:
+            row = tuple(row) + (None,) * (width - len(row))
+        values = tuple(convert(v) for convert, v in zip(converters, row))
+        if ma_sv_idx is not None and len(values[ma_sv_idx]) > 5:
+            return values
+        return None
+    return convert_row
+
+
+def load_table(excel_path):
+    """Đọc output_direct.xlsx thành ColumnarTable."""
+    rows = iter_rows_typed(excel_path)
+    headers = next(rows, None)
+    if headers is None:
+        return ColumnarTable.empty()
+
+    builder = TableBuilder(headers)
+    for values in rows:
+        builder.append(values)
+    return builder.build()
+
+
+# ---------------------------------------------------------------------------
+# Mask: bytearray mỗi dòng một byte 0/1
+# ---------------------------------------------------------------------------
+
+@lru_cache(maxsize=None)
+def _byte_equals_table(value):
+    """Bảng bytes.translate: byte == value -> 1, còn lại -> 0."""
+    return bytes(int(i == value) for i in range(256))
+
+
+_INVERT_TABLE = bytes([1, 0]) + bytes(254)
+
+
+def mask_and(*masks):
+    """AND các mask cùng độ dài; bỏ qua các mask None."""
+    masks = [m for m in masks if m is not None]
+    if not masks:
+        return None
+    if len(masks) == 1:
+        return bytearray(masks[0])
+    result = int.from_bytes(masks[0], 'little')
+    for m in masks[1:]:
+        result &= int.from_bytes(m, 'little')
+    return bytearray(result.to_bytes(len(masks[0]), 'little'))
+
+
+def mask_or(*masks):
+    """OR các mask cùng độ dài."""
+    result = 0
+    for m in masks:
+        result |= int.from_bytes(m, 'little')
+    return bytearray(result.to_bytes(len(masks[0]), 'little'))
+
+
+def mask_invert(mask):
+    """Đảo mask (0 <-> 1)."""
+    return bytearray(mask.translate(_INVERT_TABLE))
+
+
+def mask_positions(mask, start=0):
+    """Duyệt chỉ số các dòng (từ `start`) có mask = 1 (tìm bằng bytes.find, không duyệt từng byte)."""
+    find = mask.find
+    i = find(1, start)
+    while i != -1:
+        yield i
+        i = find(1, i + 1)
+
+
+class MaskRows(Sequence):
+    """Chỉ số các dòng có mask = 1 (tăng dần) dưới dạng dãy chỉ đọc.
+
+    Chỉ giữ mask và số dòng được chọn của từng khối BLOCK_ROWS dòng thay vì list
+    chỉ số: len() có ngay, một lát cắt chỉ tìm trong các khối chứa nó.
+    """
+
+    BLOCK_ROWS = 4096
+
+    def __init__(self, mask):
+        self.mask = bytes(mask)
+        block = self.BLOCK_ROWS
+        counts = (self.mask.count(1, lo, lo + block) for lo in range(0, len(self.mask), block))
+        # _before[b]: số dòng được chọn trong các khối trước khối b
+        self._before = list(accumulate(counts, initial=0))
+
+    def __len__(self):
+        return self._before[-1]
+
+    def __iter__(self):
+        return mask_positions(self.mask)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return list(islice(self._positions_from(start), max(0, stop - start)))
+        key = range(len(self))[key]
+        return next(self._positions_from(key))
+
+    def _positions_from(self, k):
+        """Duyệt các chỉ số từ chỉ số thứ k (đếm từ 0) trở đi."""
+        b = bisect_right(self._before, k) - 1
+        return islice(mask_positions(self.mask, b * self.BLOCK_ROWS), k - self._before[b], None)
+
+
+def mask_from_positions(positions, nrows):
+    """Tạo mask từ danh sách chỉ số dòng."""
+    mask = bytearray(nrows)
+    for i in positions:
+        mask[i] = 1
+    return mask
+
+
+# ---------------------------------------------------------------------------
+# Bảng lưu theo cột
+# ---------------------------------------------------------------------------
+
+class RowView(Mapping):
+    """Một dòng của ColumnarTable, dùng như dict chỉ đọc khi hiển thị."""
+    __slots__ = ('_table', 'index')
+
+    def __init__(self, table, index):
+        self._table = table
+        self.index = index
+
+    def __getitem__(self, key):
+        if key not in self._table.columns:
+            raise KeyError(key)
+        return self._table.value(key, self.index)
+
+    def __iter__(self):
+        return iter(self._table.headers)
+
+    def __len__(self):
+        return len(self._table.headers)
+
+    def to_dict(self):
+        return {h: self[h] for h in self._table.headers}
+
+
+class StringColumn(Sequence):
+    """Cột chuỗi: offsets uint32 (nrows + 1) + khối utf-8 nối liền, giải mã từng ô khi truy cập.
+
+    Cùng cách lưu trong bộ nhớ (TableBuilder) và trên vùng map của file .cols
+    (columnar_file.load_columnar): mỗi ô chỉ tốn số byte utf-8 của nó cộng 4 byte
+    offset, thay vì một object str.
+    """
+    __slots__ = ('_offsets', '_blob')
+
+    def __init__(self, offsets, blob):
+        self._offsets = offsets
+        self._blob = blob
+
+    @property
+    def offsets(self):
+        return self._offsets
+
+    @property
+    def blob(self):
+        return self._blob
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('StringColumn index out of range')
+        return str(self._blob[self._offsets[i]:self._offsets[i + 1]], 'utf-8')
+
+    def __iter__(self):
+        offsets, blob = self._offsets, self._blob
+        start = offsets[0]
+        for i in range(1, len(offsets)):
+            end = offsets[i]
+            yield str(blob[start:end], 'utf-8')
+            start = end
+
+
+class ColumnarTable:
+    """Dữ liệu điểm lưu theo cột.
+
+    - Cột số (NUMBER_COLUMNS): array('d'), ô trống là NaN.
+    - Cột chuỗi (TEXT_COLUMNS): StringColumn (offsets + khối utf-8).
+    - Các cột còn lại: mã số nguyên array('H') trỏ vào danh sách giá trị `categories[cột]`.
+
+    `stats`: thống kê tính sẵn đọc kèm file .cols (dạng ScoreCube.to_dict()), None nếu không có.
+    """
+
+    def __init__(self, headers, columns, categories, nrows, stats=None):
+        self.headers = list(headers)
+        self.columns = columns
+        self.categories = categories
+        self.nrows = nrows
+        self.stats = stats
+        self._category_codes = {
+            name: {value: code for code, value in enumerate(values)}
+            for name, values in categories.items()
+        }
+
+    @classmethod
+    def empty(cls):
+        return cls([], {}, {}, 0)
+
+    def __len__(self):
+        return self.nrows
+
+    def kind(self, name):
+        """'number', 'category' hoặc 'text'."""
+        if name in self.categories:
+            return 'category'
+        if name in NUMBER_COLUMNS:
+            return 'number'
+        return 'text'
+
+    def value(self, name, i):
+        """Giá trị của ô (cột `name`, dòng `i`) theo kiểu gốc."""
+        column = self.columns[name]
+        if name in self.categories:
+            return self.categories[name][column[i]]
+        if name in NUMBER_COLUMNS:
+            v = column[i]
+            if math.isnan(v):
+                return None
+            return int(v) if name in INT_COLUMNS else v
+        return column[i]
+
+    def rows(self, positions):
+        """RowView cho từng chỉ số dòng."""
+        return [RowView(self, i) for i in positions]
+
+    def iter_tuples(self, positions=None):
+        """Duyệt các dòng dưới dạng tuple theo thứ tự `headers`."""
+        if positions is None:
+            positions = range(self.nrows)
+        headers = self.headers
+        value = self.value
+        for i in positions:
+            yield tuple(value(h, i) for h in headers)
+
+    def to_arrow(self, positions=None):
+        """pyarrow.Table của các dòng `positions` (None = mọi dòng), để đưa thẳng cho st.dataframe.
+
+        Cột số, cột mã và cột chuỗi được bọc bộ đệm sẵn có (không sao chép) rồi chọn dòng
+        bằng take trong Arrow, không tạo object Python cho từng ô; cột phân loại
+        thành cột dictionary (mã + danh sách giá trị). pyarrow đi kèm Streamlit và
+        chỉ được import khi gọi hàm này.
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        indices = None if positions is None else pa.array(positions, pa.int64())
+        arrays = []
+        for name in self.headers:
+            column = self.columns[name]
+            if name in self.categories or name in NUMBER_COLUMNS:
+                kind = pa.uint16() if name in self.categories else pa.float64()
+                arr = pa.Array.from_buffers(kind, len(column), [None, pa.py_buffer(column)])
+                if indices is not None:
+                    arr = arr.take(indices)
+                if name in self.categories:
+                    arr = pa.DictionaryArray.from_arrays(arr, pa.array(self.categories[name], pa.string()))
+                else:
+                    # Ô trống (NaN) thành null
+                    arr = pc.if_else(pc.is_nan(arr), pa.scalar(None, pa.float64()), arr)
+                    if name in INT_COLUMNS:
+                        arr = arr.cast(pa.int64())
+            elif isinstance(column, StringColumn) and column.offsets[-1] < 2 ** 31:
+                # offsets uint32 dùng thẳng làm offsets int32 của Arrow (khối < 2 GB)
+                arr = pa.Array.from_buffers(pa.string(), len(column),
+                                            [None, pa.py_buffer(column.offsets), pa.py_buffer(column.blob)])
+                if indices is not None:
+                    arr = arr.take(indices)
+            else:
+                values = column if positions is None else map(column.__getitem__, positions)
+                arr = pa.array(list(values), pa.string())
+            arrays.append(arr)
+        return pa.table(arrays, names=self.headers)
+
+    # ----- Thống kê cột -----
+
+    def category_counts(self, name):
+        """Số dòng theo từng giá trị của cột phân loại: {giá trị: số dòng}."""
+        if name not in self.categories:
+            return {}
+        values = self.categories[name]
+        return {values[code]: count for code, count in Counter(self.columns[name]).items()}
+
+    def distinct(self, name):
+        """Các giá trị khác rỗng của một cột, đã sắp xếp."""
+        if name not in self.columns:
+            return []
+        if name in self.categories:
+            values = self.category_counts(name)
+        else:
+            values = set(self.columns[name])
+        return sorted(str(v).strip() for v in values if str(v).strip())
+
+    # ----- Mask -----
+
+    def equals_mask(self, name, value):
+        """Mask các dòng có cột phân loại `name` bằng `value`.
+
+        Mã 16 bit được tách thành byte thấp/byte cao và so sánh bằng bytes.translate.
+        """
+        code = self._category_codes.get(name, {}).get(value)
+        if code is None:
+            return bytearray(self.nrows)
+        raw = self.columns[name].tobytes()
+        low, high = code & 0xFF, code >> 8
+        if sys.byteorder == 'big':
+            low, high = high, low
+        return mask_and(raw[0::2].translate(_byte_equals_table(low)),
+                        raw[1::2].translate(_byte_equals_table(high)))
+
+
+class TableBuilder:
+    """Dựng ColumnarTable từng dòng một (giá trị đã chuyển kiểu)."""
+
+    def __init__(self, headers):
+        self.headers = list(headers)
+        self._columns = []
+        self._appenders = []
+        self._category_codes = {}
+        self.nrows = 0
+
+        for name in self.headers:
+            if name in NUMBER_COLUMNS:
+                column = array('d')
+                self._appenders.append(self._number_appender(column))
+            elif name in TEXT_COLUMNS:
+                column = (array('I', [0]), bytearray())
+                self._appenders.append(self._text_appender(*column))
+            else:
+                column = array('H')
+                codes = self._category_codes[name] = {}
+                self._appenders.append(self._category_appender(column, codes))
+            self._columns.append(column)
+
+    @staticmethod
+    def _number_appender(column):
+        nan = math.nan
+
+        def append(value):
+            column.append(nan if value is None else value)
+        return append
+
+    @staticmethod
+    def _text_appender(offsets, blob):
+        def append(value):
+            blob.extend(value.encode('utf-8'))
+            offsets.append(len(blob))
+        return append
+
+    @staticmethod
+    def _category_appender(column, codes):
+        def append(value):
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(codes)
+            column.append(code)
+        return append
+
+    def append(self, values):
+        for append, value in zip(self._appenders, values):
+            append(value)
+        self.nrows += 1
+
+    def build(self):
+        columns = {
+            name: StringColumn(column[0], bytes(column[1])) if name in TEXT_COLUMNS else column
+            for name, column in zip(self.headers, self._columns)
+        }
+        categories = {name: list(codes) for name, codes in self._category_codes.items()}
+        return ColumnarTable(self.headers, columns, categories, self.nrows)
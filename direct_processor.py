@@ -2,193 +2,634 @@
 """
 Xử lý trực tiếp file Excel ĐHNN mà không qua DataFrame trung gian.
 """
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
 import xlrd
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice
 from openpyxl import Workbook
 from pathlib import Path
 import warnings
-warnings.filterwarnings('ignore')
+
+from columnar_file import (ColumnarWriter, columnar_path_for, discard_temporary, write_atomically,
+                           write_temporary)
+from data_store import row_converter
+from score_stats import GROUP_COLUMNS, SCORE_COLUMN, ScoreAccumulator, ScoreCube
+
+
+def find_header_row(sh):
+    """Dòng tiêu đề: dòng đầu tiên (trong 15 dòng) có 'STT' và 'Mã SV' ở 5 cột đầu."""
+    for r in range(min(15, sh.nrows)):
+        row_text = ' '.join(map(str, sh.row_values(r, 0, 5)))
+        if 'STT' in row_text and 'Mã SV' in row_text:
+            return r
+    return None
+
+
+def layout_fingerprint(headers):
+    """Mã ngắn của một dòng tiêu đề, dùng để báo cáo layout."""
+    return hashlib.sha1('\x1f'.join(headers).encode('utf-8')).hexdigest()[:10]
+
+
+# Cách ghép họ tên và bỏ cột của một layout (dòng tiêu đề thô):
+# headers: tiêu đề sau khi bỏ cột; name_col: cột họ tên (None nếu không có);
+# merge_cols: các cột không tiêu đề gần cột họ tên được ghép vào họ tên;
+# keep_cols: chỉ số các cột giữ lại; read_cols: các cột mà các bước sau đọc tới
+# (giữ lại hoặc ghép vào họ tên), None nếu là mọi cột.
+FileLayout = namedtuple('FileLayout', 'headers name_col merge_cols keep_cols read_cols')
+
+
+@lru_cache(maxsize=None)
+def file_layout(raw_headers):
+    """Tính FileLayout một lần cho mỗi dòng tiêu đề (các file cùng khoa thường giống nhau)."""
+    headers = []
+    for val in raw_headers:
+        if val is None or str(val).strip() == '':
+            headers.append('nan')
+        else:
+            headers.append(str(val).replace('\n', ' ').strip())
+    
+    name_col_idx = None
+    potential_name_cols = []
+    
+    for i, header in enumerate(headers):
+        if 'Họ và tên' in header or 'Họ tên' in header:
+            name_col_idx = i
+        elif header == 'nan' or header == '':
+            potential_name_cols.append(i)
+    
+    if name_col_idx is None:
+        return FileLayout(tuple(headers), None, (), None, None)
+    
+    merge_cols = tuple(i for i in potential_name_cols if abs(i - name_col_idx) <= 5)
+    new_headers = []
+    keep_cols = []
+    for i, header in enumerate(headers):
+        if header != 'nan' and header != '':
+            new_headers.append(header)
+            keep_cols.append(i)
+        elif i == name_col_idx:
+            new_headers.append('Họ và tên')
+            keep_cols.append(i)
+    read_cols = tuple(sorted(set(keep_cols).union(merge_cols)))
+    return FileLayout(tuple(new_headers), name_col_idx, merge_cols, tuple(keep_cols), read_cols)
+
+
+# ---------------------------------------------------------------------------
+# Các bước xử lý dạng generator: mỗi dòng được tạo ra và dùng đúng một lần
+# ---------------------------------------------------------------------------
+
+def iter_data_rows(sh, start, stop, convert_cols=None):
+    """Bước đọc: các dòng [start, stop) của sheet, lấy cả dòng bằng row_values.
+
+    Float nguyên -> int trong các cột `convert_cols` (None = mọi cột; thường là
+    FileLayout.read_cols, tính một lần cho mỗi layout, vì các cột bị bỏ không
+    cần đổi); bỏ các dòng trống (không có ô số hay chuỗi khác khoảng trắng).
+    """
+    for r in range(start, stop):
+        row = sh.row_values(r)
+        for c in range(len(row)) if convert_cols is None else convert_cols:
+            val = row[c]
+            if val.__class__ is float and val.is_integer():
+                row[c] = int(val)
+        if any(v.__class__ is not str or v.strip() for v in row):
+            yield row
+
+
+def merge_name_columns(rows, layout):
+    """Bước ghép họ tên: nối các cột không tiêu đề gần cột họ tên vào cột họ tên."""
+    name_col_idx = layout.name_col
+    if name_col_idx is None:
+        yield from rows
+        return
+    
+    for row in rows:
+        name_parts = [str(row[name_col_idx]) if row[name_col_idx] else ""]
+        
+        for col_idx in layout.merge_cols:
+            if row[col_idx] and str(row[col_idx]).strip():
+                val = str(row[col_idx]).strip()
+                if not val.replace('.', '').isdigit():
+                    name_parts.append(val)
+        
+        row[name_col_idx] = ' '.join(name_parts).strip()
+        yield row
+
+
+def prune_columns(rows, layout):
+    """Bước bỏ cột: chỉ giữ các cột có tiêu đề (và cột họ tên)."""
+    if layout.keep_cols is None:
+        yield from rows
+        return
+    
+    keep_cols = layout.keep_cols
+    for row in rows:
+        yield [row[i] for i in keep_cols]
 
 
 def process_dhnn_file(file_path):
-    """Đọc và xử lý một file Excel ĐHNN theo cấu trúc thực tế."""
+    """Đọc và xử lý một file Excel ĐHNN theo cấu trúc thực tế.
+
+    Nối các bước đọc -> tìm tiêu đề -> ghép họ tên -> bỏ cột; danh sách dòng
+    chỉ được tạo một lần ở cuối vì kết quả còn được cache và gửi qua tiến trình.
+    """
     try:
         wb = xlrd.open_workbook(str(file_path), on_demand=True, formatting_info=False)
-        sh = wb.sheet_by_index(0)
-        
-        if sh.nrows < 10:
-            wb.release_resources()
-            return None
-        
-        header_row = None
-        for r in range(min(15, sh.nrows)):
-            row_text = ' '.join([str(sh.cell_value(r, c)) for c in range(min(5, sh.ncols))])
-            if 'STT' in row_text and 'Mã SV' in row_text:
-                header_row = r
-                break
-        
-        if header_row is None:
-            wb.release_resources()
-            return None
-        
-        headers = []
-        for c in range(sh.ncols):
-            val = sh.cell_value(header_row, c)
-            if val is None or str(val).strip() == '':
-                headers.append('nan')
-            else:
-                header_str = str(val).replace('\n', ' ').strip()
-                headers.append(header_str)
-        
-        data_rows = []
-        for r in range(header_row + 1, sh.nrows - 2):
-            row_data = []
-            for c in range(sh.ncols):
-                try:
-                    val = sh.cell_value(r, c)
-                    if isinstance(val, float):
-                        if val == int(val):
-                            val = int(val)
-                    row_data.append(val if val is not None else '')
-                except:
-                    row_data.append('')
-            
-            if any(str(v).strip() for v in row_data if v != ''):
-                data_rows.append(row_data)
-        
-        wb.release_resources()
-        
-        name_col_idx = None
-        potential_name_cols = []
-        
-        for i, header in enumerate(headers):
-            if 'Họ và tên' in header or 'Họ tên' in header:
-                name_col_idx = i
-            elif header == 'nan' or header == '':
-                potential_name_cols.append(i)
-        
-        if name_col_idx is not None:
-            for row in data_rows:
-                name_parts = [str(row[name_col_idx]) if row[name_col_idx] else ""]
-                
-                for col_idx in potential_name_cols:
-                    if abs(col_idx - name_col_idx) <= 5:
-                        if row[col_idx] and str(row[col_idx]).strip():
-                            val = str(row[col_idx]).strip()
-                            if not val.replace('.', '').isdigit():
-                                name_parts.append(val)
-                
-                combined_name = ' '.join(name_parts).strip()
-                row[name_col_idx] = combined_name
-            
-            new_headers = []
-            keep_cols = []
-            for i, header in enumerate(headers):
-                if header != 'nan' and header != '':
-                    new_headers.append(header)
-                    keep_cols.append(i)
-                elif i == name_col_idx:
-                    new_headers.append('Họ và tên')
-                    keep_cols.append(i)
+        try:
+            sh = wb.sheet_by_index(0)
+            if sh.nrows < 10:
+                return None
             
-            new_data_rows = []
-            for row in data_rows:
-                new_row = [row[i] for i in keep_cols]
-                new_data_rows.append(new_row)
+            header_row = find_header_row(sh)
+            if header_row is None:
+                return None
             
-            headers = new_headers
-            data_rows = new_data_rows
-        
-        return headers, data_rows
+            layout = file_layout(tuple(sh.row_values(header_row)))
+            rows = iter_data_rows(sh, header_row + 1, sh.nrows - 2, layout.read_cols)
+            rows = merge_name_columns(rows, layout)
+            rows = prune_columns(rows, layout)
+            return list(layout.headers), list(rows)
+        finally:
+            wb.release_resources()
     
     except Exception as e:
         print(f"Error reading {file_path}: {e}")
         return None
 
 
-def main():
-    """Xử lý tất cả file và ghi ra Excel."""
-    base_path = Path('data_diem_dhnn')
+MAIN_HEADERS = ['STT', 'Mã SV', 'Họ và tên', 'Tổng số tín chỉ', 'Tổng số TCTL',
+                'Điểm TBTL', 'Số TC học/thi lại', 'Học kỳ', 'Khóa', 'Môn học']
+
+
+def discover_files(raw_path):
+    """Các file raw/<học kỳ>/<khóa>/<môn>.xls, sắp xếp theo đường dẫn để thứ tự ghi ổn định."""
+    files = []
+    for file_path in sorted(raw_path.rglob('*.xls')):
+        parts = file_path.relative_to(raw_path).parts
+        if len(parts) == 3:
+            files.append(file_path)
+    return files
+
+
+@lru_cache(maxsize=None)
+def column_mapping(headers):
+    """Ánh xạ vị trí cột trong MAIN_HEADERS -> vị trí cột trong file nguồn.
+
+    `headers` là tuple để kết quả được cache theo layout. Trả về
+    (col_mapping, các cột trong MAIN_HEADERS không tìm thấy).
+    """
+    col_mapping = {}
+    for i, h in enumerate(headers):
+        h_clean = h.strip()
+        if 'STT' in h_clean:
+            col_mapping[0] = i
+        elif 'Mã SV' in h_clean or 'MSSV' in h_clean:
+            col_mapping[1] = i
+        elif 'Họ và tên' in h_clean or 'Họ tên' in h_clean:
+            col_mapping[2] = i
+        elif 'Tổng số tín chỉ' in h_clean or 'Tổng số\ntín chỉ' in h_clean:
+            col_mapping[3] = i
+        elif 'TCTL' in h_clean:
+            col_mapping[4] = i
+        elif 'Điểm TBTL' in h_clean or 'Điểm\nTBTL' in h_clean:
+            col_mapping[5] = i
+        elif 'TC học/thi lại' in h_clean or 'học/thi lại' in h_clean:
+            col_mapping[6] = i
+    missing = tuple(MAIN_HEADERS[j] for j in range(7) if j not in col_mapping)
+    return col_mapping, missing
+
+
+def map_columns(result, semester, khoa, subject):
+    """Bước ánh xạ cột: các dòng (headers, data_rows) của một file theo MAIN_HEADERS."""
+    headers, data_rows = result
+    col_mapping, _ = column_mapping(tuple(headers))
+    for row_data in data_rows:
+        out_row = [''] * len(MAIN_HEADERS)
+
+        for out_idx, in_idx in col_mapping.items():
+            if in_idx < len(row_data):
+                out_row[out_idx] = row_data[in_idx]
+
+        out_row[7] = semester.upper()
+        out_row[8] = khoa.upper()
+        out_row[9] = subject
+        yield out_row
+
+
+def parse_files(files, workers=1):
+    """Đọc các file, trả về (file_path, kết quả) theo đúng thứ tự `files`.
+
+    workers > 1: đọc song song bằng ProcessPoolExecutor; các tiến trình con chỉ
+    trả (headers, data_rows), việc ghi vẫn do tiến trình chính làm tuần tự.
+    Chỉ giữ tối đa workers * 2 file đang đọc hoặc đã đọc xong mà chưa ghi, nên
+    bộ nhớ không tăng theo số file khi bước ghi chậm hơn bước đọc.
+    """
+    if workers <= 1 or len(files) <= 1:
+        for file_path in files:
+            yield file_path, process_dhnn_file(file_path)
+        return
+
+    window = workers * 2
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        remaining = iter(files)
+        for file_path in islice(remaining, window):
+            pending.append((file_path, executor.submit(process_dhnn_file, file_path)))
+        while pending:
+            # Trả theo thứ tự đầu vào: chờ file đầu hàng, các file sau vẫn đọc tiếp
+            file_path, future = pending.popleft()
+            yield file_path, future.result()
+            for next_path in islice(remaining, 1):
+                pending.append((next_path, executor.submit(process_dhnn_file, next_path)))
+
+
+# Đổi khi cách đọc file hoặc MAIN_HEADERS thay đổi để bỏ toàn bộ dòng đã lưu trong manifest
+MANIFEST_VERSION = 2
+# Đổi khi kết quả (headers, data_rows) của process_dhnn_file thay đổi: cache đọc
+# file cũ không còn khớp và được đọc lại bằng xlrd. Kết quả phụ thuộc vào
+# process_dhnn_file, find_header_row, file_layout, iter_data_rows,
+# merge_name_columns và prune_columns: sửa hàm nào trong số này thì tăng số này.
+# (column_mapping/map_columns chạy sau cache nên không cần.)
+# 2: không còn cache lần đọc lỗi (null); bỏ các mục null của phiên bản 1.
+PARSER_VERSION = 2
+# Giới hạn mặc định của cache đọc file; vượt quá thì xóa mục lâu không dùng nhất
+DEFAULT_CACHE_SIZE_MB = 200
+# File tạm trong cache cũ hơn ngần này giây thì coi là sót lại từ lần ghi bị ngắt
+ORPHAN_TMP_SECONDS = 3600
+
+
+def file_sha256(file_path):
+    h = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_manifest(manifest_path):
+    """Đọc manifest: {đường dẫn tương đối: {size, mtime_ns, sha256, rows}}.
+
+    `rows` là số dòng file tạo ra (None nếu đọc lỗi); kết quả đọc (headers,
+    data_rows) nằm trong cache đọc file (xem result_cache_path) để không phải
+    giữ toàn bộ trong bộ nhớ.
+
+    Trả về {} nếu chưa có, hỏng hoặc khác MANIFEST_VERSION.
+    """
+    try:
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('version') != MANIFEST_VERSION or manifest.get('headers') != MAIN_HEADERS:
+        return {}
+    files = manifest.get('files', {})
+    # Bản trước lưu thống kê điểm theo file ở đây; nay thống kê được tính lại khi ghi
+    for entry in files.values():
+        entry.pop('stats', None)
+        entry.pop('stats_parser', None)
+    return files
+
+
+def save_manifest(manifest_path, files):
+    write_atomically(manifest_path, lambda f: json.dump(
+        {'version': MANIFEST_VERSION, 'headers': MAIN_HEADERS, 'files': files}, f, ensure_ascii=False))
+
+
+def result_cache_path(cache_dir, sha256):
+    """Kết quả đọc theo nội dung file và PARSER_VERSION.
+
+    Hai file giống hệt nhau dùng chung một mục; sửa phần ánh xạ cột/ghi output
+    không làm mất cache, chỉ đổi cách đọc file (PARSER_VERSION) mới phải đọc lại.
+    """
+    return cache_dir / f'{sha256}.p{PARSER_VERSION}.json'
+
+
+def read_cached_result(cache_path):
+    """Kết quả đã cache: (headers, data_rows)."""
+    with open(cache_path, encoding='utf-8') as f:
+        headers, data_rows = json.load(f)
+    # Đánh dấu vừa dùng cho LRU
+    os.utime(cache_path)
+    return headers, data_rows
+
+
+def write_cached_result(cache_path, result):
+    """Lưu kết quả đọc thành công; lần đọc lỗi (None) không được lưu để lần chạy sau đọc lại."""
+    write_atomically(cache_path, lambda f: json.dump(result, f, ensure_ascii=False))
+
+
+def evict_result_cache(cache_dir, max_bytes, keep=()):
+    """Xóa các mục dùng lâu nhất (theo mtime) tới khi tổng dung lượng <= max_bytes.
+
+    Các mục trong `keep` (đang dùng cho output hiện tại) không bị xóa. File tạm
+    (`*.tmp`, xem write_atomically) cũ hơn ORPHAN_TMP_SECONDS là của lần ghi bị
+    ngắt giữa chừng và luôn bị xóa; file tạm mới hơn có thể đang được process
+    khác ghi nên được giữ lại, nhưng vẫn tính vào dung lượng.
+    Trả về số file đã xóa.
+    """
+    entries = []
+    total = 0
+    removed = 0
+    orphan_before = time.time() - ORPHAN_TMP_SECONDS
+    for cache_path in cache_dir.iterdir():
+        if cache_path.suffix not in ('.json', '.tmp'):
+            continue
+        try:
+            st = cache_path.stat()
+            if cache_path.suffix == '.tmp' and st.st_mtime < orphan_before:
+                cache_path.unlink()
+                removed += 1
+                continue
+        except FileNotFoundError:
+            # Process khác vừa ghi xong (os.replace) hoặc vừa xóa file này
+            continue
+        total += st.st_size
+        if cache_path.suffix == '.json':
+            entries.append((st.st_mtime_ns, st.st_size, cache_path))
+    for _, size, cache_path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if cache_path in keep:
+            continue
+        cache_path.unlink(missing_ok=True)
+        total -= size
+        removed += 1
+    return removed
+
+
+def check_manifest_entry(file_path, entry):
+    """So file với mục manifest cũ.
+
+    Trả về (entry mới, nội dung đã đổi?). Cùng size và mtime thì dùng lại sha256
+    cũ, không cần đọc file; khác thì tính lại sha256, nội dung không đổi (file
+    chỉ bị copy/touch) vẫn coi là không đổi.
+    """
+    st = file_path.stat()
+    fingerprint = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+    if entry and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns:
+        return entry, False
+
+    fingerprint['sha256'] = file_sha256(file_path)
+    if entry and entry['sha256'] == fingerprint['sha256']:
+        return dict(entry, **fingerprint), False
+    return fingerprint, True
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Gộp các file điểm ĐHNN (.xls) thành output_direct.xlsx')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Số tiến trình đọc file song song (1 = tuần tự, mặc định: số CPU)')
+    parser.add_argument('--full', action='store_true',
+                        help='Bỏ qua manifest và cache, đọc lại toàn bộ file .xls bằng xlrd')
+    parser.add_argument('--cache-size-mb', type=float, default=DEFAULT_CACHE_SIZE_MB,
+                        help=f'Dung lượng tối đa của cache đọc file (mặc định: {DEFAULT_CACHE_SIZE_MB} MB)')
+    return parser.parse_args(argv)
+
+
+def plan_sources(files, raw_path, old_manifest, cache_dir, full=False):
+    """Bước lập kế hoạch: manifest mới và các file phải đọc bằng xlrd.
+
+    Chỉ gọi xlrd cho file mà cache chưa có kết quả của đúng nội dung này (file
+    mới/đã đổi, hoặc mục cache đã bị xóa); file đã xóa không còn trong manifest mới.
+    Trả về (manifest, danh sách file cần đọc, số file đã đổi so với manifest cũ).
+    """
+    manifest = {}
+    to_parse = []
+    changed_count = 0
+    for file_path in files:
+        key = file_path.relative_to(raw_path).as_posix()
+        entry, is_changed = check_manifest_entry(file_path, old_manifest.get(key))
+        manifest[key] = entry
+        changed_count += is_changed
+        if full or not result_cache_path(cache_dir, entry['sha256']).exists():
+            to_parse.append(file_path)
+    return manifest, to_parse, changed_count
+
+
+def load_results(files, to_parse, manifest, raw_path, cache_dir, workers=1):
+    """Bước đọc: (file_path, kết quả, lấy từ cache?) cho từng file theo thứ tự `files`.
+
+    File trong `to_parse` được đọc (song song nếu workers > 1) và ghi vào cache
+    nếu đọc được (file lỗi thì lần chạy sau đọc lại), các file còn lại lấy từ cache. Kết quả của một file chỉ nằm trong bộ nhớ
+    tới khi bước sau dùng xong.
+    """
+    parsed = parse_files(to_parse, workers)
+    to_parse = set(to_parse)
+    for file_path in files:
+        entry = manifest[file_path.relative_to(raw_path).as_posix()]
+        cache_path = result_cache_path(cache_dir, entry['sha256'])
+        if file_path in to_parse:
+            _, result = next(parsed)
+            if result is not None:
+                write_cached_result(cache_path, result)
+            cached = False
+        else:
+            result = read_cached_result(cache_path)
+            cached = True
+        entry['rows'] = len(result[1]) if result else None
+        yield file_path, result, cached
+
+
+class OutputWriter:
+    """Bước ghi: output_direct.xlsx (write_only) và output_direct.cols cùng lúc.
+
+    write_only: mỗi dòng được ghi ngay ra file XML tạm thay vì giữ thành các
+    đối tượng Cell trong bộ nhớ tới lúc save, nên bộ nhớ không tăng theo số dòng.
+    Bảng theo cột dùng cùng cách chuyển kiểu và lọc mã SV như khi app đọc xlsx,
+    và cũng được đẩy dần ra file tạm theo từng cột (ColumnarWriter) thay vì giữ
+    cả bảng tới lúc ghi.
+    Thống kê điểm được cộng theo từng file từ chính các dòng vừa ghi (xem write)
+    và ghi kèm file .cols, nên luôn khớp với dữ liệu dù cách ánh xạ cột hay
+    chuyển kiểu đổi mà không phải đọc lại file.
+    """
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.columnar_path = columnar_path_for(output_path)
+        self._wb = Workbook(write_only=True)
+        self._ws = self._wb.create_sheet('All Data')
+        self._ws.append(MAIN_HEADERS)
+        self._columnar = ColumnarWriter(self.columnar_path, MAIN_HEADERS)
+        self._convert = row_converter(MAIN_HEADERS)
+        self._score_idx = MAIN_HEADERS.index(SCORE_COLUMN)
+        self._group_idx = [MAIN_HEADERS.index(name) for name in GROUP_COLUMNS]
+        self.row_count = 0
+        self.stats = ScoreCube({})
+
+    def write(self, rows):
+        """Ghi các dòng của một file.
+
+        Thống kê được cộng vào ô (Học kỳ, Khóa, Môn học) lấy từ chính dòng đã
+        chuyển kiểu, tức đúng giá trị mà bảng theo cột lưu cho dòng đó.
+        Trả về ScoreAccumulator của các dòng đã ghi.
+        """
+        append, convert, columnar = self._ws.append, self._convert, self._columnar
+        group_idx, score_idx = self._group_idx, self._score_idx
+        stats = ScoreAccumulator()
+        groups = {}
+        for out_row in rows:
+            append(out_row)
+            values = convert(out_row)
+            if values is not None:
+                columnar.append(values)
+                group = tuple(values[i] for i in group_idx)
+                acc = groups.get(group)
+                if acc is None:
+                    acc = groups[group] = ScoreAccumulator()
+                acc.add(values[score_idx])
+            self.row_count += 1
+        for group, acc in groups.items():
+            self.stats.add(group, acc)
+            stats.merge(acc)
+        return stats
+
+    def close(self):
+        # Ghi ra file tạm rồi thay thế nguyên tử: app không bao giờ đọc phải file
+        # đang ghi dở, và mtime mới làm cache dữ liệu của app tự hết hạn.
+        try:
+            xlsx_tmp = write_temporary(self.output_path, self._wb.save, binary=True)
+        except BaseException:
+            self._columnar.discard()
+            raise
+        # Thay .cols trước rồi mới tới xlsx: app (DataProcessor.data_path) chọn .cols
+        # khi nó không cũ hơn xlsx. os.replace giữ mtime của file tạm xlsx (ghi xong
+        # trước .cols), nên ở mọi thời điểm app vẫn chọn .cols thay vì thấy xlsx
+        # mới hơn trong chốc lát rồi dựng lại dữ liệu từ xlsx một cách vô ích.
+        try:
+            self._columnar.close(self.stats.to_dict())
+            os.replace(xlsx_tmp, self.output_path)
+        except BaseException:
+            discard_temporary(xlsx_tmp)
+            raise
+
+
+class PipelineBusyError(RuntimeError):
+    """run_pipeline đang chạy ở thread khác và người gọi không muốn chờ."""
+
+
+# Mỗi process chỉ chạy một run_pipeline tại một thời điểm (app gọi từ nhiều session)
+_pipeline_lock = threading.Lock()
+
+
+def run_pipeline(base_path='data_diem_dhnn', workers=1, full=False,
+                 cache_size_mb=DEFAULT_CACHE_SIZE_MB, log=print, wait=True):
+    """Chạy toàn bộ quy trình: tìm file -> đọc (hoặc lấy cache) -> ánh xạ cột -> ghi.
+
+    Dùng chung cho dòng lệnh và nút xử lý lại trong app. `log` nhận từng dòng
+    thông báo (None để chạy im lặng). Trả về dict tóm tắt.
+
+    Các lần chạy trong cùng process lần lượt chờ nhau; wait=False thì báo
+    PipelineBusyError ngay nếu đang có lần chạy khác. Mọi file đầu ra được ghi
+    qua file tạm tên riêng rồi thay thế nguyên tử, nên cả khi hai process cùng
+    chạy, người đọc chỉ thấy file cũ hoặc file mới hoàn chỉnh.
+    """
+    if not _pipeline_lock.acquire(blocking=wait):
+        raise PipelineBusyError('Đang có một lần xử lý khác chạy')
+    try:
+        return _run_pipeline(base_path, workers, full, cache_size_mb, log)
+    finally:
+        _pipeline_lock.release()
+
+
+def _run_pipeline(base_path, workers, full, cache_size_mb, log):
+    log = log or (lambda message: None)
+    base_path = Path(base_path)
     raw_path = base_path / 'raw'
     output_path = base_path / 'processing' / 'output_direct.xlsx'
     output_path.parent.mkdir(exist_ok=True)
+    manifest_path = output_path.with_name('manifest.json')
+    cache_dir = output_path.with_name('cache')
+    cache_dir.mkdir(exist_ok=True)
     
-    wb_out = Workbook()
-    ws_all = wb_out.active
-    ws_all.title = 'All Data'
-    
-    main_headers = ['STT', 'Mã SV', 'Họ và tên', 'Tổng số tín chỉ', 'Tổng số TCTL', 
-                    'Điểm TBTL', 'Số TC học/thi lại', 'Học kỳ', 'Khóa', 'Môn học']
-    ws_all.append(main_headers)
+    old_manifest = {} if full else load_manifest(manifest_path)
+    files = discover_files(raw_path)
+    manifest, to_parse, changed_count = plan_sources(files, raw_path, old_manifest, cache_dir, full)
+    writer = OutputWriter(output_path)
     
-    row_count = 0
     success_count = 0
     fail_count = 0
-    for file_path in raw_path.rglob('*.xls'):
-        rel_path = file_path.relative_to(raw_path)
-        parts = rel_path.parts
-        
-        if len(parts) != 3:
-            continue
-            
-        semester = parts[0]
-        khoa = parts[1]
+    layouts = set()
+    # Layout thiếu cột trong MAIN_HEADERS: fingerprint -> (cột thiếu, các file)
+    unmapped_layouts = {}
+    for file_path, result, cached in load_results(files, to_parse, manifest, raw_path,
+                                                  cache_dir, workers):
+        key = file_path.relative_to(raw_path).as_posix()
+        semester, khoa = file_path.relative_to(raw_path).parts[:2]
         subject = file_path.stem
+        label = f'Processing: {semester}/{khoa}/{subject}...'
         
-        print(f'Processing: {semester}/{khoa}/{subject}...', end=' ')
+        if not result:
+            fail_count += 1
+            log(f'{label} ✗ Failed')
+            continue
         
-        result = process_dhnn_file(file_path)
+        writer.write(map_columns(result, semester, khoa, subject))
+        success_count += 1
+        log(f'{label} ✓ OK ({len(result[1])} rows{", cached" if cached else ""})')
         
-        if result:
-            headers, data_rows = result
-            
-            col_mapping = {}
-            for i, h in enumerate(headers):
-                h_clean = h.strip()
-                if 'STT' in h_clean:
-                    col_mapping[0] = i
-                elif 'Mã SV' in h_clean or 'MSSV' in h_clean:
-                    col_mapping[1] = i
-                elif 'Họ và tên' in h_clean or 'Họ tên' in h_clean:
-                    col_mapping[2] = i
-                elif 'Tổng số tín chỉ' in h_clean or 'Tổng số\ntín chỉ' in h_clean:
-                    col_mapping[3] = i
-                elif 'TCTL' in h_clean:
-                    col_mapping[4] = i
-                elif 'Điểm TBTL' in h_clean or 'Điểm\nTBTL' in h_clean:
-                    col_mapping[5] = i
-                elif 'TC học/thi lại' in h_clean or 'học/thi lại' in h_clean:
-                    col_mapping[6] = i
-            
-            for row_data in data_rows:
-                out_row = [''] * len(main_headers)
-                
-                for out_idx, in_idx in col_mapping.items():
-                    if in_idx < len(row_data):
-                        out_row[out_idx] = row_data[in_idx]
-                
-                out_row[7] = semester.upper()
-                out_row[8] = khoa.upper()
-                out_row[9] = subject
-                
-                ws_all.append(out_row)
-                row_count += 1
-            
-            success_count += 1
-            print(f'✓ OK ({len(data_rows)} rows)')
-        else:
-            fail_count += 1
-            print('✗ Failed')
+        fingerprint = layout_fingerprint(result[0])
+        layouts.add(fingerprint)
+        _, missing = column_mapping(tuple(result[0]))
+        if missing:
+            if fingerprint not in unmapped_layouts:
+                unmapped_layouts[fingerprint] = (missing, [])
+                log(f'  ⚠ Layout mới {fingerprint} không có cột: {", ".join(missing)}')
+                log(f'    Tiêu đề: {result[0]}')
+            unmapped_layouts[fingerprint][1].append(key)
+    
+    writer.close()
+    save_manifest(manifest_path, manifest)
+    
+    # Giới hạn dung lượng cache: xóa mục lâu không dùng (file đã xóa/đã đổi,
+    # PARSER_VERSION cũ), luôn giữ các mục của output vừa ghi
+    live = {result_cache_path(cache_dir, e['sha256']) for e in manifest.values()}
+    evicted = evict_result_cache(cache_dir, int(cache_size_mb * 1024 * 1024), keep=live)
     
-    wb_out.save(output_path)
+    return {
+        'files': success_count + fail_count,
+        'success': success_count,
+        'failed': fail_count,
+        'changed': changed_count,
+        'reparsed': len(to_parse),
+        'evicted': evicted,
+        'removed': len(old_manifest.keys() - manifest.keys()),
+        'layouts': len(layouts),
+        'unmapped_layouts': unmapped_layouts,
+        'rows': writer.row_count,
+        'output': output_path,
+        'columnar': writer.columnar_path,
+    }
+
+
+def main(argv=None):
+    """Xử lý tất cả file và ghi ra Excel."""
+    # Bỏ cảnh báo của xlrd/openpyxl khi đọc file .xls cũ (chỉ khi chạy dòng lệnh)
+    warnings.filterwarnings('ignore')
+    args = parse_args(argv)
+    summary = run_pipeline(workers=args.workers, full=args.full, cache_size_mb=args.cache_size_mb)
     
     print(f'\n{"="*60}')
     print('SUMMARY')
     print(f'{"="*60}')
-    print(f'Files processed: {success_count + fail_count}')
-    print(f'Success: {success_count}')
-    print(f'Failed: {fail_count}')
-    print(f'Total rows: {row_count}')
-    print(f'Output: {output_path}')
+    print(f'Files processed: {summary["files"]}')
+    print(f'Success: {summary["success"]}')
+    print(f'Failed: {summary["failed"]}')
+    print(f'Changed: {summary["changed"]}')
+    print(f'Reparsed: {summary["reparsed"]}')
+    print(f'Cache evicted: {summary["evicted"]}')
+    print(f'Removed: {summary["removed"]}')
+    print(f'Layouts: {summary["layouts"]} ({len(summary["unmapped_layouts"])} thiếu cột)')
+    for fingerprint, (missing, keys) in summary['unmapped_layouts'].items():
+        print(f'  ⚠ {fingerprint}: thiếu {", ".join(missing)} - {len(keys)} file, ví dụ {keys[0]}')
+    print(f'Total rows: {summary["rows"]}')
+    print(f'Output: {summary["output"]}')
+    print(f'Columnar: {summary["columnar"]}')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""Thống kê điểm tính sẵn theo nhóm Học kỳ × Khóa × Môn học.
+
+Mỗi ô của cube là một ScoreAccumulator (số dòng, tổng/min/max, số điểm đạt
+từng ngưỡng và histogram của Điểm TBTL hợp lệ, 0 ≤ điểm ≤ 4). Số ô bằng số nhóm
+(vài chục tới vài trăm), không phụ thuộc số sinh viên, nên các thống kê tổng
+quan chỉ cần gộp các ô.
+
+direct_processor.py cộng một ScoreAccumulator cho mỗi file ngay trong lúc ghi
+các dòng của file đó, rồi gộp thành cube ghi kèm file .cols; app đọc cube đó
+thay vì duyệt lại cả bảng.
+"""
+import math
+from bisect import bisect_left, bisect_right
+from collections import Counter
+
+GROUP_COLUMNS = ('Học kỳ', 'Khóa', 'Môn học')
+SCORE_COLUMN = 'Điểm TBTL'
+SCORE_MIN = 0.0
+SCORE_MAX = 4.0
+PASS_SCORE = 2.0
+# Ngưỡng xếp loại theo thang 4: Yếu / Trung bình (đạt) / Khá / Giỏi / Xuất sắc
+THRESHOLDS = (1.0, PASS_SCORE, 2.5, 3.2, 3.6)
+# Histogram cố định: HISTOGRAM_BINS khoảng đều nhau trên [SCORE_MIN, SCORE_MAX],
+# điểm SCORE_MAX rơi vào khoảng cuối
+HISTOGRAM_BINS = 8
+_BIN_WIDTH = (SCORE_MAX - SCORE_MIN) / HISTOGRAM_BINS
+# Cận dưới của các khoảng trừ khoảng đầu: điểm bằng cận thuộc khoảng bên phải
+_BIN_EDGES = [SCORE_MIN + i * _BIN_WIDTH for i in range(1, HISTOGRAM_BINS)]
+_PASS_INDEX = THRESHOLDS.index(PASS_SCORE)
+
+
+class ScoreAccumulator:
+    """Thống kê Điểm TBTL của một nhóm dòng, cập nhật từng dòng với bộ nhớ O(1).
+
+    Giữ số dòng, số điểm hợp lệ (0 ≤ điểm ≤ 4), tổng/min/max, số điểm đạt từng
+    ngưỡng trong THRESHOLDS và histogram HISTOGRAM_BINS khoảng. Hai bộ gộp được
+    bằng merge (kết quả như thêm lần lượt mọi dòng của cả hai), nên các phần tính
+    riêng (theo file, theo tiến trình) gộp lại thành thống kê chung mà không cần
+    duyệt lại dữ liệu. to_dict/from_dict để lưu vào file .cols.
+    """
+    __slots__ = ('rows', 'count', 'total', 'min', 'max', 'thresholds', 'histogram')
+
+    def __init__(self):
+        self.rows = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.thresholds = [0] * len(THRESHOLDS)
+        self.histogram = [0] * HISTOGRAM_BINS
+
+    def add(self, score):
+        """Thêm một dòng; điểm ngoài [0, 4] hoặc trống (None/NaN) chỉ được đếm vào `rows`."""
+        self.rows += 1
+        if score is not None and SCORE_MIN <= score <= SCORE_MAX:
+            self.count += 1
+            self.total += score
+            if score < self.min:
+                self.min = score
+            if score > self.max:
+                self.max = score
+            for i, threshold in enumerate(THRESHOLDS):
+                if score < threshold:
+                    break
+                self.thresholds[i] += 1
+            self.histogram[bisect_right(_BIN_EDGES, score)] += 1
+
+    def add_many(self, scores):
+        """Thêm nhiều dòng một lượt, kết quả như gọi add cho từng điểm.
+
+        `scores` là float, ô trống là NaN (như cột số của ColumnarTable). Lọc điểm
+        hợp lệ một lần rồi sắp xếp; min/max, số đạt từng ngưỡng và histogram lấy
+        bằng bisect trên list đã sắp xếp thay vì so sánh từng điểm.
+        """
+        scores = list(scores)
+        valid = [s for s in scores if SCORE_MIN <= s <= SCORE_MAX]
+        self.rows += len(scores)
+        # Cộng theo thứ tự dòng để tổng giống hệt khi gọi add
+        self.total = sum(valid, self.total)
+        valid.sort()
+        return self._add_sorted(valid)
+
+    @classmethod
+    def from_sorted(cls, values, rows):
+        """Thống kê của `rows` dòng có các điểm khác trống `values` (đã sắp xếp tăng dần).
+
+        Dùng list đã sắp xếp của NumberIndex: chỉ cần bisect và một lần sum.
+        """
+        acc = cls()
+        acc.rows = rows
+        valid = values[bisect_left(values, SCORE_MIN):bisect_right(values, SCORE_MAX)]
+        acc.total = sum(valid)
+        return acc._add_sorted(valid)
+
+    def _add_sorted(self, valid):
+        """Cộng count/min/max/ngưỡng/histogram của các điểm hợp lệ đã sắp xếp (không cộng total)."""
+        n = len(valid)
+        if not n:
+            return self
+        self.count += n
+        self.min = min(self.min, valid[0])
+        self.max = max(self.max, valid[-1])
+        for i, threshold in enumerate(THRESHOLDS):
+            self.thresholds[i] += n - bisect_left(valid, threshold)
+        bounds = [0] + [bisect_left(valid, edge) for edge in _BIN_EDGES] + [n]
+        for i in range(HISTOGRAM_BINS):
+            self.histogram[i] += bounds[i + 1] - bounds[i]
+        return self
+
+    def agrees_with(self, other):
+        """Cùng thống kê (tổng so sánh gần đúng vì thứ tự cộng có thể khác)."""
+        return (self.rows == other.rows and self.count == other.count
+                and self.thresholds == other.thresholds and self.histogram == other.histogram
+                and (not self.count or (self.min == other.min and self.max == other.max))
+                and math.isclose(self.total, other.total, rel_tol=1e-9, abs_tol=1e-9))
+
+    def merge(self, other):
+        self.rows += other.rows
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.thresholds = [a + b for a, b in zip(self.thresholds, other.thresholds)]
+        self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+        return self
+
+    @property
+    def passed(self):
+        return self.thresholds[_PASS_INDEX]
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    @property
+    def pass_rate(self):
+        """Tỷ lệ đạt (%) trên số điểm hợp lệ."""
+        return self.passed / self.count * 100 if self.count else 0
+
+    def histogram_bins(self):
+        """[(cận dưới, cận trên, số điểm)] của từng khoảng."""
+        return [(SCORE_MIN + i * _BIN_WIDTH, SCORE_MIN + (i + 1) * _BIN_WIDTH, n)
+                for i, n in enumerate(self.histogram)]
+
+    def to_dict(self):
+        return {
+            'rows': self.rows, 'count': self.count, 'total': self.total,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None,
+            'thresholds': self.thresholds, 'histogram': self.histogram,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        """Ngược với to_dict; ValueError nếu lưu với THRESHOLDS/HISTOGRAM_BINS khác."""
+        if len(d['thresholds']) != len(THRESHOLDS) or len(d['histogram']) != HISTOGRAM_BINS:
+            raise ValueError('Thống kê lưu với ngưỡng/số khoảng khác phiên bản hiện tại')
+        acc = cls()
+        acc.rows = d['rows']
+        acc.count = d['count']
+        acc.total = d['total']
+        if acc.count:
+            acc.min = d['min']
+            acc.max = d['max']
+        acc.thresholds = list(d['thresholds'])
+        acc.histogram = list(d['histogram'])
+        return acc
+
+
+class ScoreCube:
+    """ScoreAccumulator theo từng bộ (Học kỳ, Khóa, Môn học), giữ thứ tự xuất hiện trong dữ liệu."""
+
+    def __init__(self, cells):
+        self.cells = cells
+        self._totals = {}
+
+    @classmethod
+    def from_table(cls, table):
+        """Dựng cube bằng một lần duyệt ColumnarTable (theo mã của cột phân loại)."""
+        nrows = len(table)
+        group_codes = []
+        group_values = []
+        for name in GROUP_COLUMNS:
+            if name in table.categories:
+                group_codes.append(table.columns[name])
+                group_values.append(table.categories[name])
+            else:
+                group_codes.append(bytes(nrows))
+                group_values.append([''])
+        scores = table.columns.get(SCORE_COLUMN) or [math.nan] * nrows
+
+        by_code = {}
+        for key, score in zip(zip(*group_codes), scores):
+            cell = by_code.get(key)
+            if cell is None:
+                cell = by_code[key] = ScoreAccumulator()
+            cell.add(score)
+
+        cells = {
+            tuple(values[code] for values, code in zip(group_values, key)): cell
+            for key, cell in by_code.items()
+        }
+        return cls(cells)
+
+    def to_dict(self):
+        """Dạng JSON: [[Học kỳ, Khóa, Môn học, ScoreAccumulator.to_dict()], ...]."""
+        return [[*key, cell.to_dict()] for key, cell in self.cells.items()]
+
+    @classmethod
+    def from_dict(cls, items):
+        return cls({tuple(item[:-1]): ScoreAccumulator.from_dict(item[-1]) for item in items})
+
+    def add(self, key, acc):
+        """Gộp `acc` vào ô `key` (tạo ô mới nếu chưa có)."""
+        cell = self.cells.get(key)
+        if cell is None:
+            self.cells[key] = cell = ScoreAccumulator()
+        cell.merge(acc)
+        self._totals.clear()
+
+    def select(self, groups):
+        """Gộp các ô khớp `groups` ({cột trong GROUP_COLUMNS: giá trị}; {} là mọi ô)."""
+        if not groups:
+            return self.total()
+        axes = [(GROUP_COLUMNS.index(name), value) for name, value in groups.items()]
+        acc = ScoreAccumulator()
+        for key, cell in self.cells.items():
+            if all(key[axis] == value for axis, value in axes):
+                acc.merge(cell)
+        return acc
+
+    def total(self):
+        """Gộp mọi ô."""
+        if None not in self._totals:
+            cell = ScoreAccumulator()
+            for c in self.cells.values():
+                cell.merge(c)
+            self._totals[None] = cell
+        return self._totals[None]
+
+    def by(self, name):
+        """{giá trị của cột `name`: ScoreAccumulator gộp}."""
+        if name not in self._totals:
+            axis = GROUP_COLUMNS.index(name)
+            result = {}
+            for key, c in self.cells.items():
+                cell = result.get(key[axis])
+                if cell is None:
+                    cell = result[key[axis]] = ScoreAccumulator()
+                cell.merge(c)
+            self._totals[name] = result
+        return self._totals[name]
+
+    def counts(self, name):
+        """Số dòng theo từng giá trị của cột `name` (Counter)."""
+        return Counter({value: cell.rows for value, cell in self.by(name).items()})
@@ -0,0 +1,883 @@
+#!/usr/bin/env python3
+"""Chỉ mục tìm kiếm dựng một lần khi tải dữ liệu, dùng lại cho mọi rerun."""
+import heapq
+import math
+import re
+import unicodedata
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Sequence
+from itertools import chain, islice
+
+from data_store import NUMBER_COLUMNS, mask_from_positions, mask_invert, mask_positions
+from score_stats import GROUP_COLUMNS, SCORE_COLUMN, ScoreAccumulator, ScoreCube
+
+# Các cột phân loại có bitset dựng sẵn cho từng giá trị
+# Xếp loại học tập và Năm học không có trong output của direct_processor hiện nay,
+# nhưng tab dữ liệu vẫn lọc theo chúng khi file dữ liệu có các cột đó (file xlsx
+# cũ); cột không có trong bảng thì không được lập chỉ mục nên không tốn gì.
+CATEGORY_INDEX_COLUMNS = ('Khóa', 'Học kỳ', 'Môn học', 'Xếp loại học tập', 'Năm học')
+
+# Ứng viên từ posting list thưa dài hơn ngưỡng này thì lọc thêm bằng các bitset
+INTERSECT_MIN_POSTING = 1024
+
+# Lấy top-k khi truy vấn có thể khớp nhiều hơn ngần này dòng: duyệt theo nhóm độ
+# dài họ tên thay vì chấm điểm mọi dòng khớp
+RANK_SCAN_MIN_CANDIDATES = 2000
+# Quá ngần này ứng viên thì duyệt theo nhóm độ dài luôn, không kiểm từng ứng viên trước
+RANK_VERIFY_MAX_CANDIDATES = 8000
+
+# Điểm cộng của match_score theo kiểu khớp (khớp hoàn toàn chỉ có ở nhóm độ dài bằng query)
+_BONUS_EXACT = 100
+_BONUS_START = 50
+_BONUS_END = 30
+
+# Đếm dòng khớp bằng bitset của các posting list từ (thay vì duyệt các nhóm độ
+# dài) khi các nhóm cần duyệt có hơn ngần này dòng
+COUNT_SCAN_MAX_ROWS = 8000
+
+# Vị trí các bit 1 trong từng giá trị byte
+_BYTE_BITS = tuple(tuple(j for j in range(8) if b >> j & 1) for b in range(256))
+_NONZERO_RUN = re.compile(rb'[^\x00]+')
+# _BIT_TABLES[j]: byte -> bit j của nó (0/1); _SHIFT_TABLES[j]: 0 -> 0, khác 0 -> 1 << j
+_BIT_TABLES = tuple(bytes(b >> j & 1 for b in range(256)) for j in range(8))
+_SHIFT_TABLES = tuple(bytes([0]) + bytes([1 << j]) * 255 for j in range(8))
+
+
+def fold_text(text):
+    """Chuẩn hóa text: bỏ dấu, chuyển thường, loại bỏ khoảng trắng thừa"""
+    text = unicodedata.normalize('NFD', text)
+    text = ''.join(char for char in text if unicodedata.category(char) != 'Mn')
+    return ' '.join(text.lower().split())
+
+
+def trigrams(text):
+    """Tập các chuỗi con 3 ký tự của text."""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def match_score(name_folded, query_folded):
+    """Tính điểm khớp: càng khớp chính xác càng cao điểm (0 = không khớp)."""
+    if query_folded not in name_folded:
+        return 0
+
+    # Điểm cơ bản
+    score = 1
+
+    # Bonus nếu khớp hoàn toàn
+    if query_folded == name_folded:
+        score += 100
+
+    # Bonus nếu khớp từ đầu
+    elif name_folded.startswith(query_folded):
+        score += 50
+
+    # Bonus nếu khớp từ cuối
+    elif name_folded.endswith(query_folded):
+        score += 30
+
+    # Bonus theo độ dài khớp
+    score += len(query_folded) * 2
+
+    # Penalty theo độ dài chênh lệch
+    score -= len(name_folded) - len(query_folded)
+
+    return score
+
+
+def match_label(name_folded, query_folded):
+    """Nhãn mức độ khớp để hiển thị, None nếu không khớp."""
+    if query_folded == name_folded:
+        return "🎯 Khớp hoàn toàn"
+    elif name_folded.startswith(query_folded):
+        return "🔸 Khớp từ đầu"
+    elif name_folded.endswith(query_folded):
+        return "🔹 Khớp từ cuối"
+    elif query_folded in name_folded:
+        return "📍 Khớp một phần"
+    return None
+
+
+def positions_to_bitset(positions, nrows):
+    """Bitset (int) có bit i = 1 với mọi i trong positions."""
+    bits = bytearray((nrows + 7) // 8)
+    for i in positions:
+        bits[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def mask_to_bitset(mask, nrows):
+    """Bitset (int) từ mask một byte mỗi dòng, ghép 8 dòng một byte bằng lát cắt bước 8."""
+    padded = bytes(mask) + bytes(-nrows % 8)
+    bits = 0
+    for j in range(8):
+        bits |= int.from_bytes(padded[j::8].translate(_SHIFT_TABLES[j]), 'little')
+    return bits
+
+
+def bitset_to_mask(bits, nrows):
+    """Mask một byte mỗi dòng (bytearray) từ bitset, ngược với mask_to_bitset."""
+    raw = bits.to_bytes((nrows + 7) // 8, 'little')
+    mask = bytearray(len(raw) * 8)
+    for j in range(8):
+        mask[j::8] = raw.translate(_BIT_TABLES[j])
+    del mask[nrows:]
+    return mask
+
+
+def bitset_positions(bits, nrows):
+    """Chỉ số các bit 1 (tăng dần); chỉ duyệt Python trên các byte khác 0."""
+    raw = bits.to_bytes((nrows + 7) // 8, 'little')
+    positions = []
+    for run in _NONZERO_RUN.finditer(raw):
+        for offset, byte in enumerate(run.group(), run.start()):
+            base = offset << 3
+            positions.extend(base + j for j in _BYTE_BITS[byte])
+    return positions
+
+
+def _prefix_range(keys, prefix):
+    """[lo, hi) của các khóa bắt đầu bằng `prefix` trong list khóa đã sắp xếp."""
+    lo = bisect_left(keys, prefix)
+    return lo, bisect_left(keys, prefix + chr(0x10FFFF), lo)
+
+
+class NgramIndex:
+    """Chỉ mục ngược trigram -> dòng (và tùy chọn từ -> dòng) trên một list chuỗi.
+
+    Mỗi posting list lưu dạng nhỏ hơn: array('I') các chỉ số dòng nếu thưa,
+    bitset (int) nếu dày (> 1/32 số dòng); giao các bitset là phép AND chạy trong C.
+    """
+
+    def __init__(self, texts, index_tokens=False):
+        self.texts = texts
+        nrows = len(texts)
+
+        trigram_postings = {}
+        token_postings = {}
+        for i, text in enumerate(texts):
+            for key in trigrams(text):
+                posting = trigram_postings.get(key)
+                if posting is None:
+                    posting = trigram_postings[key] = array('I')
+                posting.append(i)
+            if index_tokens:
+                for key in set(text.split()):
+                    posting = token_postings.get(key)
+                    if posting is None:
+                        posting = token_postings[key] = array('I')
+                    posting.append(i)
+
+        for postings in (trigram_postings, token_postings):
+            for key, posting in postings.items():
+                if len(posting) * 32 > nrows:
+                    postings[key] = positions_to_bitset(posting, nrows)
+        self._trigram_postings = trigram_postings
+        self._token_postings = token_postings if index_tokens else None
+
+    def tokens(self):
+        """Các từ có posting list (chỉ khi dựng với index_tokens=True)."""
+        return self._token_postings.keys()
+
+    def token_posting(self, token):
+        """Posting list (array('I') hoặc bitset) của một từ, None nếu không có."""
+        return self._token_postings.get(token)
+
+    def candidates(self, query, max_dense=None):
+        """Các dòng (tăng dần) có thể chứa query, None nếu query quá ngắn để dùng chỉ mục.
+
+        Dòng chứa query phải chứa mọi trigram của query và mọi từ ở giữa query
+        (từ đầu/cuối có thể chỉ khớp một phần), nên tập ứng viên là giao của
+        các posting list đó: lấy posting list thưa ngắn nhất rồi lọc bằng AND
+        của các bitset, hoặc chỉ AND các bitset nếu không có list thưa nào.
+        max_dense: nếu chỉ có bitset và giao của chúng có hơn chừng đó dòng thì
+        trả về None thay vì liệt kê (tốn kém khi nhiều dòng).
+        """
+        if len(query) < 3:
+            return None
+        postings = [self._trigram_postings.get(key) for key in trigrams(query)]
+        if self._token_postings is not None:
+            postings += [self._token_postings.get(key) for key in query.split(' ')[1:-1]]
+        if any(posting is None for posting in postings):
+            return ()
+
+        nrows = len(self.texts)
+        sparse = [p for p in postings if not isinstance(p, int)]
+        dense = [p for p in postings if isinstance(p, int)]
+        if sparse:
+            smallest = min(sparse, key=len)
+            if not dense or len(smallest) <= INTERSECT_MIN_POSTING:
+                return smallest
+
+        bits = dense[0]
+        for other in dense[1:]:
+            bits &= other
+        if not sparse:
+            if max_dense is not None and bits.bit_count() > max_dense:
+                return None
+            return bitset_positions(bits, nrows)
+        raw = bits.to_bytes((nrows + 7) // 8, 'little')
+        return [i for i in smallest if raw[i >> 3] >> (i & 7) & 1]
+
+    def matching_rows(self, query, mask=None):
+        """Chỉ số các dòng (tăng dần) có chuỗi chứa query, trong phạm vi `mask`."""
+        rows = self.candidates(query)
+        if rows is None:
+            rows = range(len(self.texts)) if mask is None else mask_positions(mask)
+        elif mask is not None:
+            rows = [i for i in rows if mask[i]]
+        texts = self.texts
+        return [i for i in rows if query in texts[i]]
+
+
+class NameIndex:
+    """Họ tên đã bỏ dấu/chuyển thường của từng dòng, tính sẵn khi tải dữ liệu.
+
+    Kèm chỉ mục trigram/từ để chỉ chấm điểm các dòng có thể khớp thay vì
+    quét toàn bộ, và các nhóm họ tên cùng độ dài (_LengthGroup) để lấy top-k
+    mà không chấm điểm mọi dòng khớp.
+    """
+
+    def __init__(self, names):
+        self.folded = [fold_text(name) for name in names]
+        self._ngrams = NgramIndex(self.folded, index_tokens=True)
+        nrows = len(self.folded)
+
+        by_length = {}
+        # Hai từ liền nhau (từ trước -> từ sau -> dòng), để đếm query nhiều từ
+        pairs = {}
+        # Các dòng có một từ lặp lại trong họ tên
+        repeated = array('I')
+        for i, name in enumerate(self.folded):
+            rows = by_length.get(len(name))
+            if rows is None:
+                rows = by_length[len(name)] = array('I')
+            rows.append(i)
+            tokens = name.split(' ')
+            if len(set(tokens)) < len(tokens):
+                repeated.append(i)
+            for first, second in set(zip(tokens, tokens[1:])):
+                following = pairs.get(first)
+                if following is None:
+                    following = pairs[first] = {}
+                posting = following.get(second)
+                if posting is None:
+                    posting = following[second] = array('I')
+                posting.append(i)
+        for following in pairs.values():
+            for key, posting in following.items():
+                if len(posting) * 32 > nrows:
+                    following[key] = positions_to_bitset(posting, nrows)
+        self._pairs = pairs
+        self._repeated = positions_to_bitset(repeated, nrows)
+        self._groups = {length: _LengthGroup(self.folded, rows, nrows) for length, rows in by_length.items()}
+        self._tokens = sorted(self._ngrams.tokens())
+        self._reversed_tokens = sorted(token[::-1] for token in self._tokens)
+        self._shorter_bits = {}
+        # Bitset của mask gần nhất: các truy vấn liên tiếp thường cùng bộ lọc
+        self._last_mask = (None, 0)
+
+    def matching_rows(self, query_folded, mask=None):
+        """Chỉ số các dòng (tăng dần) có họ tên chứa query, trong phạm vi `mask`."""
+        return self._ngrams.matching_rows(query_folded, mask)
+
+    def matches(self, query, mask=None):
+        """Chỉ số các dòng (tăng dần) mà rank() trả về, tức điểm khớp > 0."""
+        query_folded = fold_text(query)
+        folded = self.folded
+        # Điểm = 1 + điểm cộng + 3 * len(query) - len(họ tên) nên họ tên ngắn
+        # hơn ngưỡng này luôn có điểm > 0, không cần chấm
+        always_positive = 1 + 3 * len(query_folded)
+        return [i for i in self.matching_rows(query_folded, mask)
+                if len(folded[i]) < always_positive or match_score(folded[i], query_folded) > 0]
+
+    def rank(self, query, mask=None, limit=None):
+        """Chỉ số các dòng khớp `query`, sắp xếp theo điểm khớp giảm dần.
+
+        `mask` giới hạn các dòng được xét (mặc định: tất cả). `limit`: chỉ lấy
+        chừng đó dòng đầu (cùng thứ tự như khi xếp hạng đầy đủ).
+        """
+        query_folded = fold_text(query)
+        folded = self.folded
+        if limit is not None and query_folded and (
+                mask is None or self._mask_bits(mask).bit_count() > RANK_SCAN_MIN_CANDIDATES):
+            # Liệt kê ứng viên chỉ khi rẻ (có posting list thưa, hoặc giao các bitset
+            # nhỏ); nhiều dòng khớp thì duyệt theo nhóm độ dài thay vì chấm điểm hết
+            rows = self._ngrams.candidates(query_folded, max_dense=RANK_SCAN_MIN_CANDIDATES)
+            if rows is not None and len(rows) <= RANK_VERIFY_MAX_CANDIDATES:
+                rows = [i for i in rows if (mask is None or mask[i]) and query_folded in folded[i]]
+            if rows is None or len(rows) > RANK_SCAN_MIN_CANDIDATES:
+                return self._top_by_length(query_folded, mask, limit)
+        else:
+            rows = self.matching_rows(query_folded, mask)
+
+        matches_with_scores = []
+        for i in rows:
+            score = match_score(folded[i], query_folded)
+            if score > 0:
+                matches_with_scores.append((i, score))
+
+        if limit is not None:
+            return [i for i, _ in heapq.nsmallest(limit, matches_with_scores, key=lambda x: (-x[1], x[0]))]
+        # sort ổn định: cùng điểm thì giữ thứ tự dòng
+        matches_with_scores.sort(key=lambda x: x[1], reverse=True)
+        return [i for i, _ in matches_with_scores]
+
+    def count(self, query, mask=None):
+        """Số dòng mà matches() trả về, không liệt kê các dòng khi không cần.
+
+        Họ tên ngắn hơn 1 + 3 * len(query) chứa query là có điểm > 0: ít dòng thì
+        đếm trên các nhóm độ dài (str.count), nhiều dòng thì đếm bit của bitset
+        dựng từ posting list của từ và cặp từ liền nhau. Họ tên dài hơn chỉ có
+        điểm > 0 khi khớp từ đầu/từ cuối, đếm bằng bisect trên các nhóm.
+        """
+        query_folded = fold_text(query)
+        if not query_folded:
+            return len(self.matches(query, mask))
+        n = len(query_folded)
+        always_positive = 1 + 3 * n
+        short = [group for length, group in self._groups.items() if n <= length < always_positive]
+        if sum(len(group.rows) for group in short) <= COUNT_SCAN_MAX_ROWS:
+            total = sum(group.count(query_folded, mask) for group in short)
+        else:
+            bits = self._containing_bits(query_folded) & self._shorter_than(always_positive)
+            if mask is not None:
+                bits &= self._mask_bits(mask)
+            total = bits.bit_count()
+
+        for length, group in self._groups.items():
+            if length < always_positive:
+                continue
+            # Điểm = điểm cộng - (length - always_positive): khớp một phần luôn <= 0
+            margin = length - always_positive
+            if margin < _BONUS_START:
+                total += group.count_starts(query_folded, mask)
+            if margin < _BONUS_END:
+                total += group.count_ends_only(query_folded, mask)
+        return total
+
+    def _containing_bits(self, query):
+        """Bitset các dòng có họ tên chứa `query`, dựng từ posting list không duyệt dòng.
+
+        Một từ: hợp posting list của các từ chứa nó. Query "a m1 ... mk b": dòng
+        phải có cặp liền nhau (x, m1) với x kết thúc bằng a, các cặp (mi, mi+1)
+        và (mk, y) với y bắt đầu bằng b (k = 0: cặp (x, y)). Khi không từ nào lặp
+        lại trong họ tên, có đủ các cặp đó nghĩa là chúng nối liền thành query;
+        các dòng có từ lặp lại thì kiểm lại bằng chuỗi.
+        """
+        tokens = query.split(' ')
+        if len(tokens) == 1:
+            return self._union(self._ngrams.token_posting(token) for token in self._tokens if query in token)
+
+        first, *middle, last = tokens
+        lo, hi = _prefix_range(self._reversed_tokens, first[::-1])
+        befores = [token[::-1] for token in islice(self._reversed_tokens, lo, hi)]
+        if not middle:
+            return self._union(self._pair_postings(befores, last))
+
+        bits = self._union(self._pairs.get(token, {}).get(middle[0]) for token in befores)
+        for token, following in zip(middle, middle[1:]):
+            bits &= self._union([self._pairs.get(token, {}).get(following)])
+        bits &= self._union(self._pair_postings([middle[-1]], last))
+        repeated = bits & self._repeated
+        if repeated:
+            nrows, folded = len(self.folded), self.folded
+            verified = [i for i in bitset_positions(repeated, nrows) if query in folded[i]]
+            bits = (bits ^ repeated) | positions_to_bitset(verified, nrows)
+        return bits
+
+    def _pair_postings(self, befores, prefix):
+        """Posting list của các cặp (x, y) liền nhau với x trong `befores`, y bắt đầu bằng `prefix`."""
+        lo, hi = _prefix_range(self._tokens, prefix)
+        for token in befores:
+            following = self._pairs.get(token)
+            if not following:
+                continue
+            if len(following) <= hi - lo:
+                yield from (posting for after, posting in following.items() if after.startswith(prefix))
+            else:
+                yield from (following[after] for after in islice(self._tokens, lo, hi) if after in following)
+
+    def _union(self, postings):
+        """Bitset hợp các posting list (array('I') hoặc bitset; bỏ qua None)."""
+        nrows = len(self.folded)
+        bits = 0
+        for posting in postings:
+            if posting is not None:
+                bits |= posting if isinstance(posting, int) else positions_to_bitset(posting, nrows)
+        return bits
+
+    def _shorter_than(self, length):
+        """Bitset các dòng có họ tên ngắn hơn `length` (giữ lại theo từng độ dài)."""
+        bits = self._shorter_bits.get(length)
+        if bits is None:
+            bits = 0
+            for group in self._groups.values():
+                if group.length < length:
+                    bits |= group.bits
+            self._shorter_bits[length] = bits
+        return bits
+
+    def _mask_bits(self, mask):
+        """Bitset của `mask`, dùng lại bitset của lần trước nếu mask không đổi."""
+        last_mask, bits = self._last_mask
+        if mask != last_mask:
+            bits = mask_to_bitset(mask, len(self.folded))
+            # Giữ bản sao bất biến: mask (bytearray) có thể bị sửa sau lần gọi này
+            self._last_mask = (bytes(mask), bits)
+        return bits
+
+    def ranked(self, query, mask=None):
+        """RankedRows của `query`: đếm và xếp hạng dần theo trang, không liệt kê hết các dòng khớp."""
+        return RankedRows(self, query, mask)
+
+    def _top_by_length(self, query, mask, limit):
+        """`limit` dòng đầu của rank(), duyệt các nhóm độ dài theo mức điểm giảm dần.
+
+        Trong nhóm độ dài L, điểm chỉ còn phụ thuộc kiểu khớp (điểm cộng b):
+        điểm = 1 + 3 * len(query) + b - L. Vì vậy mỗi mức b - L gồm các dòng khớp
+        từ đầu ở nhóm 50 - mức, khớp từ cuối ở nhóm 30 - mức và khớp một phần ở
+        nhóm -mức; các dòng cùng mức xếp theo thứ tự dòng như sort ổn định. Dừng
+        ngay khi đủ `limit` dòng.
+        """
+        n = len(query)
+        groups = self._groups
+        folded = self.folded
+
+        def kept(rows):
+            return rows if mask is None else (i for i in rows if mask[i])
+
+        def streams(level):
+            group = groups.get(_BONUS_START - level)
+            if group is not None and group.length > n:
+                yield kept(group.starts(query))
+            group = groups.get(_BONUS_END - level)
+            if group is not None and group.length > n:
+                # Khớp cả đầu lẫn cuối thì tính là khớp từ đầu
+                yield (i for i in kept(group.ends(query)) if not folded[i].startswith(query))
+            group = groups.get(-level)
+            if group is not None and group.length > n:
+                yield kept(group.contains(query))
+
+        results = []
+        if n in groups:
+            # Nhóm cùng độ dài với query: chỉ có khớp hoàn toàn
+            results += islice(kept(groups[n].starts(query)), limit)
+
+        lengths = [length for length in groups if length > n]
+        if not lengths:
+            return results
+        # Mức cao nhất: khớp từ đầu ở nhóm ngắn nhất; thấp nhất: khớp một phần ở
+        # nhóm dài nhất hoặc điểm không còn > 0
+        top = _BONUS_START - min(lengths)
+        bottom = max(-max(lengths), -3 * n)
+        for level in range(top, bottom - 1, -1):
+            if len(results) >= limit:
+                break
+            results += islice(heapq.merge(*streams(level)), limit - len(results))
+        return results
+
+    def contains_mask(self, query, mask=None):
+        """Mask các dòng có họ tên (đã chuẩn hóa) chứa `query` (đã chuẩn hóa), trong phạm vi `mask`."""
+        return mask_from_positions(self.matching_rows(fold_text(query), mask), len(self.folded))
+
+    def label(self, i, query):
+        return match_label(self.folded[i], fold_text(query))
+
+
+class _LengthGroup:
+    """Các họ tên (đã chuẩn hóa) cùng độ dài của NameIndex.
+
+    Giữ họ tên đã sắp xếp (và đảo ngược đã sắp xếp) để tìm các dòng khớp từ
+    đầu (từ cuối) bằng bisect, và chuỗi nối các họ tên theo thứ tự dòng để tìm
+    khớp một phần bằng str.find: họ tên thứ j chiếm
+    [1 + j * (length + 1), 1 + j * (length + 1) + length).
+    """
+
+    def __init__(self, folded, rows, nrows):
+        self.length = len(folded[rows[0]])
+        self.rows = rows
+        self.bits = positions_to_bitset(rows, nrows)
+        self.joined = '\n' + '\n'.join(map(folded.__getitem__, rows)) + '\n'
+        by_name = sorted(rows, key=folded.__getitem__)
+        self._names = [folded[i] for i in by_name]
+        self._name_rows = array('I', by_name)
+        reversed_names = {i: folded[i][::-1] for i in rows}
+        by_reversed = sorted(rows, key=reversed_names.__getitem__)
+        self._reversed = [reversed_names[i] for i in by_reversed]
+        self._reversed_rows = array('I', by_reversed)
+
+    def starts(self, query):
+        """Các dòng (tăng dần) có họ tên bắt đầu bằng query."""
+        lo, hi = _prefix_range(self._names, query)
+        return sorted(self._name_rows[lo:hi])
+
+    def ends(self, query):
+        """Các dòng (tăng dần) có họ tên kết thúc bằng query."""
+        lo, hi = _prefix_range(self._reversed, query[::-1])
+        return sorted(self._reversed_rows[lo:hi])
+
+    def count_starts(self, query, mask=None):
+        """Số dòng (trong `mask`) có họ tên bắt đầu bằng query."""
+        lo, hi = _prefix_range(self._names, query)
+        if mask is None:
+            return hi - lo
+        return sum(mask[i] for i in self._name_rows[lo:hi])
+
+    def count_ends_only(self, query, mask=None):
+        """Số dòng (trong `mask`) có họ tên kết thúc nhưng không bắt đầu bằng query."""
+        lo, hi = _prefix_range(self._reversed, query[::-1])
+        if not lo < hi:
+            return 0
+        if mask is not None:
+            folded_ends = zip(islice(self._reversed, lo, hi), self._reversed_rows[lo:hi])
+            return sum(mask[i] for name, i in folded_ends if not name.endswith(query[::-1]))
+        start, stop = _prefix_range(self._names, query)
+        both = sum(1 for name in islice(self._names, start, stop) if name.endswith(query))
+        return hi - lo - both
+
+    def count(self, query, mask=None):
+        """Số dòng (trong `mask`) có họ tên chứa query; không có mask thì đếm trong C bằng str.count."""
+        if mask is not None:
+            return sum(mask[i] for i in self.containing(query))
+        joined = self.joined
+        found = joined.count(query)
+        if found and self.length >= 2 * len(query):
+            # Họ tên đủ dài có thể chứa query nhiều lần: mỗi đoạn khớp từ lần đầu
+            # tới lần cuối trên cùng một dòng bị đếm dư (số lần - 1)
+            escaped = re.escape(query)
+            for repeated in re.finditer(f'{escaped}(?:[^\\n]*?{escaped})+', joined):
+                found -= repeated.group().count(query) - 1
+        return found
+
+    def containing(self, query):
+        """Các dòng (tăng dần) có họ tên chứa query."""
+        joined, rows, width = self.joined, self.rows, self.length + 1
+        pos = 0
+        while True:
+            found = joined.find(query, pos)
+            if found < 0:
+                return
+            j = (found - 1) // width
+            yield rows[j]
+            pos = (j + 1) * width
+
+    def contains(self, query):
+        """Các dòng (tăng dần) chứa query nhưng không ở đầu hay cuối họ tên."""
+        joined, rows, width = self.joined, self.rows, self.length + 1
+        end = self.length - len(query)
+        pos = 0
+        while True:
+            found = joined.find(query, pos)
+            if found < 0:
+                return
+            j, column = divmod(found - 1, width)
+            pos = (j + 1) * width
+            # find trả về vị trí khớp đầu tiên trên dòng: column 0 là khớp từ đầu,
+            # column == end là chỉ khớp ở cuối; còn lại vẫn có thể khớp thêm ở cuối
+            if 0 < column < end and not joined.startswith(query, pos - len(query)):
+                yield rows[j]
+
+
+class RankedRows(Sequence):
+    """Kết quả tìm theo tên cho phân trang, mọi phần chỉ tính khi cần.
+
+    len() đếm qua NameIndex.count; lấy lát cắt [start:stop] chỉ xếp hạng `stop`
+    dòng đầu qua NameIndex.rank(limit=...) và giữ lại phần đã xếp cho các trang
+    trước đó; `rows` (mọi dòng khớp theo thứ tự dòng, cho thống kê) chỉ liệt kê
+    khi được đọc.
+    """
+
+    def __init__(self, names, query, mask=None):
+        self._names = names
+        self._query = query
+        self._mask = mask
+        self._count = None
+        self._rows = None
+        self._top = []
+
+    @property
+    def rows(self):
+        if self._rows is None:
+            self._rows = array('I', self._names.matches(self._query, self._mask))
+        return self._rows
+
+    def __len__(self):
+        if self._count is None:
+            if self._rows is not None:
+                self._count = len(self._rows)
+            else:
+                self._count = self._names.count(self._query, self._mask)
+        return self._count
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            stop = key.indices(len(self))[1]
+        else:
+            key = range(len(self))[key]
+            stop = key + 1
+        if stop > len(self._top):
+            # Lấy rộng gấp đôi để lật trang tiếp không phải xếp hạng lại
+            self._top = self._names.rank(self._query, self._mask, limit=max(stop, 2 * len(self._top)))
+        return self._top[key]
+
+
+class IdIndex:
+    """Chỉ mục mã SV (so khớp không phân biệt hoa thường).
+
+    - dict mã -> dòng cho khớp hoàn toàn (O(1)),
+    - list mã đã sắp xếp cho khớp từ đầu bằng bisect,
+    - chỉ mục trigram cho khớp một phần ở giữa mã.
+    """
+
+    def __init__(self, ids):
+        self.normalized = [ma_sv.lower() for ma_sv in ids]
+        self.max_length = max(map(len, self.normalized), default=0)
+
+        self._exact = {}
+        for i, ma_sv in enumerate(self.normalized):
+            rows = self._exact.get(ma_sv)
+            if rows is None:
+                rows = self._exact[ma_sv] = array('I')
+            rows.append(i)
+
+        order = sorted(range(len(self.normalized)), key=self.normalized.__getitem__)
+        self._sorted_ids = [self.normalized[i] for i in order]
+        self._sorted_rows = array('I', order)
+        self._ngrams = NgramIndex(self.normalized)
+
+    def prefix_rows(self, prefix):
+        """Các dòng có mã bắt đầu bằng `prefix`, theo thứ tự mã."""
+        prefix = prefix.lower()
+        lo = bisect_left(self._sorted_ids, prefix)
+        hi = bisect_left(self._sorted_ids, prefix + chr(0x10FFFF), lo)
+        return self._sorted_rows[lo:hi]
+
+    def lookup(self, term, mask=None):
+        """Các dòng (tăng dần, tức thứ tự dữ liệu) có mã SV chứa `term`.
+
+        Mã nhập đủ độ dài chỉ có thể khớp hoàn toàn nên chỉ cần tra dict.
+        """
+        term = term.lower()
+        rows = list(self._exact.get(term, ()))
+        if len(term) < self.max_length:
+            normalized = self.normalized
+            rows += [i for i in self.prefix_rows(term) if normalized[i] != term]
+            rows += [i for i in self._ngrams.matching_rows(term) if not normalized[i].startswith(term)]
+            rows.sort()
+        if mask is not None:
+            rows = [i for i in rows if mask[i]]
+        return rows
+
+    def mask(self, term, mask=None):
+        """Mask các dòng có mã SV chứa `term`, trong phạm vi `mask`."""
+        return mask_from_positions(self.lookup(term, mask), len(self.normalized))
+
+
+class CategoryIndex:
+    """Bitset dựng sẵn cho từng giá trị của các cột phân loại (Khóa, Học kỳ, ...).
+
+    Mỗi giá trị giữ một bitset (int, một bit mỗi dòng) thay vì mask một byte mỗi
+    dòng; chỉ chuyển thành mask khi được lấy ra để AND với các bộ lọc khác.
+    """
+
+    def __init__(self, table, columns=CATEGORY_INDEX_COLUMNS):
+        self.nrows = len(table)
+        self._bits = {}
+        for name in columns:
+            if name in table.categories:
+                self._bits[name] = {
+                    value: mask_to_bitset(table.equals_mask(name, value), self.nrows)
+                    for value in table.categories[name]
+                }
+
+    def mask(self, name, value, strip=False):
+        """Mask các dòng có cột `name` bằng `value` (so sánh sau khi strip nếu strip=True)."""
+        bitsets = self._bits.get(name, {})
+        if not strip:
+            bits = bitsets.get(value, 0)
+        else:
+            bits = 0
+            for v, b in bitsets.items():
+                if v.strip() == value:
+                    bits |= b
+        return bitset_to_mask(bits, self.nrows)
+
+
+class NumberIndex:
+    """Chỉ mục một cột số: giá trị đã sắp xếp kèm chỉ số dòng, tra khoảng bằng bisect.
+
+    Ô trống (NaN) không nằm trong list đã sắp xếp mà giữ riêng; mỗi truy vấn
+    chọn giữ hay bỏ các dòng đó. Chỉ các khoảng cố định (xếp loại, TC học/thi
+    lại) được cache, vì chúng lặp lại qua mỗi rerun và chỉ có vài khoảng; khoảng
+    từ thanh trượt thì gần như mỗi lần một khác nên không giữ lại.
+    """
+
+    def __init__(self, column):
+        self.nrows = len(column)
+        order = sorted((i for i, v in enumerate(column) if v == v), key=column.__getitem__)
+        self.order = array('I', order)
+        self.values = array('d', (column[i] for i in order))
+        self.missing = array('I', (i for i, v in enumerate(column) if v != v))
+        self._cache = {}
+
+    @property
+    def min(self):
+        return self.values[0] if self.values else None
+
+    @property
+    def max(self):
+        return self.values[-1] if self.values else None
+
+    def first_above(self, x):
+        """Giá trị nhỏ nhất lớn hơn x, None nếu không có."""
+        i = bisect_right(self.values, x)
+        return self.values[i] if i < len(self.values) else None
+
+    def mask(self, lo=None, hi=None, lo_inclusive=True, hi_inclusive=True, keep_missing=False, cache=False):
+        """Mask các dòng có giá trị trong khoảng [lo, hi] (đầu mở tùy chọn).
+
+        None nghĩa là không giới hạn phía đó; trả về None (không cần lọc) nếu
+        khoảng bao hết mọi dòng. cache=True chỉ dùng cho các khoảng cố định.
+        """
+        key = (lo, hi, lo_inclusive, hi_inclusive, keep_missing)
+        if cache and key in self._cache:
+            return self._cache[key]
+
+        values = self.values
+        if lo is None:
+            start = 0
+        else:
+            start = (bisect_left if lo_inclusive else bisect_right)(values, lo)
+        if hi is None:
+            stop = len(values)
+        else:
+            stop = (bisect_right if hi_inclusive else bisect_left)(values, hi)
+        stop = max(start, stop)
+
+        missing = self.missing if keep_missing else ()
+        selected = stop - start + len(missing)
+        if selected == self.nrows:
+            result = None
+        elif selected <= self.nrows // 2:
+            result = bytes(mask_from_positions(chain(self.order[start:stop], missing), self.nrows))
+        else:
+            # Nhiều dòng được chọn: đánh dấu các dòng bị loại rồi đảo mask
+            excluded = chain(self.order[:start], self.order[stop:], () if keep_missing else self.missing)
+            result = bytes(mask_invert(mask_from_positions(excluded, self.nrows)))
+
+        if cache:
+            self._cache[key] = result
+        return result
+
+
+class FilterPlan:
+    """Kế hoạch lọc của một rerun.
+
+    Chỉ các bộ lọc đang bật được thêm vào. Các mask có sẵn từ chỉ mục chạy
+    trước, theo thứ tự chọn lọc nhất (ít dòng khớp nhất) trước; các bước tốn
+    kém (tìm kiếm chuỗi) chạy sau, chỉ trên các dòng còn lại. Mọi mask được
+    AND trên một số nguyên duy nhất, và số dòng bị loại ở mỗi bước được ghi
+    lại để xem qua explain().
+    """
+
+    def __init__(self, nrows):
+        self.nrows = nrows
+        self._masks = []
+        self._deferred = []
+        self._report = []
+
+    def add(self, label, mask):
+        """Thêm một mask có sẵn; mask None (không lọc) bị bỏ qua."""
+        if mask is not None:
+            self._masks.append((label, mask, mask.count(1)))
+
+    def add_deferred(self, label, build):
+        """Thêm bước tính mask `build(mask_hiện_tại)` sau các mask có sẵn."""
+        self._deferred.append((label, build))
+
+    def execute(self):
+        """Chạy kế hoạch, trả về mask kết quả (None nếu không có bộ lọc nào)."""
+        self._report = []
+        if not self._masks and not self._deferred:
+            return None
+
+        nbytes = self.nrows
+        current = int.from_bytes(b'\x01' * nbytes, 'little')
+        kept = self.nrows
+        steps = sorted(self._masks, key=lambda step: step[2])
+        steps += [(label, build, None) for label, build in self._deferred]
+        for label, mask, _ in steps:
+            if kept == 0:
+                self._report.append({'Bước': label, 'Còn lại': 0, 'Bị loại': 0, 'Ghi chú': 'bỏ qua'})
+                continue
+            if callable(mask):
+                mask = mask(current.to_bytes(nbytes, 'little'))
+            current &= int.from_bytes(mask, 'little')
+            # Mỗi dòng là một byte 0/1 nên số bit 1 chính là số dòng còn lại
+            remaining = current.bit_count()
+            self._report.append({'Bước': label, 'Còn lại': remaining, 'Bị loại': kept - remaining, 'Ghi chú': ''})
+            kept = remaining
+        return bytearray(current.to_bytes(nbytes, 'little'))
+
+    def explain(self):
+        """Các bước đã chạy theo thứ tự, kèm số dòng còn lại và bị loại."""
+        return list(self._report)
+
+
+class SearchIndex:
+    """Các chỉ mục tìm kiếm của một ColumnarTable."""
+
+    def __init__(self, table):
+        self.table = table
+        self.names = NameIndex(table.columns.get('Họ và tên') or [''] * len(table))
+        self.ids = IdIndex(table.columns.get('Mã SV') or [''] * len(table))
+        self.categories = CategoryIndex(table)
+        self.numbers = {
+            name: NumberIndex(table.columns[name])
+            for name in NUMBER_COLUMNS if name in table.columns
+        }
+        self.cube = self._load_cube(table)
+
+    def _load_cube(self, table):
+        """Cube tính sẵn trong file .cols nếu khớp với bảng, không thì duyệt bảng một lần.
+
+        Cube lưu sẵn chỉ được dùng khi tổng của nó trùng với thống kê của cả cột
+        điểm lấy từ NumberIndex (số dòng, số điểm hợp lệ, min/max, từng ngưỡng,
+        histogram và tổng) và số dòng theo từng giá trị của Học kỳ/Khóa/Môn học
+        trùng với bảng, tức là không lệch với dữ liệu thật đang phục vụ.
+        """
+        if table.stats:
+            try:
+                cube = ScoreCube.from_dict(table.stats)
+            except (KeyError, TypeError, ValueError):
+                cube = None
+            if (cube is not None and cube.total().agrees_with(self._column_stats(table))
+                    and all(dict(cube.counts(name)) == table.category_counts(name)
+                            for name in GROUP_COLUMNS if name in table.categories)):
+                return cube
+        return ScoreCube.from_table(table)
+
+    def _column_stats(self, table):
+        """ScoreAccumulator của cả cột điểm, tính từ list đã sắp xếp của NumberIndex."""
+        scores = self.numbers.get(SCORE_COLUMN)
+        return ScoreAccumulator.from_sorted(scores.values if scores else [], len(table))
+
+    def selection_stats(self, groups, positions=None):
+        """ScoreAccumulator của các dòng đang chọn.
+
+        groups: {cột trong GROUP_COLUMNS: giá trị} của các bộ lọc Học kỳ/Khóa/Môn học.
+        positions: các dòng khớp khi còn bộ lọc khác (điểm, chuỗi, cột ngoài cube),
+        khi đó duyệt điểm của đúng các dòng này; None nghĩa là chỉ lọc theo
+        `groups`, gộp thẳng các ô của cube mà không chạm tới dữ liệu.
+        """
+        if positions is None:
+            return self.cube.select(groups)
+        scores = self.table.columns.get(SCORE_COLUMN) or [math.nan] * len(self.table)
+        return ScoreAccumulator().add_many(map(scores.__getitem__, positions))
+
+    def number_mask(self, name, **bounds):
+        """Mask theo khoảng giá trị của cột số (xem NumberIndex.mask); None nếu không cần lọc."""
+        if name not in self.numbers:
+            return None
+        return self.numbers[name].mask(**bounds)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""Giữ bản dữ liệu (snapshot) đang phục vụ và thay bằng bản mới ở nền.
+
+Snapshot là bộ (khóa, dữ liệu, chỉ mục, lỗi) không đổi sau khi dựng. Khi file
+dữ liệu đổi, bản mới được dựng trong một thread riêng; các session vẫn dùng bản
+cũ cho tới khi bản mới xong, rồi `current` được gán sang bản mới trong một phép
+gán duy nhất. Mỗi lần chạy script chỉ lấy snapshot một lần ở đầu nên không bao
+giờ thấy nửa cũ nửa mới.
+"""
+import threading
+import time
+from collections import namedtuple
+
+Snapshot = namedtuple('Snapshot', 'signature data index error loaded_at')
+
+
+class SnapshotStore:
+    """Snapshot dùng chung cho cả process.
+
+    signature_fn(): khóa của dữ liệu trên đĩa (vd. đường dẫn, mtime, kích thước).
+    build_fn(signature): dựng (data, index, error) cho khóa đó.
+    poll_interval: nếu có, một thread nền kiểm tra khóa sau mỗi chừng đó giây để
+    dựng bản mới ngay cả khi không có ai truy cập.
+    """
+
+    def __init__(self, signature_fn, build_fn, poll_interval=None):
+        self._signature_fn = signature_fn
+        self._build_fn = build_fn
+        self._current = None
+        self._build_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._building = None
+        self._failed_signature = None
+        # Đếm số lần dựng đã xong (kể cả lỗi) và khóa của lần gần nhất: thread chờ
+        # khóa dựng biết có thread khác vừa dựng đúng khóa đó hay chưa
+        self._generation = 0
+        self._last_signature = None
+        self.last_error = None
+
+        if poll_interval:
+            watcher = threading.Thread(target=self._watch, args=(poll_interval,),
+                                       name='snapshot-watcher', daemon=True)
+            watcher.start()
+
+    @property
+    def current(self):
+        return self._current
+
+    @property
+    def building(self):
+        """Đang dựng bản mới ở nền hay không."""
+        return self._building is not None
+
+    def get(self):
+        """Snapshot để phục vụ lần chạy này.
+
+        Lần đầu (hoặc khi bản hiện tại chỉ có lỗi) dựng ngay và chờ; nhiều session
+        vào cùng lúc thì chỉ một session dựng, các session khác chờ rồi dùng luôn
+        bản đó. Còn lại trả bản hiện tại, và nếu dữ liệu trên đĩa đã đổi thì bắt
+        đầu dựng bản mới ở nền (mỗi lúc chỉ một lần dựng nền).
+        """
+        current = self._current
+        if current is None or current.data is None:
+            return self.reload()
+        if self._is_stale(current, self._signature_fn()):
+            self._start_build()
+        return current
+
+    def reload(self, wait=True):
+        """Dựng lại từ dữ liệu trên đĩa (kể cả khi khóa không đổi).
+
+        wait=True: dựng trong thread gọi và trả snapshot mới; các session khác vẫn
+        dùng bản cũ trong lúc đó. Nếu đang có lần dựng cùng khóa thì chờ và dùng
+        kết quả của lần đó. wait=False: dựng ở nền, trả bản hiện tại.
+        """
+        if not wait:
+            self._start_build()
+            return self._current
+        return self._build(self._signature_fn())
+
+    def _is_stale(self, current, signature):
+        return signature != current.signature and signature != self._failed_signature
+
+    def _start_build(self):
+        with self._state_lock:
+            if self._building is not None:
+                return
+            self._building = True
+        threading.Thread(target=self._build_in_background, name='snapshot-build', daemon=True).start()
+
+    def _build_in_background(self):
+        try:
+            self._build(self._signature_fn())
+        finally:
+            self._building = None
+
+    def _build(self, signature):
+        seen = self._generation
+        with self._build_lock:
+            if self._generation != seen and self._last_signature == signature:
+                # Trong lúc chờ khóa, thread khác đã dựng xong đúng khóa này: dùng luôn
+                return self._current
+            try:
+                data, index, error = self._build_fn(signature)
+            except Exception as e:
+                data, index, error = None, None, f"Lỗi: {str(e)}"
+            snapshot = Snapshot(signature, data, index, error, time.time())
+            self._generation += 1
+            self._last_signature = signature
+
+            current = self._current
+            if error and current is not None and current.data is not None:
+                # Bản mới lỗi: giữ bản cũ đang chạy tốt, không dựng lại khóa này nữa
+                self._failed_signature = signature
+                self.last_error = error
+                return current
+
+            self._failed_signature = None
+            self.last_error = error
+            self._current = snapshot
+            return snapshot
+
+    def _watch(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                current = self._current
+                if current is not None and self._is_stale(current, self._signature_fn()):
+                    self._start_build()
+            except Exception:
+                # Thread nền không được chết vì một lần stat lỗi
+                pass
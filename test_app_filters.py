@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""Chạy app bằng Streamlit AppTest với các tổ hợp tìm kiếm/lọc thường gặp.
+
+Số kết quả và trang kết quả đầu tiên phải giống cách duyệt từng bản ghi của bản
+cũ (xếp hạng theo match_score, lọc bằng list comprehension) trên cùng file
+output_direct.xlsx.
+
+Chạy từ thư mục gốc:  python -m pytest -q test_app_filters.py
+"""
+from pathlib import Path
+
+import pytest
+
+from app import DEFAULT_PAGE_SIZE
+from data_store import load_table
+from search_index import fold_text, match_score
+from test_filters import SCORE_STATUS_RULES, TC_LAI_RULES
+
+ROOT = Path(__file__).resolve().parent
+EXCEL_PATH = ROOT / 'data_diem_dhnn' / 'processing' / 'output_direct.xlsx'
+
+pytestmark = pytest.mark.skipif(not EXCEL_PATH.exists(), reason='chưa có output_direct.xlsx')
+
+SCENARIOS = [
+    dict(),
+    dict(name='nguyen'),
+    dict(name='Lê Thị', khoa='K20'),
+    dict(ma='23f75', status='Đạt (≥ 2.0)'),
+    dict(hk='ĐIỂM HK2 24-25', status='Không đạt (< 2.0)'),
+    dict(t3name='thi hoa'),
+    dict(t3ma='22F', t3status='Giỏi (3.2-3.59)'),
+    dict(t3tclai='Có TC lại (> 0)'),
+    dict(score=(2.0, 3.0)),
+    dict(t3status='Xuất sắc (≥ 3.6)', t3tclai='Không có TC lại (= 0)'),
+]
+
+
+@pytest.fixture(scope='module')
+def records():
+    table = load_table(EXCEL_PATH)
+    return [dict(zip(table.headers, row)) for row in table.iter_tuples()]
+
+
+def run_app(monkeypatch, name='', ma='', khoa=None, hk=None, status=None,
+            t3name='', t3ma='', t3status=None, t3tclai=None, score=None):
+    from streamlit.testing.v1 import AppTest
+
+    monkeypatch.chdir(ROOT)
+    at = AppTest.from_file(str(ROOT / 'app.py'), default_timeout=300)
+    at.run()
+    if name:
+        at.text_input[0].input(name)
+    if ma:
+        at.text_input[1].input(ma)
+    if khoa:
+        at.selectbox(key='quick_khoa').select(khoa)
+    if hk:
+        at.selectbox(key='quick_hk').select(hk)
+    if status:
+        at.selectbox(key='quick_status').select(status)
+    if t3name:
+        at.text_input[2].input(t3name)
+    if t3ma:
+        at.text_input[3].input(t3ma)
+    if t3status:
+        [s for s in at.selectbox if s.label == 'Trạng thái:' and s.key != 'quick_status'][0].select(t3status)
+    if t3tclai:
+        [s for s in at.selectbox if s.label == 'TC học/thi lại:'][0].select(t3tclai)
+    if score:
+        [s for s in at.slider if s.label == 'Khoảng điểm:'][0].set_range(*score)
+    at.run()
+    assert not at.exception
+    return at
+
+
+def quick_search(records, name='', ma='', khoa=None, hk=None, status=None, **_):
+    """Tìm kiếm nhanh như bản cũ: xếp hạng theo tên rồi lọc tiếp, giữ thứ tự."""
+    rows = list(range(len(records)))
+    if name:
+        query = fold_text(name)
+        scored = [(i, match_score(fold_text(records[i]['Họ và tên']), query)) for i in rows]
+        rows = [i for i, s in sorted(scored, key=lambda x: x[1], reverse=True) if s > 0]
+    if ma:
+        term = ma.lower()
+        rows = [i for i in rows if term in records[i]['Mã SV'].lower()]
+    if khoa:
+        rows = [i for i in rows if records[i]['Khóa'] == khoa]
+    if hk:
+        rows = [i for i in rows if records[i]['Học kỳ'] == hk]
+    if status:
+        # Điểm không đọc được thì bị loại
+        rows = [i for i in rows if records[i]['Điểm TBTL'] is not None
+                and SCORE_STATUS_RULES[status](records[i]['Điểm TBTL'])]
+    return rows
+
+
+def data_tab(records, t3name='', t3ma='', t3status=None, t3tclai=None, score=None, **_):
+    """Tab dữ liệu như bản cũ: ô số không đọc được thì bỏ qua bộ lọc số."""
+    def keep(r):
+        s, tc = r['Điểm TBTL'], r['Số TC học/thi lại']
+        return (fold_text(t3name) in fold_text(r['Họ và tên'])
+                and t3ma.lower() in r['Mã SV'].lower()
+                and (not score or s is None or score[0] <= s <= score[1])
+                and (not t3status or s is None or SCORE_STATUS_RULES[t3status](s))
+                and (not t3tclai or tc is None or TC_LAI_RULES[t3tclai](tc)))
+    return [i for i, r in enumerate(records) if keep(r)]
+
+
+@pytest.mark.parametrize('scenario', SCENARIOS, ids=lambda s: ','.join(s) or 'default')
+def test_app_matches_record_scan(monkeypatch, records, scenario):
+    at = run_app(monkeypatch, **scenario)
+
+    expected = quick_search(records, **scenario)
+    assert [s.value for s in at.success if 'Tìm thấy' in s.value] == [
+        f'Tìm thấy **{len(expected):,}** kết quả phù hợp']
+    labels = [e.label for e in at.expander if e.label.startswith('#')]
+    page = expected[:DEFAULT_PAGE_SIZE]
+    assert len(labels) == len(page)
+    for n, (label, i) in enumerate(zip(labels, page), 1):
+        assert label.startswith(f"#{n}: {records[i]['Họ và tên']} - {records[i]['Mã SV']}"), label
+
+    expected = data_tab(records, **scenario)
+    assert [i.value for i in at.info if 'Tìm thấy' in i.value] == [
+        f'Tìm thấy {len(expected):,} / {len(records):,} bản ghi']
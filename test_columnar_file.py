@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""Kiểm tra file .cols: đọc lại đúng bảng đã ghi, ghi từng dòng cho ra cùng file;
+bảng Arrow (to_arrow) có cùng các dòng như RowView, với bảng đọc từ xlsx và từ .cols.
+
+Chạy từ thư mục gốc:  python -m pytest -q test_columnar_file.py
+"""
+import math
+from pathlib import Path
+
+import pytest
+
+import columnar_file
+from columnar_file import ColumnarWriter, load_columnar, save_columnar
+from data_store import StringColumn, TableBuilder, load_table
+
+ROOT = Path(__file__).resolve().parent
+EXCEL_PATH = ROOT / 'data_diem_dhnn' / 'processing' / 'output_direct.xlsx'
+
+HEADERS = ['STT', 'Mã SV', 'Họ và tên', 'Điểm TBTL', 'Khóa', 'Môn học']
+ROWS = [
+    (1, '23F7510001', 'Nguyễn Văn A', 3.5, 'K20', 'Tiếng Anh'),
+    (2, '23F7510002', 'Lê "Thị" B, C', None, 'K21', 'Tiếng Pháp'),
+    (None, '23F7510003', '', 1.25, 'K20', 'Tiếng Anh'),
+    (4, '23f7510004', 'Trần\nĐ', 0.0, '', 'Tiếng Nhật'),
+] * 5
+STATS = [[['HK1', 'K20', 'Tiếng Anh'], {'rows': 2}]]
+
+
+def build(rows):
+    builder = TableBuilder(HEADERS)
+    for values in rows:
+        builder.append(values)
+    return builder.build()
+
+
+def normalized(rows):
+    """None của cột số đọc lại thành NaN: so sánh bằng chuỗi để NaN == NaN."""
+    return [tuple('nan' if isinstance(v, float) and math.isnan(v) else v for v in row) for row in rows]
+
+
+@pytest.mark.parametrize('rows', [ROWS, []])
+def test_round_trip(tmp_path, rows):
+    table = build(rows)
+    save_columnar(table, tmp_path / 'out.cols', STATS)
+    loaded = load_columnar(tmp_path / 'out.cols')
+    assert loaded.headers == HEADERS and len(loaded) == len(rows)
+    assert normalized(loaded.iter_tuples()) == normalized(table.iter_tuples())
+    assert loaded.categories == table.categories
+    assert loaded.stats == STATS
+
+
+@pytest.mark.parametrize('source', ['memory', 'mmap'])
+def test_string_column(tmp_path, source):
+    table = build(ROWS)
+    if source == 'mmap':
+        save_columnar(table, tmp_path / 'out.cols')
+        table = load_columnar(tmp_path / 'out.cols')
+    names = [row[2] for row in ROWS]
+    column = table.columns['Họ và tên']
+    assert isinstance(column, StringColumn)
+    assert list(column) == names and len(column) == len(names)
+    assert [column[i] for i in range(-len(names), len(names))] == names + names
+    assert column[3:9:2] == names[3:9:2]
+    with pytest.raises(IndexError):
+        column[len(names)]
+
+
+@pytest.mark.parametrize('source', ['built', 'xlsx', 'cols'])
+def test_to_arrow_matches_rows(tmp_path, source):
+    if source == 'built':
+        table = build(ROWS)
+    else:
+        if not EXCEL_PATH.exists():
+            pytest.skip('chưa có output_direct.xlsx')
+        table = load_table(EXCEL_PATH)
+        if source == 'cols':
+            save_columnar(table, tmp_path / 'out.cols')
+            table = load_columnar(tmp_path / 'out.cols')
+    n = len(table)
+    for positions in [None, [], [n - 1, 0, n // 2, 0], list(range(1, n, 7))]:
+        expected = [row.to_dict() for row in table.rows(range(n) if positions is None else positions)]
+        arrow = table.to_arrow(positions)
+        assert arrow.column_names == table.headers
+        assert arrow.to_pylist() == expected
+
+
+@pytest.mark.parametrize('flush_rows', [1, 3, 8192])
+@pytest.mark.parametrize('rows', [ROWS, []])
+def test_writer_matches_save_columnar(tmp_path, monkeypatch, flush_rows, rows):
+    monkeypatch.setattr(columnar_file.ColumnarWriter, 'FLUSH_ROWS', flush_rows)
+    writer = ColumnarWriter(tmp_path / 'streamed.cols', HEADERS)
+    for values in rows:
+        writer.append(values)
+    writer.close(STATS)
+    save_columnar(build(rows), tmp_path / 'built.cols', STATS)
+    assert (tmp_path / 'streamed.cols').read_bytes() == (tmp_path / 'built.cols').read_bytes()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['built.cols', 'streamed.cols']
+
+
+def test_discarded_writer_leaves_no_file(tmp_path):
+    writer = ColumnarWriter(tmp_path / 'out.cols', HEADERS)
+    writer.append(ROWS[0])
+    writer.discard()
+    assert not list(tmp_path.iterdir())
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""Kiểm tra xuất CSV: nội dung khớp csv.writer và đường tải thật qua st.download_button
+(cả nút tải thống kê JSON).
+
+Chạy từ thư mục gốc:  python -m pytest -q test_csv_export.py
+"""
+import csv
+import gzip
+import io
+import json
+from pathlib import Path
+
+import pytest
+
+from csv_export import export_csv, export_csv_bytes
+from data_store import ColumnarTable, TableBuilder, load_table, mask_positions
+from search_index import SearchIndex
+
+ROOT = Path(__file__).resolve().parent
+EXCEL_PATH = ROOT / 'data_diem_dhnn' / 'processing' / 'output_direct.xlsx'
+
+
+def small_table():
+    headers = ['Mã SV', 'Họ và tên', 'Điểm TBTL', 'STT', 'Khóa']
+    builder = TableBuilder(headers)
+    builder.append(('23F7510001', 'Nguyễn Văn A', 3.5, 1, 'K20'))
+    builder.append(('23F7510002', 'Lê "Thị" B, C', None, 2, 'K21'))
+    builder.append(('23F7510003', 'Trần\nD', 1.25, None, 'K20'))
+    return builder.build()
+
+
+def reference_csv(table, positions=None):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(table.headers)
+    writer.writerows(table.iter_tuples(positions))
+    return buffer.getvalue().encode('utf-8')
+
+
+@pytest.mark.parametrize('positions', [None, [2, 0], []])
+@pytest.mark.parametrize('chunk_rows', [1, 2, 5000])
+def test_export_matches_csv_writer(positions, chunk_rows):
+    table = small_table()
+    expected = reference_csv(table, positions)
+    assert export_csv_bytes(table, positions, compress=False, chunk_rows=chunk_rows) == expected
+    assert gzip.decompress(export_csv_bytes(table, positions, chunk_rows=chunk_rows)) == expected
+
+
+def test_export_empty_table():
+    assert export_csv_bytes(ColumnarTable.empty(), compress=False) == b'\r\n'
+
+
+def test_export_csv_file_is_rewound():
+    with export_csv(small_table(), compress=False) as f:
+        assert f.read() == reference_csv(small_table())
+
+
+@pytest.mark.parametrize('compress', [True, False])
+def test_bytes_accepted_by_download_button(compress):
+    from streamlit.elements.widgets.button import convert_data_to_bytes_and_infer_mime
+
+    table = small_table()
+    data, _ = convert_data_to_bytes_and_infer_mime(
+        export_csv_bytes(table, compress=compress), unsupported_error=TypeError('unsupported'))
+    assert (gzip.decompress(data) if compress else data) == reference_csv(table)
+
+
+def run_app_and_download(monkeypatch, index, setup=None):
+    """Chạy app rồi bấm nút tải thứ `index`: chạy callable của download_button như Streamlit làm."""
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.testing.v1 import AppTest, app_test
+
+    managers = []
+
+    class RecordingMediaFileManager(MediaFileManager):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            managers.append(self)
+
+    monkeypatch.setattr(app_test, 'MediaFileManager', RecordingMediaFileManager)
+    monkeypatch.chdir(ROOT)
+
+    at = AppTest.from_file(str(ROOT / 'app.py'), default_timeout=300)
+    at.run()
+    if setup:
+        setup(at)
+        at.run()
+    assert not at.exception
+
+    button = at.get('download_button')[index].proto
+    manager = managers[-1]
+    url = manager.execute_deferred(button.deferred_file_id)
+    file_id = url.rsplit('/', 1)[-1].split('.', 1)[0]
+    return manager._storage.get_file(file_id).content
+
+
+@pytest.mark.skipif(not EXCEL_PATH.exists(), reason='chưa có output_direct.xlsx')
+def test_app_download_button(monkeypatch):
+    content = run_app_and_download(monkeypatch, 0, lambda at: at.text_input[2].input('thi hoa'))
+
+    # Cùng bộ lọc trên bảng đọc trực tiếp: đúng các dòng đó, đúng thứ tự
+    table = load_table(EXCEL_PATH)
+    positions = list(mask_positions(SearchIndex(table).names.contains_mask('thi hoa')))
+    assert positions
+    assert gzip.decompress(content) == reference_csv(table, positions)
+
+
+@pytest.mark.skipif(not EXCEL_PATH.exists(), reason='chưa có output_direct.xlsx')
+def test_app_statistics_download(monkeypatch):
+    """Thống kê JSON được tải về trình duyệt, không ghi statistics.json trên server."""
+    stats_path = EXCEL_PATH.with_name('statistics.json')
+    existed = stats_path.exists()
+    content = run_app_and_download(monkeypatch, 1)
+    exported = json.loads(content)
+    index = SearchIndex(load_table(EXCEL_PATH))
+    assert exported['total_records'] == len(index.table)
+    assert len(exported['by_group']) == len(index.cube.cells)
+    assert sum(group['records'] for group in exported['by_group']) == len(index.table)
+    assert stats_path.exists() == existed
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""Các chỉ mục lọc cho cùng kết quả với cách duyệt từng dòng cũ của app.
+
+Mỗi bộ lọc (mã SV, trạng thái, TC học/thi lại, khoảng số, kế hoạch lọc của tab
+dữ liệu, thống kê từ cube) được so với phép duyệt từng bản ghi như bản trước
+khi có chỉ mục, trên bảng sinh ngẫu nhiên (có ô trống) và trên output_direct.xlsx.
+
+Chạy từ thư mục gốc:  python -m pytest -q test_filters.py
+"""
+import math
+import random
+from itertools import product
+from pathlib import Path
+
+import pytest
+
+from app import SCORE_STATUS_FILTERS, TC_LAI_FILTERS
+from data_store import TableBuilder, load_table, mask_positions
+from score_stats import GROUP_COLUMNS, PASS_SCORE, SCORE_MAX, SCORE_MIN
+from search_index import FilterPlan, SearchIndex, fold_text
+
+ROOT = Path(__file__).resolve().parent
+EXCEL_PATH = ROOT / 'data_diem_dhnn' / 'processing' / 'output_direct.xlsx'
+
+HEADERS = ['STT', 'Mã SV', 'Họ và tên', 'Tổng số tín chỉ', 'Điểm TBTL', 'Số TC học/thi lại',
+           'Xếp loại học tập', 'Năm học', 'Học kỳ', 'Khóa', 'Môn học']
+
+# Điều kiện của bản cũ (matches_advanced_filters), viết lại trên điểm đã chuyển kiểu
+SCORE_STATUS_RULES = {
+    'Đạt (≥ 2.0)': lambda s: s >= 2.0,
+    'Không đạt (< 2.0)': lambda s: s < 2.0,
+    'Xuất sắc (≥ 3.6)': lambda s: s >= 3.6,
+    'Giỏi (3.2-3.59)': lambda s: 3.2 <= s < 3.6,
+    'Khá (2.5-3.19)': lambda s: 2.5 <= s < 3.2,
+    'Trung bình (2.0-2.49)': lambda s: 2.0 <= s < 2.5,
+}
+TC_LAI_RULES = {
+    'Không có TC lại (= 0)': lambda tc: tc == 0,
+    'Có TC lại (> 0)': lambda tc: tc > 0,
+    'TC lại nhiều (≥ 10)': lambda tc: tc >= 10,
+}
+
+
+def random_table(nrows=3000, seed=11):
+    """Bảng ngẫu nhiên đủ các cột lọc; khoảng 5% ô số trống, xếp loại có khoảng trắng thừa."""
+    rng = random.Random(seed)
+
+    def maybe(value):
+        return None if rng.random() < 0.05 else value
+
+    builder = TableBuilder(HEADERS)
+    for i in range(nrows):
+        builder.append((
+            i + 1,
+            f'{rng.choice(["22F", "23f", "24F"])}75{rng.randrange(10000, 10400)}',
+            rng.choice(['Nguyễn Thị Hoa', 'Lê Văn An', 'Trần Thị Hòa', 'Phạm Minh Anh']),
+            maybe(rng.randrange(10, 40)),
+            maybe(round(rng.uniform(0, 4), 2)),
+            maybe(rng.choice([0, 0, 0, 2, 5, 10, 14])),
+            rng.choice(['Giỏi', 'Khá ', 'Trung bình', ' Yếu']),
+            rng.choice(['2023-2024', '2024-2025 ']),
+            rng.choice(['ĐIỂM HK1 24-25', 'ĐIỂM HK2 24-25']),
+            rng.choice(['K19', 'K20', 'K21']),
+            rng.choice(['anhnguvan', 'sp anh', 'ngon ngu trung']),
+        ))
+    return builder.build()
+
+
+@pytest.fixture(scope='module', params=['random', 'xlsx'])
+def table(request):
+    if request.param == 'xlsx':
+        if not EXCEL_PATH.exists():
+            pytest.skip('chưa có output_direct.xlsx')
+        return load_table(EXCEL_PATH)
+    return random_table()
+
+
+@pytest.fixture(scope='module')
+def index(table):
+    return SearchIndex(table)
+
+
+@pytest.fixture(scope='module')
+def records(table):
+    """Các dòng dạng dict như bản cũ; ô số trống là None."""
+    return [dict(zip(table.headers, row)) for row in table.iter_tuples()]
+
+
+def scan(records, keep):
+    return [i for i, r in enumerate(records) if keep(r)]
+
+
+def positions(mask, nrows):
+    return list(range(nrows)) if mask is None else list(mask_positions(mask))
+
+
+def test_id_lookup_matches_substring_scan(index, records):
+    rng = random.Random(3)
+    ids = [r['Mã SV'] for r in records]
+    terms = ['22F', '23f75', 'f7510', '0', 'zzz', ids[0], ids[-1].upper()]
+    for ma_sv in rng.sample(ids, 20):
+        start = rng.randrange(len(ma_sv))
+        terms.append(ma_sv[start:start + rng.randrange(1, len(ma_sv) - start + 1)])
+    within = index.categories.mask('Khóa', records[0]['Khóa'])
+    for term in terms:
+        expected = scan(records, lambda r: term.lower() in r['Mã SV'].lower())
+        assert index.ids.lookup(term) == expected, term
+        assert list(mask_positions(index.ids.mask(term, within))) == [
+            i for i in expected if records[i]['Khóa'] == records[0]['Khóa']], term
+
+
+@pytest.mark.parametrize('name', ['Khóa', 'Học kỳ', 'Môn học', 'Xếp loại học tập', 'Năm học'])
+def test_category_mask_matches_scan(table, index, records, name):
+    if name not in table.categories:
+        pytest.skip(f'bảng không có cột {name}')
+    for value in table.categories[name] + ['không có']:
+        expected = scan(records, lambda r: r[name] == value)
+        assert list(mask_positions(index.categories.mask(name, value))) == expected, value
+        # Tab dữ liệu lọc Xếp loại/Năm học theo giá trị đã strip
+        expected = scan(records, lambda r: r[name].strip() == value.strip())
+        assert list(mask_positions(index.categories.mask(name, value.strip(), strip=True))) == expected, value
+
+
+@pytest.mark.parametrize('status', list(SCORE_STATUS_FILTERS))
+def test_score_status_mask_matches_scan(index, records, status):
+    rule = SCORE_STATUS_RULES[status]
+    bounds = SCORE_STATUS_FILTERS[status]
+    nrows = len(records)
+    # Tìm kiếm nhanh: điểm trống không qua được bộ lọc
+    expected = scan(records, lambda r: r['Điểm TBTL'] is not None and rule(r['Điểm TBTL']))
+    assert positions(index.number_mask('Điểm TBTL', cache=True, **bounds), nrows) == expected
+    # Tab dữ liệu: điểm trống thì bỏ qua bộ lọc
+    expected = scan(records, lambda r: r['Điểm TBTL'] is None or rule(r['Điểm TBTL']))
+    assert positions(index.number_mask('Điểm TBTL', keep_missing=True, cache=True, **bounds), nrows) == expected
+
+
+@pytest.mark.parametrize('option', list(TC_LAI_FILTERS))
+def test_tc_lai_mask_matches_scan(index, records, option):
+    rule = TC_LAI_RULES[option]
+    expected = scan(records, lambda r: r['Số TC học/thi lại'] is None or rule(r['Số TC học/thi lại']))
+    mask = index.number_mask('Số TC học/thi lại', keep_missing=True, cache=True, **TC_LAI_FILTERS[option])
+    assert positions(mask, len(records)) == expected
+
+
+@pytest.mark.parametrize('name,ranges', [
+    ('Điểm TBTL', [(0.0, 4.0), (2.0, 3.0), (1.99, 2.01), (3.6, 4.0), (2.5, 2.5), (3.0, 2.0)]),
+    ('Tổng số tín chỉ', [(0, 100), (15, 30), (20, 20)]),
+])
+def test_range_mask_matches_scan(index, records, name, ranges):
+    for lo, hi in ranges:
+        expected = scan(records, lambda r: r[name] is None or lo <= r[name] <= hi)
+        assert positions(index.number_mask(name, lo=lo, hi=hi, keep_missing=True), len(records)) == expected
+
+
+def test_filter_plan_matches_scan(table, index, records):
+    """Mọi tổ hợp vài bộ lọc của tab dữ liệu: cùng dòng với chuỗi list comprehension cũ."""
+    khoa = records[0]['Khóa']
+    for status, tc_lai, score_range, search_name, search_ma_sv in product(
+            ['Tất cả', 'Đạt (≥ 2.0)', 'Giỏi (3.2-3.59)'],
+            ['Tất cả', 'Không có TC lại (= 0)'],
+            [None, (2.0, 3.0)],
+            ['', 'thi hoa'],
+            ['', '22F']):
+        plan = FilterPlan(len(table))
+        plan.add('Khóa', index.categories.mask('Khóa', khoa))
+        if score_range:
+            plan.add('Khoảng điểm', index.number_mask('Điểm TBTL', lo=score_range[0], hi=score_range[1],
+                                                      keep_missing=True))
+        if status != 'Tất cả':
+            plan.add('Trạng thái', index.number_mask('Điểm TBTL', keep_missing=True, cache=True,
+                                                     **SCORE_STATUS_FILTERS[status]))
+        if tc_lai != 'Tất cả':
+            plan.add('TC học/thi lại', index.number_mask('Số TC học/thi lại', keep_missing=True, cache=True,
+                                                         **TC_LAI_FILTERS[tc_lai]))
+        if search_name:
+            plan.add_deferred('Tên sinh viên', lambda mask: index.names.contains_mask(search_name, mask))
+        if search_ma_sv:
+            plan.add_deferred('Mã SV', lambda mask: index.ids.mask(search_ma_sv, mask))
+
+        def keep(r):
+            score, tc = r['Điểm TBTL'], r['Số TC học/thi lại']
+            return (r['Khóa'] == khoa
+                    and (not score_range or score is None or score_range[0] <= score <= score_range[1])
+                    and (status == 'Tất cả' or score is None or SCORE_STATUS_RULES[status](score))
+                    and (tc_lai == 'Tất cả' or tc is None or TC_LAI_RULES[tc_lai](tc))
+                    and fold_text(search_name) in fold_text(r['Họ và tên'])
+                    and search_ma_sv.lower() in r['Mã SV'].lower())
+
+        expected = scan(records, keep)
+        assert list(mask_positions(plan.execute())) == expected
+        steps = plan.explain()
+        assert sum(step['Bị loại'] for step in steps) == len(records) - len(expected)
+        assert [step['Còn lại'] for step in steps if not step['Ghi chú']][-1] == len(expected)
+
+
+def test_cube_select_matches_row_scan(index, records):
+    """Thống kê theo Học kỳ/Khóa/Môn học lấy từ cube bằng thống kê duyệt từng dòng."""
+    values = {name: sorted({r[name] for r in records}) for name in GROUP_COLUMNS}
+    selections = [{}] + [{name: value} for name in GROUP_COLUMNS for value in values[name]]
+    selections += [{'Học kỳ': hk, 'Khóa': khoa} for hk, khoa in product(values['Học kỳ'], values['Khóa'])]
+    for groups in selections:
+        rows = [r for r in records if all(r[name] == value for name, value in groups.items())]
+        scores = [r['Điểm TBTL'] for r in rows if r['Điểm TBTL'] is not None
+                  and SCORE_MIN <= r['Điểm TBTL'] <= SCORE_MAX]
+        selection = index.cube.select(groups)
+        assert selection.rows == len(rows), groups
+        assert selection.count == len(scores), groups
+        assert selection.passed == sum(s >= PASS_SCORE for s in scores), groups
+        assert math.isclose(selection.total, sum(scores), rel_tol=1e-9, abs_tol=1e-9), groups
+        if scores:
+            assert (selection.min, selection.max) == (min(scores), max(scores)), groups
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""Kiểm tra direct_processor.run_pipeline trên một bản sao nhỏ của data_diem_dhnn/raw.
+
+Chạy từ thư mục gốc:  python -m pytest -q test_pipeline.py
+"""
+import io
+import os
+import shutil
+import threading
+import time
+import zipfile
+from pathlib import Path
+
+import pytest
+
+import direct_processor
+from columnar_file import load_columnar
+from data_store import iter_rows_typed
+from score_stats import ScoreCube
+from search_index import SearchIndex
+
+ROOT = Path(__file__).resolve().parent
+RAW_PATH = ROOT / 'data_diem_dhnn' / 'raw'
+SAMPLE_FILES = 3
+
+pytestmark = pytest.mark.skipif(not RAW_PATH.exists(), reason='chưa có data_diem_dhnn/raw')
+
+
+@pytest.fixture
+def base_path(tmp_path):
+    """Thư mục dữ liệu tạm với vài file .xls thật (giữ cấu trúc học kỳ/khóa/môn)."""
+    for file_path in direct_processor.discover_files(RAW_PATH)[:SAMPLE_FILES]:
+        target = tmp_path / 'raw' / file_path.relative_to(RAW_PATH)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(file_path, target)
+    return tmp_path
+
+
+def run(base_path, **kwargs):
+    return direct_processor.run_pipeline(base_path, workers=1, log=None, **kwargs)
+
+
+def assert_cube_matches_table(summary):
+    table = load_columnar(summary['columnar'])
+    embedded = ScoreCube.from_dict(table.stats)
+    scanned = ScoreCube.from_table(table)
+    assert list(embedded.cells) == list(scanned.cells)
+    for key, cell in embedded.cells.items():
+        assert cell.agrees_with(scanned.cells[key]), key
+
+
+def test_outputs_agree(base_path):
+    summary = run(base_path)
+    assert summary['success'] == SAMPLE_FILES and summary['failed'] == 0
+    table = load_columnar(summary['columnar'])
+    assert list(table.iter_tuples()) == list(iter_rows_typed(summary['output']))[1:]
+    assert_cube_matches_table(summary)
+
+
+def test_rerun_uses_cache(base_path):
+    run(base_path)
+    summary = run(base_path)
+    assert summary['reparsed'] == 0 and summary['changed'] == 0
+    assert_cube_matches_table(summary)
+
+
+def test_failed_file_is_not_cached(base_path):
+    """File đọc lỗi không được lưu vào cache: lần chạy sau đọc lại nó (và chỉ nó)."""
+    broken = next((base_path / 'raw').rglob('*.xls')).with_name('hỏng.xls')
+    broken.write_bytes(b'khong phai file xls')
+    summary = run(base_path)
+    assert summary['failed'] == 1 and summary['success'] == SAMPLE_FILES
+    cache_dir = base_path / 'processing' / 'cache'
+    assert len(list(cache_dir.glob('*.json'))) == SAMPLE_FILES
+    summary = run(base_path)
+    assert summary['reparsed'] == 1 and summary['failed'] == 1
+
+
+def sample_sources(base_path):
+    return direct_processor.discover_files(base_path / 'raw')
+
+
+def test_deleted_source_drops_its_rows(base_path):
+    summary = run(base_path)
+    removed = sample_sources(base_path)[0]
+    removed_rows = len(direct_processor.process_dhnn_file(removed)[1])
+    content = removed.read_bytes()
+    removed.unlink()
+    after = run(base_path)
+    assert after['removed'] == 1 and after['reparsed'] == 0 and after['changed'] == 0
+    assert after['rows'] == summary['rows'] - removed_rows
+    assert_cube_matches_table(after)
+    # Khôi phục: kết quả đọc vẫn còn trong cache
+    removed.write_bytes(content)
+    restored = run(base_path)
+    assert restored['changed'] == 1 and restored['reparsed'] == 0
+    assert restored['rows'] == summary['rows']
+
+
+def test_new_source_adds_its_rows(base_path):
+    summary = run(base_path)
+    source = direct_processor.discover_files(RAW_PATH)[SAMPLE_FILES]
+    target = base_path / 'raw' / source.relative_to(RAW_PATH)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copy2(source, target)
+    after = run(base_path)
+    assert after['changed'] == 1 and after['reparsed'] == 1
+    assert after['rows'] == summary['rows'] + len(direct_processor.process_dhnn_file(source)[1])
+    assert_cube_matches_table(after)
+
+
+def test_touched_source_hits_hash(base_path):
+    """Chỉ đổi mtime (copy lại, touch): sha256 không đổi nên không đọc lại file."""
+    summary = run(base_path)
+    touched = sample_sources(base_path)[0]
+    os.utime(touched, ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+    after = run(base_path)
+    assert after['changed'] == 0 and after['reparsed'] == 0
+    assert after['rows'] == summary['rows']
+    manifest = direct_processor.load_manifest(base_path / 'processing' / 'manifest.json')
+    key = touched.relative_to(base_path / 'raw').as_posix()
+    assert manifest[key]['mtime_ns'] == touched.stat().st_mtime_ns
+
+
+def test_changed_source_is_reparsed(base_path):
+    summary = run(base_path)
+    changed = sample_sources(base_path)[0]
+    old_rows = len(direct_processor.process_dhnn_file(changed)[1])
+    # Nội dung của một file thật khác, chưa có trong cache
+    replacement = direct_processor.discover_files(RAW_PATH)[SAMPLE_FILES]
+    shutil.copyfile(replacement, changed)
+    new_rows = len(direct_processor.process_dhnn_file(replacement)[1])
+    after = run(base_path)
+    assert after['changed'] == 1 and after['reparsed'] == 1
+    assert after['rows'] == summary['rows'] - old_rows + new_rows
+    assert_cube_matches_table(after)
+
+
+def test_layout_missing_column_is_reported(base_path, monkeypatch):
+    """Sheet thiếu cột Điểm TBTL: summary báo fingerprint của layout, cột thiếu và file."""
+    source = sample_sources(base_path)[0]
+    key = source.relative_to(base_path / 'raw').as_posix()
+    score_idx = direct_processor.MAIN_HEADERS.index('Điểm TBTL')
+    original = direct_processor.process_dhnn_file
+
+    def drop_score_column(file_path):
+        headers, rows = original(file_path)
+        if file_path == source:
+            col = direct_processor.column_mapping(tuple(headers))[0][score_idx]
+            headers = headers[:col] + headers[col + 1:]
+            rows = [row[:col] + row[col + 1:] for row in rows]
+        return headers, rows
+
+    monkeypatch.setattr(direct_processor, 'process_dhnn_file', drop_score_column)
+    summary = run(base_path)
+    headers, _ = drop_score_column(source)
+    assert summary['success'] == SAMPLE_FILES
+    assert summary['unmapped_layouts'] == {
+        direct_processor.layout_fingerprint(headers): (('Điểm TBTL',), [key])}
+
+
+def test_stats_follow_mapping_change(base_path, monkeypatch):
+    """Đổi cách ánh xạ cột mà không đọc lại file: thống kê vẫn theo dữ liệu đã ghi."""
+    run(base_path)
+    score_idx = direct_processor.MAIN_HEADERS.index('Điểm TBTL')
+    original = direct_processor.map_columns
+
+    def blank_scores(*args):
+        for row in original(*args):
+            row[score_idx] = ''
+            yield row
+
+    monkeypatch.setattr(direct_processor, 'map_columns', blank_scores)
+    summary = run(base_path)
+    assert summary['reparsed'] == 0
+    assert_cube_matches_table(summary)
+    table = load_columnar(summary['columnar'])
+    assert SearchIndex(table).cube.total().count == 0
+
+
+def test_stats_follow_group_change(base_path, monkeypatch):
+    """Nhóm của thống kê lấy từ dòng đã ghi, không từ đường dẫn file."""
+    run(base_path)
+    khoa_idx = direct_processor.MAIN_HEADERS.index('Khóa')
+    original = direct_processor.map_columns
+
+    def rename_khoa(*args):
+        for row in original(*args):
+            row[khoa_idx] = 'K' + row[khoa_idx]
+            yield row
+
+    monkeypatch.setattr(direct_processor, 'map_columns', rename_khoa)
+    summary = run(base_path)
+    assert summary['reparsed'] == 0
+    assert_cube_matches_table(summary)
+
+
+def test_stale_embedded_cube_is_ignored(base_path):
+    summary = run(base_path)
+    table = load_columnar(summary['columnar'])
+    for item in table.stats:
+        item[-1]['count'] = item[-1]['rows']
+        item[-1]['total'] = 3.0 * item[-1]['rows']
+    cube = SearchIndex(table).cube
+    scanned = ScoreCube.from_table(table)
+    assert cube.total().agrees_with(scanned.total())
+
+
+def test_embedded_cube_with_wrong_groups_is_ignored(base_path):
+    """Tổng khớp nhưng số dòng theo Môn học lệch: không dùng cube lưu sẵn."""
+    summary = run(base_path)
+    table = load_columnar(summary['columnar'])
+    table.stats[0][2] += ' (cũ)'
+    cube = SearchIndex(table).cube
+    scanned = ScoreCube.from_table(table)
+    assert cube.counts('Môn học') == scanned.counts('Môn học')
+
+
+def test_app_keeps_reading_columnar_file_during_close(base_path, monkeypatch):
+    """Ngay sau mỗi lần thay file đầu ra, app vẫn chọn .cols chứ không phải xlsx."""
+    from app import DataProcessor
+
+    processor = DataProcessor(base_path)
+    outputs = {processor.excel_path, processor.columnar_path}
+    chosen = []
+    replace = os.replace
+
+    def recording_replace(src, dst):
+        replace(src, dst)
+        if Path(dst) in outputs:
+            chosen.append((Path(dst).suffix, processor.data_path().suffix))
+
+    monkeypatch.setattr(os, 'replace', recording_replace)
+    run(base_path)
+    run(base_path)
+    assert chosen == [('.cols', '.cols'), ('.xlsx', '.cols')] * 2
+
+
+def test_parallel_output_identical(base_path):
+    """workers > 1 ghi đúng các byte như workers = 1 (xlsx: trừ thời điểm tạo file)."""
+    summary = run(base_path)
+    serial = {path: Path(summary[path]).read_bytes() for path in ('output', 'columnar')}
+    summary = direct_processor.run_pipeline(base_path, workers=2, full=True, log=None)
+    assert summary['reparsed'] == SAMPLE_FILES
+    assert Path(summary['columnar']).read_bytes() == serial['columnar']
+    with zipfile.ZipFile(io.BytesIO(serial['output'])) as expected, \
+            zipfile.ZipFile(summary['output']) as actual:
+        assert actual.namelist() == expected.namelist()
+        for name in expected.namelist():
+            if name != 'docProps/core.xml':
+                assert actual.read(name) == expected.read(name), name
+
+
+def test_parse_files_bounds_pending_files():
+    """Không lấy hết các file để gửi cho process con ngay từ đầu: tối đa workers * 2 file chưa trả về."""
+    taken = []
+
+    class Files(list):
+        def __iter__(self):
+            for file_path in super().__iter__():
+                taken.append(file_path)
+                yield file_path
+
+    files = Files(direct_processor.discover_files(RAW_PATH)[:12])
+    results = []
+    for file_path, result in direct_processor.parse_files(files, workers=2):
+        assert len(taken) - len(results) <= 4
+        results.append((file_path, result))
+    assert results == [(f, direct_processor.process_dhnn_file(f)) for f in files]
+
+
+def test_concurrent_runs(base_path):
+    """Nhiều thread cùng gọi run_pipeline (như nhiều session bấm nút): không lỗi, output đúng."""
+    errors = []
+
+    def worker():
+        try:
+            run(base_path)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert not list(base_path.rglob('*.tmp'))
+    assert_cube_matches_table(run(base_path))
+
+
+def test_unlocked_writers_use_separate_temp_files(base_path):
+    """Hai process cùng ghi (mô phỏng bằng thread bỏ qua khóa): file tạm không đè lên nhau."""
+    errors = []
+
+    def worker():
+        try:
+            direct_processor._run_pipeline(base_path, 1, False, direct_processor.DEFAULT_CACHE_SIZE_MB, None)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert not list(base_path.rglob('*.tmp'))
+
+
+def test_busy_without_wait(base_path):
+    with direct_processor._pipeline_lock:
+        with pytest.raises(direct_processor.PipelineBusyError):
+            run(base_path, wait=False)
+
+
+def test_evict_removes_orphaned_temp_files(tmp_path):
+    """File tạm sót lại từ lần ghi bị ngắt bị dọn; file tạm mới (có thể đang ghi) được giữ."""
+    old = tmp_path / 'abc.p1.json.x1y2.tmp'
+    fresh = tmp_path / 'def.p1.json.z3w4.tmp'
+    entry = tmp_path / 'abc.p1.json'
+    for path in (old, fresh, entry):
+        path.write_text('{}', encoding='utf-8')
+    stale = time.time() - direct_processor.ORPHAN_TMP_SECONDS - 60
+    os.utime(old, (stale, stale))
+    assert direct_processor.evict_result_cache(tmp_path, 1 << 20) == 1
+    assert sorted(p.name for p in tmp_path.iterdir()) == [entry.name, fresh.name]
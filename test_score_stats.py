@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""ScoreAccumulator.add_many và from_sorted cho cùng thống kê như gọi add từng điểm.
+
+Điểm sinh ngẫu nhiên, gồm ô trống (NaN), điểm ngoài [0, 4] và điểm rơi đúng các
+ngưỡng xếp loại / cận histogram.
+
+Chạy từ thư mục gốc:  python -m pytest -q test_score_stats.py
+"""
+import math
+import random
+
+import pytest
+
+from score_stats import HISTOGRAM_BINS, SCORE_MAX, SCORE_MIN, THRESHOLDS, ScoreAccumulator
+
+EDGES = sorted({SCORE_MIN, SCORE_MAX, *THRESHOLDS,
+                *(SCORE_MIN + i * (SCORE_MAX - SCORE_MIN) / HISTOGRAM_BINS for i in range(HISTOGRAM_BINS))})
+
+
+def random_scores(rng, n):
+    scores = []
+    for _ in range(n):
+        kind = rng.random()
+        if kind < 0.1:
+            scores.append(math.nan)
+        elif kind < 0.2:
+            scores.append(rng.choice([-1.0, -0.01, 4.01, 10.0, math.inf, -math.inf]))
+        elif kind < 0.4:
+            scores.append(rng.choice(EDGES))
+        else:
+            scores.append(round(rng.uniform(SCORE_MIN, SCORE_MAX), rng.choice([1, 2, 6])))
+    return scores
+
+
+def one_by_one(scores, acc=None):
+    acc = acc or ScoreAccumulator()
+    for score in scores:
+        acc.add(score)
+    return acc
+
+
+def state(acc):
+    return {name: getattr(acc, name) for name in ScoreAccumulator.__slots__}
+
+
+@pytest.mark.parametrize('seed', range(30))
+def test_add_many_matches_add(seed):
+    rng = random.Random(seed)
+    scores = random_scores(rng, rng.choice([0, 1, 5, 200]))
+    assert state(ScoreAccumulator().add_many(scores)) == state(one_by_one(scores))
+    # Cộng dồn vào một bộ đã có dữ liệu
+    head, tail = scores[:len(scores) // 3], scores[len(scores) // 3:]
+    assert state(one_by_one(head).add_many(tail)) == state(one_by_one(scores))
+
+
+@pytest.mark.parametrize('seed', range(30))
+def test_from_sorted_matches_add(seed):
+    rng = random.Random(seed)
+    scores = random_scores(rng, rng.choice([0, 1, 5, 200]))
+    # Như list đã sắp xếp của NumberIndex: bỏ ô trống, giữ điểm ngoài khoảng
+    values = sorted(s for s in scores if s == s)
+    acc = ScoreAccumulator.from_sorted(values, len(scores))
+    expected = one_by_one(scores)
+    assert acc.agrees_with(expected)
+    assert (acc.count, acc.thresholds, acc.histogram) == (expected.count, expected.thresholds, expected.histogram)
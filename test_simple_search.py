@@ -1 +1,55 @@
- 
\ No newline at end of file
+#!/usr/bin/env python3
+"""Kiểm tra các bộ lọc đơn giản: mask, dãy chỉ số theo mask cho phân trang.
+
+Chạy từ thư mục gốc:  python -m pytest -q test_simple_search.py
+"""
+import math
+import random
+from array import array
+
+import pytest
+
+from data_store import MaskRows, mask_from_positions, mask_positions
+from search_index import NumberIndex
+
+
+def random_mask(nrows, density, seed=0):
+    rng = random.Random(seed)
+    return mask_from_positions([i for i in range(nrows) if rng.random() < density], nrows)
+
+
+@pytest.mark.parametrize('nrows,density', [(0, 0.5), (1, 1.0), (10000, 0.0), (10000, 0.01), (30000, 0.5), (9000, 1.0)])
+def test_mask_rows_matches_positions(nrows, density, monkeypatch):
+    monkeypatch.setattr(MaskRows, 'BLOCK_ROWS', 1000)
+    mask = random_mask(nrows, density)
+    expected = list(mask_positions(mask))
+    rows = MaskRows(mask)
+    assert len(rows) == len(expected)
+    assert list(rows) == expected
+    for start in (0, 1, 999, 1000, 4321, len(expected) - 1, len(expected) + 5):
+        for size in (1, 20, 100):
+            assert rows[start:start + size] == expected[start:start + size]
+    assert rows[::7] == expected[::7]
+    assert rows[-3:] == expected[-3:]
+    if expected:
+        assert rows[0] == expected[0] and rows[-1] == expected[-1]
+        assert rows[len(expected) // 2] == expected[len(expected) // 2]
+    with pytest.raises(IndexError):
+        rows[len(expected)]
+
+
+def test_mask_positions_from_start():
+    mask = random_mask(5000, 0.2)
+    assert list(mask_positions(mask, 1234)) == [i for i in mask_positions(mask) if i >= 1234]
+
+
+def test_number_index_caches_only_fixed_bands():
+    values = [3.5, math.nan, 1.0, 2.0, 2.5, 4.0]
+    index = NumberIndex(array('d', values))
+    for lo in (2.0, 2.1, 2.6, 3.9):
+        assert list(mask_positions(index.mask(lo=lo))) == [i for i, v in enumerate(values) if v >= lo]
+    assert not index._cache
+
+    band = index.mask(lo=2.0, cache=True)
+    assert index.mask(lo=2.0, cache=True) is band
+    assert len(index._cache) == 1
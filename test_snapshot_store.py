@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Kiểm tra SnapshotStore: nhiều session vào cùng lúc chỉ dựng một lần.
+
+Chạy từ thư mục gốc:  python -m pytest -q test_snapshot_store.py
+"""
+import threading
+import time
+
+from snapshot_store import SnapshotStore
+
+BUILD_SECONDS = 0.3
+SESSIONS = 10
+
+
+class FakeData:
+    """Dữ liệu giả: dựng mất BUILD_SECONDS giây và đếm số lần dựng."""
+
+    def __init__(self, signature='v1', fail=False):
+        self.signature = signature
+        self.fail = fail
+        self.builds = 0
+        self._lock = threading.Lock()
+
+    def signature_fn(self):
+        return self.signature
+
+    def build_fn(self, signature):
+        with self._lock:
+            self.builds += 1
+        time.sleep(BUILD_SECONDS)
+        if self.fail:
+            return None, None, 'lỗi đọc dữ liệu'
+        return [signature], object(), None
+
+
+def run_concurrently(fn, count=SESSIONS):
+    results = [None] * count
+    barrier = threading.Barrier(count)
+
+    def worker(i):
+        barrier.wait()
+        results[i] = fn()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, time.perf_counter() - started
+
+
+def test_cold_start_builds_once():
+    fake = FakeData()
+    store = SnapshotStore(fake.signature_fn, fake.build_fn)
+    results, elapsed = run_concurrently(store.get)
+    assert fake.builds == 1
+    assert all(r is results[0] for r in results)
+    assert results[0].data == ['v1']
+    assert elapsed < BUILD_SECONDS * 3
+
+
+def test_failed_cold_start_builds_once():
+    fake = FakeData(fail=True)
+    store = SnapshotStore(fake.signature_fn, fake.build_fn)
+    results, _ = run_concurrently(store.get)
+    assert fake.builds == 1
+    assert all(r.error and r.data is None for r in results)
+
+
+def test_changed_data_builds_once_in_background():
+    fake = FakeData()
+    store = SnapshotStore(fake.signature_fn, fake.build_fn)
+    old = store.get()
+    fake.signature = 'v2'
+    results, elapsed = run_concurrently(store.get)
+    # Trong lúc dựng bản mới, mọi session vẫn được phục vụ ngay bằng bản cũ
+    assert all(r is old for r in results)
+    assert elapsed < BUILD_SECONDS
+    while store.building:
+        time.sleep(0.01)
+    assert fake.builds == 2
+    assert store.get().data == ['v2']
+
+
+def test_reload_rebuilds_same_signature():
+    fake = FakeData()
+    store = SnapshotStore(fake.signature_fn, fake.build_fn)
+    first = store.get()
+    second = store.reload()
+    assert fake.builds == 2
+    assert second is not first and second.signature == first.signature
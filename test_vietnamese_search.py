@@ -1 +1,94 @@
- 
\ No newline at end of file
+#!/usr/bin/env python3
+"""Kiểm tra tìm kiếm họ tên tiếng Việt: bỏ dấu, xếp hạng và lấy top-k theo trang.
+
+Chạy từ thư mục gốc:  python -m pytest -q test_vietnamese_search.py
+"""
+import random
+
+import pytest
+
+import search_index
+from data_store import mask_from_positions
+from search_index import NameIndex, fold_text, match_score
+
+SURNAMES = ['Nguyễn', 'Trần', 'Lê', 'Phạm', 'Hoàng', 'Võ', 'Đặng', 'Ngô', 'An']
+MIDDLES = ['Thị', 'Văn', 'Ngọc', 'Minh', 'Thị Thanh', 'Hữu', '', 'An']
+GIVENS = ['An', 'Anh', 'Hoa', 'Hòa', 'Lan', 'Nhi', 'Trâm', 'Quyên', 'Thị', 'Nguyễn']
+
+QUERIES = ['a', 'an', 'AN', 'thi', 'Thị', 'nguyen', 'Nguyễn Thị', 'thi an', 'ngoc lan',
+           'van', 'h', 'hoa', 'Hòa', 'nguyen thi thanh', 'xyz', 'an an', '  Lê   Văn ', 'i']
+
+
+def make_names(count, seed=7):
+    rng = random.Random(seed)
+    names = [' '.join(filter(None, [rng.choice(SURNAMES), rng.choice(MIDDLES), rng.choice(GIVENS)]))
+             for _ in range(count)]
+    return names + ['An', 'an', 'Nguyễn', '', 'Thị An Thị', 'An An An', 'Anh Thị Thanh Thị Thanh Ánh',
+                    'Nguyễn Thị Thanh Nguyễn Thị Thanh Nhi', 'Lê Thị Hoa Thị Lan']
+
+
+def linear_rank(folded, query):
+    """Cách xếp hạng gốc: chấm điểm mọi dòng, sort ổn định theo điểm giảm dần."""
+    query_folded = fold_text(query)
+    scored = [(i, match_score(name, query_folded)) for i, name in enumerate(folded)]
+    return [i for i, s in sorted(scored, key=lambda x: x[1], reverse=True) if s > 0]
+
+
+@pytest.fixture(scope='module')
+def index():
+    return NameIndex(make_names(3000))
+
+
+@pytest.fixture(scope='module')
+def masks(index):
+    rng = random.Random(3)
+    nrows = len(index.folded)
+    return [None, bytes(mask_from_positions(rng.sample(range(nrows), nrows // 3), nrows))]
+
+
+def test_fold_text():
+    assert fold_text('  Nguyễn   Thị  HÒA ') == 'nguyen thi hoa'
+    assert fold_text('Đặng') == 'đang'
+
+
+@pytest.mark.parametrize('query', QUERIES)
+def test_rank_matches_linear_scan(index, query):
+    assert index.rank(query) == linear_rank(index.folded, query)
+
+
+# 0: luôn duyệt theo nhóm độ dài; 10**9: luôn chấm điểm mọi dòng khớp
+@pytest.mark.parametrize('scan_min', [0, 10 ** 9, search_index.RANK_SCAN_MIN_CANDIDATES])
+@pytest.mark.parametrize('query', QUERIES)
+def test_top_k_is_prefix_of_full_rank(index, masks, monkeypatch, scan_min, query):
+    monkeypatch.setattr(search_index, 'RANK_SCAN_MIN_CANDIDATES', scan_min)
+    for mask in masks:
+        full = index.rank(query, mask)
+        for limit in (1, 20, 137, len(full) + 5):
+            assert index.rank(query, mask, limit=limit) == full[:limit]
+        assert index.matches(query, mask) == sorted(full)
+
+
+# 0: luôn đếm bằng bitset posting list (query một hai từ); 10**9: luôn đếm trên các nhóm độ dài
+@pytest.mark.parametrize('scan_max', [0, 10 ** 9])
+@pytest.mark.parametrize('query', QUERIES + [
+    'thanh', 'anh', 'thi thanh', 'h thi', 'nguyen t', 'an a', 'le thi lan', 'thi hoa thi', 'an an an',
+    'en thi thanh ng', 'thi thanh nhi'])
+def test_count_matches_linear_scan(index, masks, monkeypatch, scan_max, query):
+    monkeypatch.setattr(search_index, 'COUNT_SCAN_MAX_ROWS', scan_max)
+    for mask in masks:
+        expected = linear_rank(index.folded, query) if mask is None else index.matches(query, mask)
+        assert index.count(query, mask) == len(expected)
+
+
+@pytest.mark.parametrize('query', ['thi', 'an', 'nguyen thi'])
+def test_ranked_rows_pages(index, masks, query):
+    for mask in masks:
+        full = index.rank(query, mask)
+        ranked = index.ranked(query, mask)
+        assert len(ranked) == len(full)
+        assert ranked._rows is None
+        assert list(ranked.rows) == sorted(full)
+        for start in (40, 0, 20, len(full) - 3):
+            assert ranked[start:start + 20] == full[start:start + 20]
+        assert ranked[-1] == full[-1]
+        assert list(ranked) == full